@@ -0,0 +1,722 @@
+"""
+Stand-in ComfyUI and Ollama servers for offline benchmarks
+
+Both servers are plain http.server instances on localhost with tunable
+latency, jitter, streaming and failure rates. FakeComfyUI runs queued
+prompts one at a time on a simulated GPU and pushes the same WebSocket
+events a real server sends; FakeOllama streams NDJSON like /api/generate.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import zlib
+import base64
+import random
+import struct
+import hashlib
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def make_png(width, height, seed=0, palette=None, smooth=0):
+    """
+    Build a valid RGB PNG of noise, so its size is close to an uncompressed image
+
+    Args:
+        palette (tuple): RGB multipliers applied to one grey noise value per pixel (default: colour noise)
+        smooth (int): Interpolate the noise from a grid with cells this many pixels wide (0: per-pixel noise)
+    """
+    rng = random.Random(seed)
+    if palette is None:
+        raw = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+    else:
+        cell = smooth or 1
+        grid = [[rng.random() * 255 for _ in range(width // cell + 2)] for _ in range(height // cell + 2)]
+        rows = []
+        for y in range(height):
+            gy, fy = divmod(y / cell, 1)
+            top, bottom = grid[int(gy)], grid[int(gy) + 1]
+            row = bytearray(b"\x00")
+            for x in range(width):
+                gx, fx = divmod(x / cell, 1)
+                gx = int(gx)
+                value = ((top[gx] * (1 - fx) + top[gx + 1] * fx) * (1 - fy)
+                         + (bottom[gx] * (1 - fx) + bottom[gx + 1] * fx) * fy)
+                row += bytes(min(255, int(value * channel)) for channel in palette)
+            rows.append(bytes(row))
+        raw = b"".join(rows)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+
+class _WebSocket:
+    """Server side of one RFC 6455 connection: unmasked text frames out, control frames in."""
+
+    def __init__(self, sock, rfile):
+        self.sock = sock
+        self.rfile = rfile
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def send_frame(self, opcode, payload):
+        header = bytes([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header += bytes([length])
+        elif length < 1 << 16:
+            header += bytes([126]) + struct.pack(">H", length)
+        else:
+            header += bytes([127]) + struct.pack(">Q", length)
+        with self._lock:
+            if self.closed:
+                return
+            try:
+                self.sock.sendall(header + payload)
+            except OSError:
+                self.closed = True
+
+    def send_json(self, message):
+        self.send_frame(0x1, json.dumps(message).encode("utf-8"))
+
+    def serve(self):
+        """Read client frames until the connection closes, answering pings and close."""
+        try:
+            while not self.closed:
+                head = self.rfile.read(2)
+                if len(head) < 2:
+                    break
+                opcode = head[0] & 0x0F
+                length = head[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack(">H", self.rfile.read(2))[0]
+                elif length == 127:
+                    length = struct.unpack(">Q", self.rfile.read(8))[0]
+                mask = self.rfile.read(4) if head[1] & 0x80 else b"\x00" * 4
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self.rfile.read(length)))
+                if opcode == 0x8:
+                    self.send_frame(0x8, payload[:2])
+                    break
+                if opcode == 0x9:
+                    self.send_frame(0xA, payload)
+        except (OSError, struct.error):
+            pass
+        self.closed = True
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections at shutdown are expected
+        pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_body(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.fake.handle_get(self, url.path, {k: v[0] for k, v in parse_qs(url.query).items()})
+
+    def do_POST(self):
+        self.fake.handle_post(self, urlparse(self.path).path)
+
+
+class _FakeServer:
+    """Common start/stop plumbing and latency sampling."""
+
+    def __init__(self, host="127.0.0.1", port=0, jitter=0.1, seed=None):
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self, seconds):
+        """Sleep for `seconds` give or take the configured relative jitter."""
+        if seconds <= 0:
+            return 0.0
+        with self._rng_lock:
+            seconds *= 1 + self.rng.uniform(-self.jitter, self.jitter)
+        time.sleep(seconds)
+        return seconds
+
+    def chance(self, rate):
+        with self._rng_lock:
+            return rate > 0 and self.rng.random() < rate
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle_get(self, handler, path, query):
+        handler.send_body(404, {"error": "not found"})
+
+    def handle_post(self, handler, path):
+        handler.send_body(404, {"error": "not found"})
+
+
+# (palette, smooth) of the images served with image_variants: flame-coloured, smoke-grey,
+# blue (no fire colours) and blurred flame-coloured, so a quality gate passes about half
+IMAGE_VARIANTS = [((1.0, 0.55, 0.2), 0), ((0.85, 0.85, 0.85), 0), ((0.3, 0.5, 1.0), 0), ((1.0, 0.55, 0.2), 64)]
+
+
+class FakeComfyUI(_FakeServer):
+    """
+    ComfyUI stand-in: /prompt, /history, /view, /queue, /interrupt, /system_stats and /ws
+
+    Prompts run one at a time on a simulated GPU. Each node takes the time
+    configured for its class_type (KSampler and VAEDecode scale with the
+    latent batch size and area, KSampler also with steps and denoise); a
+    node whose inputs match the previous prompt's is reported as cached,
+    like ComfyUI's own node cache, and a changed checkpoint costs `load_time`.
+
+    Args:
+        sample_time (float): KSampler seconds per 512x512 image at `reference_steps` steps
+        reference_steps (int): Step count sample_time was measured at
+        decode_time (float): VAEDecode seconds per 512x512 image
+        encode_time (float): CLIPTextEncode seconds
+        load_time (float): Seconds to load a checkpoint other than the current one
+        save_time (float): SaveImage seconds per image
+        view_latency (float): Extra seconds before /view starts sending an image
+        image_size (int): Width and height of the served PNG
+        progress (bool): Send KSampler `progress` events (one per step)
+        submit_failure_rate (float): Share of /prompt calls answered with HTTP 500
+        execution_failure_rate (float): Share of prompts that end in `execution_error`
+        image_variants (bool): Serve IMAGE_VARIANTS instead of one noise image, picked from the
+            KSampler seed and batch index so a refined image looks like its draft
+        hang_rate (float): Share of prompts whose KSampler stalls (until /interrupt or `hang_time`)
+        hang_time (float): Seconds a stalled KSampler takes before it carries on
+        output_dir (str): Also write saved images into this directory, and previews into the
+            "temp" directory next to it, like a ComfyUI on the same machine
+        jitter (float): Relative +/- jitter applied to every delay
+    """
+
+    def __init__(self, sample_time=1.0, decode_time=0.1, encode_time=0.02, load_time=3.0, save_time=0.02,
+                 view_latency=0.0, image_size=256, progress=True, submit_failure_rate=0.0,
+                 execution_failure_rate=0.0, hang_rate=0.0, hang_time=600.0, reference_steps=30,
+                 image_variants=False, output_dir=None, **kwargs):
+        super().__init__(**kwargs)
+        self.sample_time = sample_time
+        self.reference_steps = reference_steps
+        self.decode_time = decode_time
+        self.encode_time = encode_time
+        self.load_time = load_time
+        self.save_time = save_time
+        self.view_latency = view_latency
+        self.progress = progress
+        self.submit_failure_rate = submit_failure_rate
+        self.execution_failure_rate = execution_failure_rate
+        self.hang_rate = hang_rate
+        self.hang_time = hang_time
+        self._interrupt = threading.Event()
+        self.png = make_png(image_size, image_size)
+        self.variants = [make_png(image_size, image_size, n, palette, smooth)
+                         for n, (palette, smooth) in enumerate(IMAGE_VARIANTS)] if image_variants else []
+        self.file_variants = {}
+        self.output_dir = output_dir
+        self.temp_dir = os.path.join(os.path.dirname(os.path.abspath(output_dir)), "temp") if output_dir else None
+
+        self.clients = {}
+        self.queue = deque()
+        self.running = None
+        self.history = {}
+        self.files = set()
+        self.counter = 0
+        self.number = 0
+        self.loaded_model = None
+        self.previous = {}
+        self._cond = threading.Condition()
+
+        # Measurements read by the benchmark runner
+        self.jobs = []
+        self.busy = []
+        self.view_times = []
+        # (filename, type) of every image served by /view
+        self.viewed = []
+        self.first_view = None
+        self.first_output = None
+        self.swaps = 0
+        self.submit_failures = 0
+        self.execution_failures = 0
+        self.hangs = 0
+        self.interrupts = 0
+        self.deleted = 0
+
+        self._gpu = threading.Thread(target=self._run_gpu, name="fake-gpu", daemon=True)
+        self._gpu.start()
+
+    # HTTP endpoints
+
+    def handle_get(self, handler, path, query):
+        if path == "/ws":
+            return self._accept_ws(handler, query.get("clientId") or str(uuid.uuid4()))
+        if path == "/queue":
+            with self._cond:
+                running = [self._queue_item(self.running)] if self.running else []
+                pending = [self._queue_item(item) for item in self.queue]
+            return handler.send_body(200, {"queue_running": running, "queue_pending": pending})
+        if path.startswith("/history"):
+            prompt_id = path[len("/history/"):] if path.startswith("/history/") else None
+            with self._cond:
+                if prompt_id:
+                    body = {prompt_id: self.history[prompt_id]} if prompt_id in self.history else {}
+                else:
+                    body = dict(self.history)
+            return handler.send_body(200, body)
+        if path == "/system_stats":
+            return handler.send_body(200, {"system": {"comfyui_version": "fake"}, "devices": []})
+        if path == "/view":
+            started = time.time()
+            if query.get("filename") not in self.files:
+                return handler.send_body(404, {"error": "file not found"})
+            self.delay(self.view_latency)
+            variant = self.file_variants.get(query["filename"])
+            handler.send_body(200, self.png if variant is None else self.variants[variant], "image/png")
+            self.view_times.append(time.time() - started)
+            self.viewed.append((query["filename"], query.get("type", "output")))
+            self.first_view = self.first_view or time.time()
+            return
+        super().handle_get(handler, path, query)
+
+    def handle_post(self, handler, path):
+        if path == "/queue":
+            delete = set(handler.read_json().get("delete", []))
+            with self._cond:
+                before = len(self.queue)
+                self.queue = deque(item for item in self.queue if item["prompt_id"] not in delete)
+                self.deleted += before - len(self.queue)
+            return handler.send_body(200, {})
+        if path == "/interrupt":
+            target = handler.read_json().get("prompt_id")
+            with self._cond:
+                if self.running and target in (None, self.running["prompt_id"]):
+                    self._interrupt.set()
+            return handler.send_body(200, {})
+        if path != "/prompt":
+            return super().handle_post(handler, path)
+        body = handler.read_json()
+        workflow = body.get("prompt")
+        if not isinstance(workflow, dict) or not workflow:
+            return handler.send_body(400, {"error": "no prompt", "node_errors": {}})
+        if self.chance(self.submit_failure_rate):
+            self.submit_failures += 1
+            return handler.send_body(500, {"error": "simulated submit failure"})
+
+        prompt_id = str(uuid.uuid4())
+        with self._cond:
+            self.number += 1
+            item = {"prompt_id": prompt_id, "number": self.number, "workflow": workflow,
+                    "client_id": body.get("client_id"), "submitted": time.time()}
+            self.queue.append(item)
+            self._cond.notify()
+        self._broadcast_status()
+        handler.send_body(200, {"prompt_id": prompt_id, "number": item["number"], "node_errors": {}})
+
+    def _queue_item(self, item):
+        return [item["number"], item["prompt_id"], item["workflow"], {"client_id": item["client_id"]}, []]
+
+    def _accept_ws(self, handler, client_id):
+        key = handler.headers.get("Sec-WebSocket-Key")
+        if not key or "websocket" not in (handler.headers.get("Upgrade") or "").lower():
+            return handler.send_body(400, {"error": "expected a WebSocket upgrade"})
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+        handler.send_response(101, "Switching Protocols")
+        handler.send_header("Upgrade", "websocket")
+        handler.send_header("Connection", "Upgrade")
+        handler.send_header("Sec-WebSocket-Accept", accept)
+        handler.end_headers()
+        handler.wfile.flush()
+
+        ws = _WebSocket(handler.connection, handler.rfile)
+        self.clients[client_id] = ws
+        ws.send_json({"type": "status", "data": {"status": {"exec_info": {"queue_remaining": len(self.queue)}},
+                                                 "sid": client_id}})
+        ws.serve()
+        if self.clients.get(client_id) is ws:
+            del self.clients[client_id]
+        handler.close_connection = True
+
+    def _send(self, client_id, event_type, data):
+        ws = self.clients.get(client_id)
+        if ws is not None:
+            ws.send_json({"type": event_type, "data": data})
+
+    def _broadcast_status(self):
+        with self._cond:
+            remaining = len(self.queue) + (1 if self.running else 0)
+        for ws in list(self.clients.values()):
+            ws.send_json({"type": "status", "data": {"status": {"exec_info": {"queue_remaining": remaining}}}})
+
+    # Simulated GPU
+
+    def _run_gpu(self):
+        while True:
+            with self._cond:
+                while not self.queue:
+                    self._cond.wait()
+                self.running = self.queue.popleft()
+            item = self.running
+            started = time.time()
+            ok = self._execute(item)
+            finished = time.time()
+            with self._cond:
+                self.running = None
+                self.busy.append((started, finished))
+                self.jobs.append({"prompt_id": item["prompt_id"], "submitted": item["submitted"],
+                                  "started": started, "finished": finished, "ok": ok})
+            self._broadcast_status()
+
+    @staticmethod
+    def _links(workflow, node):
+        return [str(value[0]) for value in node.get("inputs", {}).values()
+                if isinstance(value, list) and len(value) == 2 and str(value[0]) in workflow]
+
+    def _topological_order(self, workflow):
+        order, done = [], set()
+
+        def visit(node_id):
+            if node_id in done:
+                return
+            done.add(node_id)
+            for upstream in self._links(workflow, workflow[node_id]):
+                visit(upstream)
+            order.append(node_id)
+
+        for node_id in sorted(workflow, key=lambda n: (len(n), n)):
+            visit(node_id)
+        return order
+
+    def _batch_size(self, workflow, node):
+        """Latent batch size feeding a node."""
+        return self._latent_info(workflow, node)["batch"]
+
+    def _area_scale(self, workflow, node):
+        """Pixel count of the latent feeding a node, relative to 512x512."""
+        info = self._latent_info(workflow, node)
+        return info["width"] * info["height"] / (512 * 512)
+
+    def _latent_info(self, workflow, node):
+        """
+        Size, batch and seed of the latent feeding a node
+
+        Follows latent links upstream: the nearest LatentUpscale sets the size,
+        the nearest LatentFromBatch the batch, the nearest KSampler the seed,
+        and EmptyLatentImage fills in whatever is still unknown.
+        """
+        info = {}
+        seen = set()
+        while node is not None and id(node) not in seen:
+            seen.add(id(node))
+            class_type = node.get("class_type")
+            inputs = node.get("inputs", {})
+            if class_type == "KSampler":
+                info.setdefault("seed", inputs.get("seed", 0))
+            elif class_type == "LatentUpscale":
+                info.setdefault("width", int(inputs.get("width", 512)))
+                info.setdefault("height", int(inputs.get("height", 512)))
+            elif class_type == "LatentFromBatch":
+                info.setdefault("batch", int(inputs.get("length", 1)))
+                info.setdefault("batch_index", int(inputs.get("batch_index", 0)))
+            elif class_type == "EmptyLatentImage":
+                info.setdefault("width", int(inputs.get("width", 512)))
+                info.setdefault("height", int(inputs.get("height", 512)))
+                info.setdefault("batch", int(inputs.get("batch_size", 1)))
+                break
+            upstream = None
+            for value in inputs.values():
+                if isinstance(value, list) and len(value) == 2 and str(value[0]) in workflow:
+                    candidate = workflow[str(value[0])]
+                    if candidate.get("class_type") in ("EmptyLatentImage", "KSampler", "VAEDecode", "LatentUpscale",
+                                                       "LatentFromBatch", "VAEEncode"):
+                        upstream = candidate
+                        break
+            node = upstream
+        return dict({"width": 512, "height": 512, "batch": 1, "batch_index": 0, "seed": 0}, **info)
+
+    def _execute(self, item):
+        prompt_id, client_id, workflow = item["prompt_id"], item["client_id"], item["workflow"]
+        self._send(client_id, "execution_start", {"prompt_id": prompt_id, "timestamp": int(time.time() * 1000)})
+
+        order = self._topological_order(workflow)
+        # Like ComfyUI, a node is reused only if it and everything upstream of it is unchanged
+        cached = []
+        for node_id in order:
+            node = workflow[node_id]
+            if (node.get("class_type") not in ("SaveImage", "PreviewImage") and self.previous.get(node_id) == node
+                    and all(upstream in cached for upstream in self._links(workflow, node))):
+                cached.append(node_id)
+        if cached:
+            self._send(client_id, "execution_cached", {"nodes": cached, "prompt_id": prompt_id})
+        self._interrupt.clear()
+        hang_at = None
+        if self.chance(self.hang_rate):
+            hang_at = next((node_id for node_id in order if workflow[node_id].get("class_type") == "KSampler"), None)
+        fail_at = None
+        if self.chance(self.execution_failure_rate):
+            samplers = [node_id for node_id in order if workflow[node_id].get("class_type") == "KSampler"]
+            fail_at = samplers[0] if samplers else order[-1]
+
+        outputs = {}
+        for node_id in order:
+            if node_id in cached:
+                continue
+            node = workflow[node_id]
+            class_type = node.get("class_type")
+            self._send(client_id, "executing", {"node": node_id, "display_node": node_id, "prompt_id": prompt_id})
+            if node_id == fail_at:
+                self.delay(self.sample_time / 2)
+                self.execution_failures += 1
+                self._send(client_id, "execution_error", {
+                    "prompt_id": prompt_id, "node_id": node_id, "node_type": class_type,
+                    "exception_message": "Simulated execution failure", "exception_type": "RuntimeError"})
+                with self._cond:
+                    self.history[prompt_id] = {"prompt": [item["number"], prompt_id, workflow, {}, []],
+                                               "outputs": {}, "status": {"status_str": "error", "completed": False,
+                                                                         "messages": []}}
+                self.previous = {}
+                return False
+            if node_id == hang_at:
+                self.hangs += 1
+                if self._interrupt.wait(self.hang_time):
+                    self.interrupts += 1
+                    self._send(client_id, "execution_interrupted", {
+                        "prompt_id": prompt_id, "node_id": node_id, "node_type": class_type, "executed": []})
+                    with self._cond:
+                        self.history[prompt_id] = {"prompt": [item["number"], prompt_id, workflow, {}, []],
+                                                   "outputs": {}, "status": {"status_str": "error",
+                                                                             "completed": False, "messages": []}}
+                    self.previous = {}
+                    return False
+            self._run_node(prompt_id, client_id, workflow, node_id, node, outputs)
+
+        self.previous = workflow
+        with self._cond:
+            self.history[prompt_id] = {"prompt": [item["number"], prompt_id, workflow, {}, list(outputs)],
+                                       "outputs": outputs,
+                                       "status": {"status_str": "success", "completed": True, "messages": []}}
+        self._send(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+        self._send(client_id, "execution_success", {"prompt_id": prompt_id, "timestamp": int(time.time() * 1000)})
+        return True
+
+    def _run_node(self, prompt_id, client_id, workflow, node_id, node, outputs):
+        class_type = node.get("class_type")
+        inputs = node.get("inputs", {})
+        if class_type == "CheckpointLoaderSimple":
+            model = inputs.get("ckpt_name")
+            if model != self.loaded_model:
+                if self.loaded_model is not None:
+                    self.swaps += 1
+                self.delay(self.load_time)
+                self.loaded_model = model
+        elif class_type == "CLIPTextEncode":
+            self.delay(self.encode_time)
+        elif class_type == "KSampler":
+            batch = self._batch_size(workflow, node)
+            steps = max(1, int(inputs.get("steps", 20)))
+            # Like ComfyUI, a partial denoise only runs the last steps of the schedule
+            total = (self.sample_time * batch * self._area_scale(workflow, node) * float(inputs.get("denoise", 1.0))
+                     * steps / self.reference_steps)
+            if self.progress:
+                for step in range(1, steps + 1):
+                    self.delay(total / steps)
+                    self._send(client_id, "progress", {"value": step, "max": steps, "prompt_id": prompt_id,
+                                                       "node": node_id})
+            else:
+                self.delay(total)
+        elif class_type == "VAEDecode":
+            self.delay(self.decode_time * self._batch_size(workflow, node) * self._area_scale(workflow, node))
+        elif class_type in ("SaveImage", "PreviewImage"):
+            info = self._latent_info(workflow, node)
+            batch = info["batch"]
+            self.delay(self.save_time * batch)
+            prefix = os.path.basename(str(inputs.get("filename_prefix", "ComfyUI")))
+            images = []
+            for n in range(batch):
+                self.counter += 1
+                filename = f"{prefix}_{self.counter:05d}_.png"
+                self.files.add(filename)
+                if self.variants:
+                    # Same seed and batch position, same picture: a refined image matches its draft
+                    key = f"{info['seed']}:{info['batch_index'] + n}".encode("ascii")
+                    self.file_variants[filename] = zlib.crc32(key) % len(self.variants)
+                images.append({"filename": filename, "subfolder": "",
+                               "type": "output" if class_type == "SaveImage" else "temp"})
+                if self.output_dir:
+                    directory = self.output_dir if class_type == "SaveImage" else self.temp_dir
+                    os.makedirs(directory, exist_ok=True)
+                    variant = self.file_variants.get(filename)
+                    with open(os.path.join(directory, filename), "wb") as f:
+                        f.write(self.png if variant is None else self.variants[variant])
+            outputs[node_id] = {"images": images}
+            if class_type == "SaveImage":
+                self.first_output = self.first_output or time.time()
+            self._send(client_id, "executed", {"node": node_id, "display_node": node_id,
+                                               "output": {"images": images}, "prompt_id": prompt_id})
+
+    def gpu_idle_fraction(self, start, end):
+        """Share of [start, end] during which no prompt was executing."""
+        if end <= start:
+            return 0.0
+        busy = sum(max(0.0, min(e, end) - max(s, start)) for s, e in self.busy)
+        return max(0.0, 1.0 - busy / (end - start))
+
+    def stop(self):
+        for ws in list(self.clients.values()):
+            ws.send_frame(0x8, struct.pack(">H", 1001))
+            ws.closed = True
+        super().stop()
+
+
+class FakeOllama(_FakeServer):
+    """
+    Ollama stand-in for /api/generate and /api/tags
+
+    Answers with a made-up photorealistic prompt, or a JSON array of them
+    when the request asks for one prompt per scenario (see llama_batch).
+    The first request pays `load_time` for loading the model; an empty
+    prompt only loads it, like Ollama's preload request.
+
+    Args:
+        ttft (float): Seconds before the first token
+        token_time (float): Seconds per generated word
+        tokens_per_line (int): Words per streamed NDJSON line
+        words (int): Words per generated prompt
+        failure_rate (float): Share of requests answered with HTTP 500
+        slow_rate (float): Share of requests that stall for `slow_time` before the first token
+        slow_time (float): Seconds a stalled request waits
+        load_time (float): Seconds to load the model on the first request
+        jitter (float): Relative +/- jitter applied to every delay
+    """
+
+    VOCABULARY = ("photorealistic", "wildfire", "smoke", "plume", "rising", "over", "dry", "pine", "forest",
+                  "golden", "hour", "light", "haze", "ridge", "embers", "drifting", "wide", "angle", "detailed",
+                  "sharp", "focus", "dusk", "valley", "grass", "orange", "glow", "distant", "hills", "wind")
+
+    def __init__(self, ttft=0.3, token_time=0.005, tokens_per_line=1, words=60, failure_rate=0.0, load_time=0.0,
+                 slow_rate=0.0, slow_time=30.0, **kwargs):
+        super().__init__(**kwargs)
+        self.load_time = load_time
+        self.loaded = False
+        self._load_lock = threading.Lock()
+        self.ttft = ttft
+        self.token_time = token_time
+        self.tokens_per_line = max(1, tokens_per_line)
+        self.words = words
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_time = slow_time
+        self.request_times = []
+        self.failures = 0
+        self.stalls = 0
+
+    def handle_get(self, handler, path, query):
+        if path == "/api/tags":
+            return handler.send_body(200, {"models": [{"name": "llama3.1:latest"}]})
+        super().handle_get(handler, path, query)
+
+    def _load(self):
+        # Concurrent requests wait for the same load, as they do on Ollama
+        with self._load_lock:
+            if not self.loaded:
+                self.delay(self.load_time)
+                self.loaded = True
+
+    def handle_post(self, handler, path):
+        if path != "/api/generate":
+            return super().handle_post(handler, path)
+        started = time.time()
+        body = handler.read_json()
+        if self.chance(self.failure_rate):
+            self.failures += 1
+            return handler.send_body(500, {"error": "simulated Llama failure"})
+        self._load()
+        if not body.get("prompt"):
+            return handler.send_body(200, {"model": body.get("model"), "response": "", "done": True})
+
+        match = re.search(r"for EACH of the (\d+)", body.get("prompt", ""))
+        if match:
+            text = json.dumps([self._sentence() for _ in range(int(match.group(1)))])
+        else:
+            text = self._sentence()
+        tokens = re.findall(r"\S+\s*", text)
+
+        self.delay(self.ttft)
+        if self.chance(self.slow_rate):
+            self.stalls += 1
+            time.sleep(self.slow_time)
+        if not body.get("stream", True):
+            self.delay(self.token_time * len(tokens))
+            handler.send_body(200, {"model": body.get("model"), "response": text, "done": True})
+            self.request_times.append(time.time() - started)
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        try:
+            for i in range(0, len(tokens), self.tokens_per_line):
+                fragment = "".join(tokens[i:i + self.tokens_per_line])
+                self.delay(self.token_time * self.tokens_per_line)
+                self._write_chunk(handler, {"model": body.get("model"), "response": fragment, "done": False})
+            self._write_chunk(handler, {"model": body.get("model"), "response": "", "done": True})
+            handler.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            handler.close_connection = True
+        self.request_times.append(time.time() - started)
+
+    @staticmethod
+    def _write_chunk(handler, message):
+        data = json.dumps(message).encode("utf-8") + b"\n"
+        handler.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        handler.wfile.flush()
+
+    def _sentence(self):
+        with self._rng_lock:
+            return " ".join(self.rng.choice(self.VOCABULARY) for _ in range(self.words)).capitalize() + "."
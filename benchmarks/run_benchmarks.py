@@ -0,0 +1,229 @@
+"""
+Offline end-to-end benchmarks for generate_batch
+
+Starts FakeComfyUI and FakeOllama servers on localhost, points the
+generator at them and runs each scenario, reporting images/sec, time to
+the first image, per-stage latency percentiles and the fraction of time
+the simulated GPU sat idle.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --scenarios sequential,pipelined --num-prompts 32 --output report.json
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import FakeComfyUI, FakeOllama  # noqa: E402
+
+# Per scenario: generate_batch arguments, FakeComfyUI/FakeOllama overrides, server counts and
+# main module settings (e.g. JOB_TIMEOUT) to use while it runs. "cascade" turns on draft-then-refine
+# generation; with image_variants half the fake images fail the default quality filters. "colocated"
+# gives ComfyUI an output directory the generator reads with that transfer method instead of /view
+SCENARIOS = {
+    "sequential": {"generate": {}},
+    "pipelined": {"generate": {"pipelined": True}},
+    "adaptive": {"generate": {"adaptive": True}},
+    "llm_batched": {"generate": {"pipelined": True, "llm_batch_size": 4}},
+    "packed": {"generate": {"pipelined": True, "pack_size": 4}},
+    "warmup": {"generate": {"pipelined": True, "warmup": True}},
+    "two_nodes": {"generate": {"pipelined": True}, "nodes": 2},
+    "mixed_models": {"generate": {"pipelined": True, "prompt_queue_depth": 8,
+                                  "model_name": "base.safetensors:3,other.safetensors:1"}},
+    "flaky": {"generate": {"pipelined": True},
+              "comfyui": {"submit_failure_rate": 0.1, "execution_failure_rate": 0.1},
+              "ollama": {"failure_rate": 0.1}},
+    "llm_tail": {"generate": {"pipelined": True}, "ollama": {"slow_rate": 0.02, "slow_time": 10.0}},
+    "llm_tail_hedged": {"generate": {"pipelined": True}, "ollama": {"slow_rate": 0.02, "slow_time": 10.0},
+                        "ollama_nodes": 2},
+    "variants": {"generate": {"pipelined": True}, "comfyui": {"image_variants": True}},
+    "cascade": {"generate": {"pipelined": True}, "comfyui": {"image_variants": True}, "cascade": True},
+    "colocated": {"generate": {"pipelined": True}, "colocated": "hardlink"},
+    "stuck_jobs": {"generate": {"pipelined": True}, "comfyui": {"hang_rate": 0.15},
+                   "settings": {"JOB_TIMEOUT": 5.0}},
+}
+
+
+def percentiles(values):
+    """Count, mean and nearest-rank p50/p90/p99 of a list of seconds."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p):
+        return round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)], 4)
+
+    return {"count": len(ordered), "mean": round(sum(ordered) / len(ordered), 4),
+            "p50": rank(50), "p90": rank(90), "p99": rank(99)}
+
+
+def run_scenario(main, name, spec, args):
+    """
+    Run one scenario against fresh fake servers
+
+    Returns:
+        dict: Throughput, time to first image, server-side and client-side stage percentiles, GPU idle fraction
+            and generate_batch stats
+    """
+    from comfyui_ws import close_all
+    from timing import RunTimings
+    from quality_gate import QualityGate, parse_filters
+    from retrieval import transfer_stats
+
+    comfy_options = dict(sample_time=args.sample_time, load_time=args.load_time, jitter=args.jitter,
+                         seed=args.seed, **spec.get("comfyui", {}))
+    # Inside OUTPUT_DIR, so hardlinks and renames stay on one filesystem
+    colocated_root = tempfile.mkdtemp(prefix="comfyui-", dir=main.OUTPUT_DIR) if spec.get("colocated") else None
+    if colocated_root:
+        comfy_options["output_dir"] = os.path.join(colocated_root, "output")
+    llama_options = dict(ttft=args.llm_ttft, token_time=args.llm_token_time, load_time=args.llm_load_time,
+                         jitter=args.jitter,
+                         seed=args.seed, **spec.get("ollama", {}))
+    comfy_servers = [FakeComfyUI(**comfy_options).start() for _ in range(spec.get("nodes", 1))]
+    # Different seeds, so the servers do not stall on the same requests
+    ollamas = [FakeOllama(**dict(llama_options, seed=args.seed + n)).start()
+               for n in range(spec.get("ollama_nodes", 1))]
+    settings = dict(spec.get("settings", {}), LLAMA_API_URL=f"{ollamas[0].url}/api/generate",
+                    LLAMA_HEDGE_URLS=[f"{server.url}/api/generate" for server in ollamas[1:]], llama_client=None)
+    saved = {setting: getattr(main, setting) for setting in settings}
+    for setting, value in settings.items():
+        setattr(main, setting, value)
+    main.open_quality_gate(spec.get("cascade", False))
+    if colocated_root:
+        main.open_local_outputs(comfy_options["output_dir"], spec["colocated"])
+    transfers_before = transfer_stats()
+
+    timings = RunTimings()
+    kwargs = dict(mode="auto", num_prompts=args.num_prompts, batch_size=args.batch_size,
+                  nodes=[server.url for server in comfy_servers], timings=timings)
+    kwargs.update(spec.get("generate", {}))
+
+    started = time.time()
+    try:
+        stats = main.generate_batch(**kwargs)
+    finally:
+        finished = time.time()
+        llama_stats = main.llama_client.stats() if main.llama_client is not None else {}
+        for setting, value in saved.items():
+            setattr(main, setting, value)
+        main.open_quality_gate(False)
+        main.open_local_outputs("")
+        transfers = {way: count - transfers_before.get(way, 0) for way, count in transfer_stats().items()
+                     if count > transfers_before.get(way, 0)}
+        close_all()
+        for server in ollamas + comfy_servers:
+            server.stop()
+
+    wall = finished - started
+    jobs = [job for server in comfy_servers for job in server.jobs]
+    # Drafts are served as "temp" previews; only final images count. Images taken from disk never reach
+    # /view (scenarios combining "colocated" and "cascade" would count drafts too)
+    images = sum(1 for server in comfy_servers for _, kind in server.viewed if kind != "temp")
+    images += sum(count for way, count in transfers.items() if way != "http")
+    gpu_seconds = sum(e - s for server in comfy_servers for s, e in server.busy)
+    # Final images that would also pass the quality filters, i.e. that are worth keeping
+    kept = None
+    if all(server.variants for server in comfy_servers):
+        gate = QualityGate(parse_filters(main.CASCADE_FILTERS))
+        passing = [gate.check(io.BytesIO(png))[0] for png in comfy_servers[0].variants]
+        kept = sum(1 for server in comfy_servers for filename, kind in server.viewed
+                   if kind != "temp" and passing[server.file_variants[filename]])
+    first_views = [server.first_view or server.first_output for server in comfy_servers
+                   if server.first_view or server.first_output]
+    return {
+        "scenario": name,
+        "wall_seconds": round(wall, 3),
+        "images": images,
+        "images_per_sec": round(images / wall, 3) if wall > 0 else None,
+        "first_image_seconds": round(min(first_views) - started, 3) if first_views else None,
+        "gpu_idle_fraction": round(sum(server.gpu_idle_fraction(started, finished) for server in comfy_servers)
+                                   / len(comfy_servers), 4),
+        "checkpoint_swaps": sum(server.swaps for server in comfy_servers),
+        "gpu_seconds": round(gpu_seconds, 3),
+        "kept_images": kept,
+        "gpu_seconds_per_kept_image": round(gpu_seconds / kept, 3) if kept else None,
+        "injected_failures": {
+            "llm": sum(server.failures for server in ollamas),
+            "llm_stalls": sum(server.stalls for server in ollamas),
+            "submit": sum(server.submit_failures for server in comfy_servers),
+            "execution": sum(server.execution_failures for server in comfy_servers),
+            "hangs": sum(server.hangs for server in comfy_servers),
+            "interrupted": sum(server.interrupts for server in comfy_servers),
+        },
+        "llama_client": llama_stats,
+        "transfers": transfers,
+        "stages": {
+            "llm": percentiles([t for server in ollamas for t in server.request_times]),
+            "comfyui_queue": percentiles([job["started"] - job["submitted"] for job in jobs]),
+            "comfyui_execute": percentiles([job["finished"] - job["started"] for job in jobs]),
+            "download": percentiles([t for server in comfy_servers for t in server.view_times]),
+        },
+        # The generator's own view of the same run (timing.RunTimings)
+        "client_stages": timings.summary()["stages"],
+        "stats": stats,
+    }
+
+
+def print_report(results):
+    print(f"\n{'scenario':<16}{'images':>8}{'wall s':>9}{'img/s':>8}{'first s':>9}{'gpu idle':>10}"
+          f"{'llm p50':>9}{'queue p50':>11}{'exec p50':>10}{'dl p90':>8}{'gpu s/kept':>12}")
+    for result in results:
+        stages = result["stages"]
+        print(f"{result['scenario']:<16}{result['images']:>8}{result['wall_seconds']:>9.1f}"
+              f"{result['images_per_sec'] or 0:>8.2f}{result['first_image_seconds'] or 0:>9.2f}"
+              f"{result['gpu_idle_fraction'] * 100:>9.1f}%"
+              f"{stages['llm'].get('p50', 0):>9.2f}{stages['comfyui_queue'].get('p50', 0):>11.2f}"
+              f"{stages['comfyui_execute'].get('p50', 0):>10.2f}{stages['download'].get('p90', 0):>8.3f}"
+              f"{result['gpu_seconds_per_kept_image'] or '-':>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark generate_batch against local fake ComfyUI/Ollama servers')
+    parser.add_argument('--scenarios', type=str, default=",".join(SCENARIOS),
+                        help=f'Comma-separated scenarios to run ({", ".join(SCENARIOS)})')
+    parser.add_argument('--num-prompts', type=int, default=16, help='Prompts per scenario')
+    parser.add_argument('--batch-size', type=int, default=2, help='Images per prompt')
+    parser.add_argument('--sample-time', type=float, default=0.5, help='Simulated KSampler seconds per image')
+    parser.add_argument('--load-time', type=float, default=2.0, help='Simulated checkpoint load seconds')
+    parser.add_argument('--llm-ttft', type=float, default=0.3, help='Simulated Llama time to first token')
+    parser.add_argument('--llm-token-time', type=float, default=0.005, help='Simulated Llama seconds per word')
+    parser.add_argument('--llm-load-time', type=float, default=1.0, help='Simulated Llama model load seconds')
+    parser.add_argument('--jitter', type=float, default=0.1, help='Relative +/- jitter on every simulated delay')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for jitter and failure injection')
+    parser.add_argument('--output', type=str, help='Write the full report as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help='Keep the generator\'s INFO logging')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    # config.py reads the environment on import, so point it at a scratch directory first
+    workdir = tempfile.mkdtemp(prefix="aig-bench-")
+    os.environ["OUTPUT_DIR"] = workdir
+    os.environ.setdefault("PROMPT_CACHE_POLICY", "off")
+    import main as generator
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    for name in names:
+        print(f"Running {name}...", flush=True)
+        results.append(run_scenario(generator, name, SCENARIOS[name], args))
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,17 @@
-import requests
-import json
+import logging
+from config import COMFYUI_NODES, LLAMA_API_URL, LLAMA_API_CANDIDATES, LLAMA_MODEL
+from endpoints import probe_endpoints
 
-llama_urls = [
-    "http://localhost:8080/v1/chat/completions",
-    "http://localhost:1234/v1/chat/completions", 
-    "http://localhost:11434/api/generate"
-]
+# Probe every configured endpoint at once; main.py runs the same checks at startup
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-for url in llama_urls:
-    print(f"Trying {url}...")
+llama_urls = list(dict.fromkeys([LLAMA_API_URL] + LLAMA_API_CANDIDATES))
+results = probe_endpoints(llama_urls, COMFYUI_NODES, LLAMA_MODEL)
 
-    try:
-        if "/v1/" in url:
-            payload = {
-                "model": "llama3.1",
-                "messages": [{"role": "user", "content": "Say hello!"}],
-                "temperature": 0.7
-            }
-            response = requests.post(url, json=payload, timeout=20)
-            print(f"Response: {response.status_code}")
-            print(response.json())
-        else:
-            # Handle Ollama API streaming response
-            payload = {
-                "model": "llama3.1",
-                "prompt": "Say hello!",
-                "temperature": 0.7
-            }
-            response = requests.post(url, json=payload, timeout=20)
-            print(f"Response: {response.status_code}")
-            
-            # Process streaming response
-            full_response = ""
-            for line in response.text.strip().split('\n'):
-                if line:
-                    json_response = json.loads(line)
-                    if 'response' in json_response:
-                        full_response += json_response['response']
-                    if json_response.get('done', False):
-                        break
-            
-            print(f"Complete response: {full_response}")
-        
-        print("Success with this URL!")
-        break
-    except Exception as e:
-        print(f"Failed: {e}")
-        continue
\ No newline at end of file
+for kind, probes in results.items():
+    for url, result in probes.items():
+        status = "ok" if result["ok"] else f"failed: {result['error']}"
+        print(f"{kind:<8} {url:<45} {result['latency'] * 1000:>7.0f} ms  {status}")
+
+working = [url for url in llama_urls if results["llama"][url]["ok"]]
+print(f"Using {working[0]} for {LLAMA_MODEL}" if working else f"No Llama endpoint serves {LLAMA_MODEL}")
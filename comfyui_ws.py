@@ -0,0 +1,325 @@
+import json
+import time
+import uuid
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
+import requests
+from websocket import WebSocketApp
+
+logger = logging.getLogger(__name__)
+
+# Prompts whose events arrived before anyone registered for them
+MAX_EARLY_PROMPTS = 256
+
+
+class _PromptWatch:
+    """Per-prompt state: expected output nodes, outputs seen so far and the future to resolve."""
+
+    def __init__(self, output_nodes=None):
+        self.future = Future()
+        self.output_nodes = set(output_nodes or ())
+        self.outputs = {}
+        self.cached = set()
+        self.last_progress = 0.0
+        # Execution trace: when the server started the prompt and (start, seconds) per executed node
+        self.started = None
+        self.nodes = {}
+        self._running = None
+
+    def node_started(self, node_id, at):
+        self.node_finished(at)
+        if self.started is None:
+            self.started = at
+        self._running = (node_id, at)
+
+    def node_finished(self, at, node_id=None):
+        """Close the span of the running node (only if it is node_id, when given)."""
+        if self._running is not None and (node_id is None or self._running[0] == node_id):
+            running, start = self._running
+            self.nodes[running] = (start, at - start)
+            self._running = None
+
+    def trace(self):
+        return {"started": self.started, "nodes": dict(self.nodes), "cached": sorted(self.cached)}
+
+    def resolve(self, outputs=None, error=None):
+        """Settle the future once; later events for the same prompt are ignored."""
+        try:
+            if error is not None:
+                self.future.set_exception(error)
+            else:
+                self.future.set_result(outputs)
+        except InvalidStateError:
+            pass
+
+
+class ComfyUIWebSocket:
+    """
+    One long-lived ComfyUI WebSocket connection shared by every job of a run
+
+    The connection registers a clientId, so ComfyUI sends it the events for
+    prompts queued with that clientId. `executing`, `progress`, `executed`,
+    `execution_cached` and `execution_error` events are routed to the future of
+    the prompt named in their `prompt_id` field. A prompt completes as soon as
+    every expected output node (e.g. SaveImage) has reported `executed`, or
+    when ComfyUI announces the prompt finished. Event arrival times give a
+    per-node execution trace, returned through `wait`. The connection reconnects
+    with backoff and, after a reconnect, checks `/history` once for prompts
+    that may have finished while it was down. Waits give up early when the
+    connection has been down for longer than `disconnect_grace` seconds.
+    """
+
+    def __init__(self, ws_url, base_url, reconnect_delay=1.0, max_reconnect_delay=30.0, disconnect_grace=30.0):
+        self.ws_url = ws_url
+        self.base_url = base_url
+        self.client_id = str(uuid.uuid4())
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.disconnect_grace = disconnect_grace
+        self.connected = threading.Event()
+        # When the connection was lost (or first attempted); None while connected
+        self.down_since = time.time()
+        self._watches = {}
+        self._early = OrderedDict()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._app = None
+        self._thread = threading.Thread(target=self._run, name=f"comfyui-ws-{base_url}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        delay = self.reconnect_delay
+        first = True
+        while not self._stopped:
+            self._app = WebSocketApp(
+                f"{self.ws_url}?clientId={self.client_id}",
+                on_message=self._on_message,
+                on_error=lambda ws, error: logger.warning(f"WebSocket error on {self.ws_url}: {error}"),
+                on_close=lambda ws, code, msg: self.connected.clear(),
+                on_open=lambda ws: self._on_open(first)
+            )
+            self._app.run_forever(ping_interval=30, ping_timeout=10)
+            self.connected.clear()
+            self.down_since = self.down_since or time.time()
+            if self._stopped:
+                break
+            first = False
+            logger.warning(f"WebSocket to {self.ws_url} closed, reconnecting in {delay:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+        logger.info(f"WebSocket connection to {self.ws_url} closed")
+
+    def _on_open(self, first):
+        logger.info(f"WebSocket connection established to {self.ws_url} (clientId {self.client_id})")
+        self.connected.set()
+        self.down_since = None
+        if not first:
+            threading.Thread(target=self._resync, daemon=True).start()
+
+    def _resync(self):
+        """Resolve prompts that finished while the connection was down."""
+        with self._lock:
+            pending = list(self._watches)
+        for prompt_id in pending:
+            self._resolve_from_history(prompt_id)
+
+    def register(self, prompt_id, output_nodes=None):
+        """
+        Start watching a prompt and replay any events that arrived first
+
+        Args:
+            prompt_id (str): prompt_id returned by ComfyUI's /prompt endpoint
+            output_nodes (iterable): Node ids whose `executed` event marks completion
+
+        Returns:
+            Future: Resolves to {node_id: output} or raises on execution errors
+        """
+        watch = _PromptWatch(output_nodes)
+        with self._lock:
+            self._watches[prompt_id] = watch
+            early = self._early.pop(prompt_id, [])
+        for event_type, data, at in early:
+            self._route(event_type, data, at)
+        return watch.future
+
+    def wait(self, prompt_id, output_nodes=None, timeout=300, trace=None, disconnect_grace=None):
+        """
+        Block until a prompt completes
+
+        Args:
+            prompt_id (str): prompt_id to wait for
+            output_nodes (iterable): Node ids whose `executed` event marks completion
+            timeout (float): Seconds to wait before giving up
+            trace (dict): Filled with the execution trace when given: "started" (when
+                the server began the prompt), "nodes" ({node_id: (start, seconds)}) and
+                "cached" (node ids served from ComfyUI's cache)
+            disconnect_grace (float): Give up once the connection has been down this long
+                (default: the client's disconnect_grace)
+
+        Returns:
+            dict: {node_id: output} for the prompt's output nodes, or None on timeout/error
+        """
+        grace = self.disconnect_grace if disconnect_grace is None else disconnect_grace
+        deadline = time.time() + timeout
+        future = self.register(prompt_id, output_nodes)
+        try:
+            while True:
+                # Wake up now and then to notice a server that went away
+                remaining = deadline - time.time()
+                try:
+                    return future.result(timeout=max(0.0, min(remaining, 5.0)))
+                except FutureTimeoutError:
+                    if remaining <= 5.0:
+                        raise
+                down_since = self.down_since
+                if down_since is not None and time.time() - down_since > grace:
+                    # The prompt may still have finished before the server went away
+                    self._resolve_from_history(prompt_id)
+                    if future.done():
+                        return future.result()
+                    logger.error(f"Giving up on {prompt_id}: connection to {self.ws_url} "
+                                 f"down for {time.time() - down_since:.0f}s")
+                    return None
+        except FutureTimeoutError:
+            logger.error(f"Execution of {prompt_id} timed out after {timeout} seconds")
+            return None
+        except Exception as e:
+            logger.error(f"Execution of {prompt_id} failed: {e}")
+            return None
+        finally:
+            with self._lock:
+                watch = self._watches.pop(prompt_id, None)
+                if trace is not None and watch is not None:
+                    trace.update(watch.trace())
+
+    def _on_message(self, ws, message):
+        if not isinstance(message, str):
+            return  # Binary preview frames
+        at = time.time()
+        try:
+            data = json.loads(message)
+            event_type = data.get("type")
+            event = data.get("data", {})
+            prompt_id = event.get("prompt_id")
+            if not prompt_id:
+                return
+            with self._lock:
+                known = prompt_id in self._watches
+                if not known:
+                    self._early.setdefault(prompt_id, []).append((event_type, event, at))
+                    while len(self._early) > MAX_EARLY_PROMPTS:
+                        self._early.popitem(last=False)
+            if known:
+                self._route(event_type, event, at)
+        except Exception as e:
+            logger.error(f"Error processing WebSocket message: {e}")
+
+    def _route(self, event_type, event, at=None):
+        prompt_id = event.get("prompt_id")
+        at = at or time.time()
+        with self._lock:
+            watch = self._watches.get(prompt_id)
+        if watch is None or watch.future.done():
+            return
+
+        if event_type == "execution_start":
+            watch.started = watch.started or at
+        elif event_type == "executing":
+            node = event.get("node")
+            if node is None:
+                watch.node_finished(at)
+                self._finish(prompt_id, watch)
+            else:
+                watch.node_started(str(node), at)
+                logger.info(f"Executing node {node} of {prompt_id}")
+        elif event_type == "progress":
+            maximum = event.get("max") or 1
+            progress = min(1.0, event.get("value", 0) / maximum)
+            if progress > watch.last_progress:
+                logger.info(f"Progress of {prompt_id}: {progress * 100:.1f}%")
+                watch.last_progress = progress
+        elif event_type == "execution_cached":
+            watch.cached.update(str(node) for node in event.get("nodes", []))
+        elif event_type == "executed":
+            watch.node_finished(at, str(event.get("node")))
+            watch.outputs[str(event.get("node"))] = event.get("output") or {}
+            if watch.output_nodes and watch.output_nodes <= set(watch.outputs):
+                logger.info(f"Execution of {prompt_id} completed")
+                watch.resolve(watch.outputs)
+        elif event_type == "execution_success":
+            watch.node_finished(at)
+            self._finish(prompt_id, watch)
+        elif event_type in ("execution_error", "execution_interrupted"):
+            watch.node_finished(at)
+            message = event.get("exception_message") or event_type
+            watch.resolve(error=RuntimeError(f"{event.get('node_type', 'ComfyUI')}: {message}"))
+
+    def _finish(self, prompt_id, watch):
+        """The prompt is done; fetch outputs from /history if some came from cache."""
+        if watch.future.done():
+            return
+        if watch.output_nodes - set(watch.outputs):
+            self._resolve_from_history(prompt_id)
+        else:
+            logger.info(f"Execution of {prompt_id} completed")
+            watch.resolve(watch.outputs)
+
+    def _resolve_from_history(self, prompt_id):
+        with self._lock:
+            watch = self._watches.get(prompt_id)
+        if watch is None or watch.future.done():
+            return
+        try:
+            response = requests.get(f"{self.base_url}/history/{prompt_id}", timeout=10)
+            response.raise_for_status()
+            entry = response.json().get(prompt_id)
+        except Exception as e:
+            logger.warning(f"Error checking history for {prompt_id}: {e}")
+            return
+        if not entry:
+            return
+        status = entry.get("status", {})
+        if status.get("status_str") == "error":
+            watch.resolve(error=RuntimeError(f"Prompt {prompt_id} failed on the server"))
+        elif status.get("completed", False):
+            logger.info(f"Execution of {prompt_id} completed according to history API")
+            watch.resolve(entry.get("outputs", {}))
+
+    def close(self):
+        self._stopped = True
+        if self._app is not None:
+            self._app.close()
+
+
+# One connection per ComfyUI server for the lifetime of the process
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_ws_client(base_url, ws_url):
+    """
+    Return the shared WebSocket client for a ComfyUI server, connecting on first use
+
+    Args:
+        base_url (str): ComfyUI HTTP base URL (used for /history lookups)
+        ws_url (str): ComfyUI WebSocket URL
+    """
+    with _clients_lock:
+        client = _clients.get(ws_url)
+        if client is None:
+            client = ComfyUIWebSocket(ws_url, base_url)
+            _clients[ws_url] = client
+    # Give the first connection a moment so the first prompt's events are not missed
+    client.connected.wait(timeout=5)
+    return client
+
+
+@atexit.register
+def close_all():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -9,11 +9,109 @@ COMFYUI_BASE_URL = os.getenv("COMFYUI_BASE_URL", "http://127.0.0.1:8188")
 COMFYUI_API_URL = f"{COMFYUI_BASE_URL}/prompt"
 COMFYUI_VIEW_URL = f"{COMFYUI_BASE_URL}/view"
 COMFYUI_WS_URL = os.getenv("COMFYUI_WS_URL", "ws://127.0.0.1:8188/ws")
+# Comma-separated ComfyUI base URLs for multi-node runs (defaults to COMFYUI_BASE_URL)
+COMFYUI_NODES = [url.strip() for url in os.getenv("COMFYUI_NODES", COMFYUI_BASE_URL).split(",") if url.strip()]
 LLAMA_API_URL = os.getenv("LLAMA_API_URL", "http://localhost:11434/api/generate")
+LLAMA_MODEL = os.getenv("LLAMA_MODEL", "llama3.1")
+LLAMA_TEMPERATURE = float(os.getenv("LLAMA_TEMPERATURE", "0.7"))
+# Other Ollama /api/generate URLs to try when LLAMA_API_URL does not answer
+LLAMA_API_CANDIDATES = [url.strip() for url in os.getenv(
+    "LLAMA_API_CANDIDATES", "http://localhost:11434/api/generate,http://127.0.0.1:11434/api/generate"
+).split(",") if url.strip()]
+# How long Ollama keeps the model loaded after the warm-up request
+LLAMA_KEEP_ALIVE = os.getenv("LLAMA_KEEP_ALIVE", "30m")
+# Seconds a Llama call may take in total, including hedges and retries
+LLAMA_TIMEOUT = float(os.getenv("LLAMA_TIMEOUT", "120"))
+# Rounds over the Llama endpoints before a call fails
+LLAMA_ATTEMPTS = int(os.getenv("LLAMA_ATTEMPTS", "3"))
+# Comma-separated extra Ollama servers; a call also goes to the next one once it runs past the
+# LLAMA_HEDGE_QUANTILE of recent call latencies, and the first answer wins
+LLAMA_HEDGE_URLS = [url.strip() for url in os.getenv("LLAMA_HEDGE_URLS", "").split(",") if url.strip()]
+LLAMA_HEDGE_QUANTILE = float(os.getenv("LLAMA_HEDGE_QUANTILE", "0.95"))
+# An endpoint failing BREAKER_FAILURES times in a row gets no work for BREAKER_RESET seconds
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "60"))
+# Prompts requested from Llama per streamed call
+LLAMA_BATCH_SIZE = int(os.getenv("LLAMA_BATCH_SIZE", "1"))
 
 # Output Configuration (Environment Variables)
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "fs_dataset")
 METADATA_FILE = os.path.join(OUTPUT_DIR, "metadata.json")
+# Per-run job manifests used by --resume
+RUNS_DIR = os.path.join(OUTPUT_DIR, "runs")
+# Append-only log written during runs; export to METADATA_FILE with `python metadata_store.py export`
+METADATA_LOG_FILE = os.path.join(OUTPUT_DIR, "metadata.jsonl")
+# Records appended between fsync calls on the metadata log
+METADATA_FSYNC_EVERY = int(os.getenv("METADATA_FSYNC_EVERY", "50"))
+# SQLite index over the metadata log, queried with `python metadata_index.py`
+METADATA_INDEX_FILE = os.getenv("METADATA_INDEX_FILE", os.path.join(OUTPUT_DIR, "metadata_index.sqlite"))
+# Update the index as images are saved (otherwise it catches up on the next query)
+METADATA_INDEX_LIVE = os.getenv("METADATA_INDEX_LIVE", "true").lower() in ("1", "true", "yes")
+
+# Llama prompt cache: off, reuse, fill or fresh (see prompt_cache.py)
+PROMPT_CACHE_FILE = os.getenv("PROMPT_CACHE_FILE", os.path.join(OUTPUT_DIR, "prompt_cache.sqlite"))
+PROMPT_CACHE_POLICY = os.getenv("PROMPT_CACHE_POLICY", "off")
+PROMPT_CACHE_VARIANTS = int(os.getenv("PROMPT_CACHE_VARIANTS", "3"))
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "100000"))
+PROMPT_CACHE_MAX_AGE_DAYS = float(os.getenv("PROMPT_CACHE_MAX_AGE_DAYS", "30"))
+
+# Scenario sampling for auto mode: random, stratified, pairwise or lhs (see scenario_sampler.py)
+SCENARIO_STRATEGY = os.getenv("SCENARIO_STRATEGY", "random")
+# Optional JSON file mapping dimension -> {value: weight}
+SCENARIO_WEIGHTS_FILE = os.getenv("SCENARIO_WEIGHTS_FILE", "")
+# Per-cell prompt counts built from the metadata log
+COVERAGE_FILE = os.path.join(OUTPUT_DIR, "coverage.json")
+
+# Startup endpoint probes are reused for ENDPOINT_CACHE_TTL seconds
+ENDPOINT_CACHE_FILE = os.getenv("ENDPOINT_CACHE_FILE", os.path.join(OUTPUT_DIR, "endpoints.json"))
+ENDPOINT_CACHE_TTL = float(os.getenv("ENDPOINT_CACHE_TTL", "300"))
+# Preload the Llama model and each node's checkpoint while the first prompts are generated
+WARMUP = os.getenv("WARMUP", "true").lower() in ("1", "true", "yes")
+
+# Parallel /view downloads per run
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+# Co-located ComfyUI: its output directory as seen from here, or base_url=directory pairs per node.
+# Images found there are hardlinked, reflinked, moved or copied instead of downloaded from /view
+COMFYUI_OUTPUT_ROOT = os.getenv("COMFYUI_OUTPUT_ROOT", "")
+# ComfyUI's temp directory (PreviewImage drafts); default: "temp" next to the output directory
+COMFYUI_TEMP_ROOT = os.getenv("COMFYUI_TEMP_ROOT", "")
+# hardlink, reflink, move or copy
+COLOCATED_TRANSFER = os.getenv("COLOCATED_TRANSFER", "hardlink")
+
+# Post-processing of retrieved images (off unless formats or a thumbnail size is set)
+POSTPROCESS_FORMATS = [f.strip().lower() for f in os.getenv("POSTPROCESS_FORMATS", "").split(",") if f.strip()]
+POSTPROCESS_SIZES = os.getenv("POSTPROCESS_SIZES", "")
+POSTPROCESS_QUALITY = int(os.getenv("POSTPROCESS_QUALITY", "85"))
+POSTPROCESS_THUMBNAIL = int(os.getenv("POSTPROCESS_THUMBNAIL", "0"))
+POSTPROCESS_DELETE_PNG = os.getenv("POSTPROCESS_DELETE_PNG", "false").lower() in ("1", "true", "yes")
+POSTPROCESS_WORKERS = int(os.getenv("POSTPROCESS_WORKERS", "2"))
+POSTPROCESS_DIR = os.getenv("POSTPROCESS_DIR", os.path.join(OUTPUT_DIR, "derived"))
+
+# Near-duplicate detection: off, flag (record duplicate_of) or reject (delete the image)
+DEDUP_MODE = os.getenv("DEDUP_MODE", "off")
+# Maximum Hamming distance (of 64 hash bits) for two images to count as duplicates
+DEDUP_RADIUS = int(os.getenv("DEDUP_RADIUS", "6"))
+DEDUP_INDEX_FILE = os.getenv("DEDUP_INDEX_FILE", os.path.join(OUTPUT_DIR, "phash_index.jsonl"))
+
+# Cascaded generation: render a cheap draft, score it on the CPU and refine only drafts that pass
+CASCADE = os.getenv("CASCADE", "false").lower() in ("1", "true", "yes")
+CASCADE_DRAFT_STEPS = int(os.getenv("CASCADE_DRAFT_STEPS", "8"))
+# Draft resolution relative to the final image
+CASCADE_DRAFT_SCALE = float(os.getenv("CASCADE_DRAFT_SCALE", "0.5"))
+# How much of the upscaled draft the refine pass re-noises (1.0 starts over)
+CASCADE_REFINE_DENOISE = float(os.getenv("CASCADE_REFINE_DENOISE", "0.6"))
+# name:threshold pairs; a draft must reach every threshold (see quality_gate.py)
+CASCADE_FILTERS = os.getenv("CASCADE_FILTERS", "fire:0.05,sharpness:100")
+# Keep scored drafts in CASCADE_DRAFT_DIR instead of deleting them
+CASCADE_KEEP_DRAFTS = os.getenv("CASCADE_KEEP_DRAFTS", "false").lower() in ("1", "true", "yes")
+CASCADE_DRAFT_DIR = os.getenv("CASCADE_DRAFT_DIR", os.path.join(OUTPUT_DIR, "drafts"))
+
+# Output layout: "files" (one PNG per image in OUTPUT_DIR) or "shards" (tar shards with an offset index)
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "files")
+SHARD_DIR = os.getenv("SHARD_DIR", os.path.join(OUTPUT_DIR, "shards"))
+# A shard is finalized before it exceeds this size or sample count
+SHARD_MAX_MB = int(os.getenv("SHARD_MAX_MB", "1024"))
+SHARD_MAX_SAMPLES = int(os.getenv("SHARD_MAX_SAMPLES", "10000"))
 
 # Generation Parameters (.env file)
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", "1"))
@@ -63,4 +161,25 @@ POVs = [
     "security camera perspective mounted on pole", "security camera view from building",
     "ground level perspective", "from distance of 100 meters", "from hillside overlooking area",
     "from forest watchtower", "through trees", "from road perspective"
-]
\ No newline at end of file
+]
+
+# Pipelined Generation (Environment Variables)
+# Prompts generated ahead of ComfyUI execution
+PIPELINE_PROMPT_QUEUE_DEPTH = int(os.getenv("PIPELINE_PROMPT_QUEUE_DEPTH", "4"))
+# Workflows queued in ComfyUI at the same time
+PIPELINE_MAX_INFLIGHT = int(os.getenv("PIPELINE_MAX_INFLIGHT", "2"))
+# Prompts packed into one ComfyUI workflow
+PACK_SIZE = int(os.getenv("PACK_SIZE", "1"))
+# Seconds to wait for a workflow; with --adaptive only until enough jobs have been timed
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))
+# Submissions of one ComfyUI job before it fails (at least one per node); retries back off exponentially
+COMFYUI_ATTEMPTS = int(os.getenv("COMFYUI_ATTEMPTS", "2"))
+# Give up on a node's running jobs once its WebSocket has been down this many seconds
+COMFYUI_DISCONNECT_GRACE = float(os.getenv("COMFYUI_DISCONNECT_GRACE", "30"))
+# Upper bounds for the adaptive controller (--adaptive)
+ADAPTIVE_MAX_INFLIGHT = int(os.getenv("ADAPTIVE_MAX_INFLIGHT", "8"))
+ADAPTIVE_MAX_PROMPT_DEPTH = int(os.getenv("ADAPTIVE_MAX_PROMPT_DEPTH", "32"))
+# Mixed-checkpoint runs: assumed seconds to swap a node to another checkpoint,
+# and the longest a buffered job waits for its checkpoint's turn
+MODEL_SWAP_PENALTY = float(os.getenv("MODEL_SWAP_PENALTY", "30"))
+MODEL_MAX_WAIT = float(os.getenv("MODEL_MAX_WAIT", "600"))
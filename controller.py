@@ -0,0 +1,138 @@
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyWindow:
+    """Sliding window of recent durations with percentile lookups."""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, p):
+        """Nearest-rank percentile (0-100) of the window, or None when empty."""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        rank = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+        return ordered[rank]
+
+
+class AdaptiveController:
+    """
+    Backpressure controller for the pipeline's two buffers
+
+    In-flight workflows follow an additive-increase/multiplicative-decrease
+    rule on the ComfyUI queue depth: while any node's queue (running plus
+    pending, from /queue) is shorter than `target_queue` the GPU can go idle
+    between jobs, so one more workflow is allowed in flight; when queues run
+    longer than needed, or jobs fail, the limit is lowered so less work is
+    lost on a failure.
+
+    The prompt buffer is sized with Little's law: enough prompts to cover
+    the slow (p95) end of Llama latency at the rate jobs are completing.
+
+    Per-job timeouts are `timeout_factor` times the observed p99 job time,
+    falling back to `default_timeout` until `min_samples` jobs have finished.
+    """
+
+    def __init__(self, pool, min_inflight=1, max_inflight=8, initial_inflight=None,
+                 min_prompt_depth=1, max_prompt_depth=32, target_queue=2,
+                 default_timeout=300, min_timeout=30, max_timeout=1800, timeout_factor=3.0,
+                 min_samples=5, window=200):
+        self.pool = pool
+        self.min_inflight = max(1, min_inflight)
+        self.max_inflight = max(self.min_inflight, max_inflight)
+        self.min_prompt_depth = max(1, min_prompt_depth)
+        self.max_prompt_depth = max(self.min_prompt_depth, max_prompt_depth)
+        self.target_queue = target_queue
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+        self.min_samples = min_samples
+
+        self.inflight_limit = min(self.max_inflight, max(self.min_inflight, initial_inflight or len(pool)))
+        self.prompt_depth = self.min_prompt_depth + 1
+        self.job_latency = LatencyWindow(window)
+        self.llm_latency = LatencyWindow(window)
+        self._completions = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe_job(self, seconds, failed=False):
+        """Record a finished (or failed) workflow and re-tune the limits."""
+        with self._lock:
+            if failed:
+                previous = self.inflight_limit
+                self.inflight_limit = max(self.min_inflight, self.inflight_limit // 2)
+                if self.inflight_limit != previous:
+                    logger.info(f"Job failed, lowering in-flight limit to {self.inflight_limit}")
+            else:
+                self.job_latency.add(seconds)
+                self._completions.append(time.time())
+        self.adjust()
+
+    def observe_llm(self, seconds):
+        """Record how long Llama took to produce one prompt."""
+        with self._lock:
+            self.llm_latency.add(seconds)
+
+    def job_timeout(self):
+        """Seconds to wait for a workflow before declaring it lost."""
+        with self._lock:
+            if len(self.job_latency) < self.min_samples:
+                return self.default_timeout
+            p99 = self.job_latency.percentile(99)
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_factor))
+
+    def throughput(self):
+        """Completed jobs per second over the recent window, or None."""
+        if len(self._completions) < 2:
+            return None
+        span = self._completions[-1] - self._completions[0]
+        return (len(self._completions) - 1) / span if span > 0 else None
+
+    def adjust(self):
+        """Recompute the in-flight limit and prompt depth from current measurements."""
+        with self._lock:
+            nodes = [node for node in self.pool.nodes if node.is_available()] or self.pool.nodes
+            shortest = min(node.queue_depth for node in nodes)
+            longest = max(node.queue_depth for node in nodes)
+            previous = (self.inflight_limit, self.prompt_depth)
+
+            if shortest < self.target_queue and self.inflight_limit < self.max_inflight:
+                self.inflight_limit += 1
+            elif shortest > self.target_queue and longest > self.target_queue + 1 \
+                    and self.inflight_limit > self.min_inflight:
+                self.inflight_limit -= 1
+
+            rate = self.throughput()
+            llm_p95 = self.llm_latency.percentile(95)
+            if rate and llm_p95:
+                depth = math.ceil(llm_p95 * rate) + 1
+                self.prompt_depth = min(self.max_prompt_depth, max(self.min_prompt_depth, depth))
+
+            if (self.inflight_limit, self.prompt_depth) != previous:
+                logger.info(f"Adaptive limits: {self.inflight_limit} in flight, {self.prompt_depth} prompts "
+                            f"buffered (queue depths {shortest}-{longest}, "
+                            f"{(rate or 0) * 3600:.0f} jobs/h, Llama p95 {llm_p95 or 0:.1f}s)")
+
+    def summary(self):
+        with self._lock:
+            return {
+                "inflight_limit": self.inflight_limit,
+                "prompt_depth": self.prompt_depth,
+                "job_p50": self.job_latency.percentile(50),
+                "job_p99": self.job_latency.percentile(99),
+                "llm_p95": self.llm_latency.percentile(95),
+            }
@@ -0,0 +1,309 @@
+import os
+import json
+import logging
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from metadata_store import MetadataStore, iter_records
+
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "flag", "reject")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+# pHash works on a 32x32 DCT and keeps the 8x8 lowest frequencies
+PHASH_SIZE = 32
+PHASH_LOW = 8
+
+# Stored with every index record; an index holding another algorithm's hashes is refused
+ALGORITHM = "phash"
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def _load_gray(path, size):
+    with Image.open(path) as image:
+        return image.convert("L").resize(size, Image.Resampling.LANCZOS)
+
+
+def phash_batch(images):
+    """
+    Perceptual hashes of several grayscale 32x32 images at once
+
+    The 2-D DCT of the whole batch is two matrix products; each hash bit says
+    whether a low-frequency coefficient is above the median of the others.
+
+    Args:
+        images (list): PIL images already converted to 32x32 grayscale
+
+    Returns:
+        list: 64-bit integer hashes
+    """
+    pixels = np.stack([np.asarray(image, dtype=np.float32) for image in images])
+    coefficients = _DCT @ pixels @ _DCT.T
+    low = coefficients[:, :PHASH_LOW, :PHASH_LOW].reshape(len(images), -1)
+    # Skip the DC term, which only encodes overall brightness
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    packed = np.packbits(low > median, axis=1)
+    return [int.from_bytes(row.tobytes(), "big") for row in packed]
+
+
+def hash_images(paths):
+    """
+    Hash a batch of image files
+
+    Args:
+        paths (list): Image paths
+
+    Returns:
+        list: (path, hash or None) pairs; unreadable images get None
+    """
+    loaded = []
+    results = []
+    for path in paths:
+        try:
+            loaded.append((path, _load_gray(path, (PHASH_SIZE, PHASH_SIZE))))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not hash {path}: {e}")
+            results.append((path, None))
+    if loaded:
+        hashes = phash_batch([image for _, image in loaded])
+        results.extend((path, value) for (path, _), value in zip(loaded, hashes))
+    return results
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes for Hamming-radius queries
+
+    Each child edge is labelled with its distance to the parent, so by the
+    triangle inequality a query with radius r only descends into edges in
+    [d - r, d + r]. Small radii touch a small fraction of the tree.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = (value, item, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, item, {})
+                return
+            node = child
+
+    def search(self, value, radius):
+        """
+        Find every stored hash within `radius` bits of `value`
+
+        Returns:
+            list: (distance, item) pairs, closest first
+        """
+        if self.root is None:
+            return []
+        matches = []
+        stack = [self.root]
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                matches.append((distance, item))
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return sorted(matches, key=lambda match: match[0])
+
+
+class DedupIndex:
+    """
+    Perceptual hashes of every image kept so far, for near-duplicate checks
+
+    Hashes are appended to a JSONL file (hash, path) and loaded into a
+    BK-tree on start. `check` and insert are one step under a lock, so two
+    near-identical images arriving together cannot both pass as originals.
+    An image that is already indexed (e.g. re-collected by --resume) is only
+    compared with the images indexed before it, so it never matches itself.
+    """
+
+    def __init__(self, path=None, radius=6):
+        self.path = path
+        self.radius = radius
+        self.algorithm = ALGORITHM
+        self.tree = BKTree()
+        # Indexed paths in insertion order
+        self.order = {}
+        self.duplicates = 0
+        self._lock = threading.Lock()
+        self._store = None
+        if path:
+            self._load()
+            self._store = MetadataStore(path)
+
+    def _load(self):
+        for record in iter_records(self.path):
+            algorithm = record.get("algorithm", ALGORITHM)
+            if algorithm != self.algorithm:
+                # Hashes of different algorithms are not comparable, so the index would silently miss duplicates
+                raise ValueError(f"{self.path} holds {algorithm} hashes but this version computes {self.algorithm}; "
+                                 f"rebuild it with `python dedup.py OUTPUT_DIR --index NEW_INDEX`")
+            if record["path"] not in self.order:
+                self.order[record["path"]] = len(self.order)
+                self.tree.add(int(record["hash"], 16), record["path"])
+        logger.info(f"Loaded {len(self.tree)} image hashes from {self.path}")
+
+    def check(self, value, path, keep_duplicates=True):
+        """
+        Look for a near-duplicate of an image and index it
+
+        Args:
+            value (int): The image's hash
+            path (str): The image's path
+            keep_duplicates (bool): Also index the image when it is a duplicate
+
+        Returns:
+            tuple: (path of the closest earlier image or None, distance or None)
+        """
+        with self._lock:
+            position = self.order.get(path)
+            matches = [(distance, item) for distance, item in self.tree.search(value, self.radius)
+                       if position is None or self.order[item] < position]
+            if matches:
+                self.duplicates += 1
+            if position is not None or (matches and not keep_duplicates):
+                return (matches[0][1], matches[0][0]) if matches else (None, None)
+            self.order[path] = len(self.order)
+            self.tree.add(value, path)
+        if self._store is not None:
+            self._store.append({"hash": f"{value:016x}", "path": path, "algorithm": self.algorithm})
+        return (matches[0][1], matches[0][0]) if matches else (None, None)
+
+    def stats(self):
+        return {"indexed": len(self.tree), "duplicates": self.duplicates, "radius": self.radius,
+                "algorithm": self.algorithm}
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+
+
+def find_images(root, exclude=()):
+    """Yield image files under root in sorted order, skipping the `exclude` directories."""
+    exclude = {os.path.abspath(path) for path in exclude}
+    for directory, subdirs, files in os.walk(root):
+        subdirs[:] = sorted(d for d in subdirs if os.path.abspath(os.path.join(directory, d)) not in exclude)
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(directory, name)
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def scan(root, radius=6, index_path=None, report_path=None, delete=False, workers=None, chunk_size=256,
+         exclude=()):
+    """
+    Find near-duplicates in an existing image directory
+
+    Images are decoded and hashed in a process pool, `chunk_size` per task
+    (one vectorized DCT per chunk). The first image of each group (in sorted
+    path order) is kept as the original; later ones are reported as its
+    duplicates and optionally deleted.
+
+    Args:
+        root (str): Directory to scan
+        radius (int): Maximum Hamming distance for two images to count as duplicates
+        index_path (str): Also append the kept images' hashes to this DedupIndex file
+        report_path (str): Write one JSON line per duplicate (path, duplicate_of, distance)
+        delete (bool): Delete duplicates
+        workers (int): Hashing processes (default: CPU count)
+        chunk_size (int): Images per hashing task
+        exclude (iterable): Directories to skip, e.g. derived images
+
+    Returns:
+        dict: Counts of scanned, unreadable, duplicate and deleted images
+    """
+    index = DedupIndex(index_path, radius)
+    report = open(report_path, "w", encoding="utf-8") if report_path else None
+    counts = {"scanned": 0, "unreadable": 0, "duplicates": 0, "deleted": 0}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map keeps submission order, so "first seen" means first in path order
+            for results in executor.map(hash_images, _chunks(find_images(root, exclude), chunk_size)):
+                for path, value in results:
+                    counts["scanned"] += 1
+                    if value is None:
+                        counts["unreadable"] += 1
+                        continue
+                    original, distance = index.check(value, path, keep_duplicates=False)
+                    if original is None:
+                        continue
+                    counts["duplicates"] += 1
+                    if report is not None:
+                        report.write(json.dumps({"path": path, "duplicate_of": original, "distance": distance}) + "\n")
+                    if delete:
+                        os.remove(path)
+                        counts["deleted"] += 1
+                if counts["scanned"] % (chunk_size * 40) < chunk_size:
+                    logger.info(f"Scanned {counts['scanned']} images, {counts['duplicates']} duplicates")
+    finally:
+        index.close()
+        if report is not None:
+            report.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find near-duplicate images with perceptual hashes')
+    parser.add_argument('root', help='Image directory to scan, e.g. OUTPUT_DIR')
+    parser.add_argument('--radius', type=int, default=6, help='Maximum Hamming distance (of 64 bits) for duplicates')
+    parser.add_argument('--index', type=str, help='Append kept images\' hashes to this index, e.g. to seed '
+                                                 'DEDUP_INDEX_FILE for later runs')
+    parser.add_argument('--report', type=str, help='Write duplicates as JSON lines to this file')
+    parser.add_argument('--delete', action='store_true', help='Delete the duplicates found')
+    parser.add_argument('--workers', type=int, help='Hashing processes (default: CPU count)')
+    parser.add_argument('--exclude', type=str, action='append', default=[],
+                        help='Directory to skip (repeatable), e.g. OUTPUT_DIR/derived')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    counts = scan(args.root, args.radius, args.index, args.report, args.delete, args.workers,
+                  exclude=args.exclude)
+    logger.info(f"Scan finished: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+def _ollama_base(url):
+    """http://host:11434/api/generate -> http://host:11434"""
+    return url.split("/api/", 1)[0].rstrip("/")
+
+
+def _has_model(names, model):
+    return any(name == model or name.split(":", 1)[0] == model for name in names)
+
+
+def probe_llama(url, model, timeout=(2, 5)):
+    """
+    Check that an Ollama generate endpoint answers and serves `model`
+
+    Uses /api/tags, which lists the installed models without loading any.
+
+    Returns:
+        dict: {"ok", "latency", "error"}
+    """
+    started = time.time()
+    try:
+        response = requests.get(f"{_ollama_base(url)}/api/tags", timeout=timeout)
+        response.raise_for_status()
+        names = [entry.get("name", "") for entry in response.json().get("models", [])]
+        if names and not _has_model(names, model):
+            return {"ok": False, "latency": time.time() - started, "error": f"model {model} not installed"}
+        return {"ok": True, "latency": time.time() - started, "error": None}
+    except Exception as e:
+        return {"ok": False, "latency": time.time() - started, "error": str(e)}
+
+
+def probe_comfyui(base_url, timeout=(2, 5)):
+    """
+    Check that a ComfyUI server answers, via its /system_stats endpoint
+
+    Returns:
+        dict: {"ok", "latency", "error"}
+    """
+    started = time.time()
+    try:
+        response = requests.get(f"{base_url.rstrip('/')}/system_stats", timeout=timeout)
+        response.raise_for_status()
+        return {"ok": True, "latency": time.time() - started, "error": None}
+    except Exception as e:
+        return {"ok": False, "latency": time.time() - started, "error": str(e)}
+
+
+class EndpointCache:
+    """
+    Probe results saved between runs, each reused for `ttl` seconds
+
+    A run started shortly after another skips probing entirely, and a
+    candidate that was down is not retried until its entry expires.
+    """
+
+    def __init__(self, path=None, ttl=300):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Ignoring endpoint cache {path}: {e}")
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry and time.time() - entry.get("checked", 0) < self.ttl:
+            return entry
+        return None
+
+    def put(self, key, result):
+        with self._lock:
+            self.entries[key] = dict(result, checked=time.time())
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def probe_endpoints(llama_urls, comfyui_urls, model, cache=None):
+    """
+    Probe every candidate endpoint at once
+
+    Args:
+        llama_urls (list): Ollama /api/generate URLs
+        comfyui_urls (list): ComfyUI base URLs
+        model (str): Llama model the run needs
+        cache (EndpointCache): Reuse fresh results and store new ones
+
+    Returns:
+        dict: {"llama": {url: result}, "comfyui": {url: result}}; cached results carry "cached": True
+    """
+    checks = [("llama", url, lambda url=url: probe_llama(url, model)) for url in llama_urls]
+    checks += [("comfyui", url, lambda url=url: probe_comfyui(url)) for url in comfyui_urls]
+    results = {"llama": {}, "comfyui": {}}
+
+    pending = []
+    for kind, url, probe in checks:
+        key = f"{kind} {url} {model}" if kind == "llama" else f"{kind} {url}"
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            results[kind][url] = dict(cached, cached=True)
+        else:
+            pending.append((kind, url, key, probe))
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="probe") as executor:
+            futures = [(kind, url, key, executor.submit(probe)) for kind, url, key, probe in pending]
+            for kind, url, key, future in futures:
+                results[kind][url] = future.result()
+                if cache is not None:
+                    cache.put(key, results[kind][url])
+        if cache is not None:
+            try:
+                cache.save()
+            except OSError as e:
+                logger.warning(f"Could not save endpoint cache: {e}")
+    return results
+
+
+def preload_llama(url, model, keep_alive="30m", timeout=(5, 300)):
+    """
+    Load `model` into Ollama's memory without generating anything
+
+    An empty prompt makes Ollama load the model and return; `keep_alive`
+    keeps it resident between the run's requests.
+
+    Returns:
+        float: Seconds the load took, or None on failure
+    """
+    started = time.time()
+    try:
+        response = requests.post(url, json={"model": model, "prompt": "", "keep_alive": keep_alive, "stream": False},
+                                 timeout=timeout)
+        response.raise_for_status()
+    except Exception as e:
+        logger.warning(f"Could not preload {model} on {url}: {e}")
+        return None
+    return time.time() - started
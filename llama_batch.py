@@ -0,0 +1,212 @@
+import json
+import time
+import logging
+import requests
+from resilience import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+BATCH_INSTRUCTIONS = """
+    Create one detailed image generation prompt for EACH of the {count}
+    scenarios below, in the same order.
+
+{scenarios}
+
+    Focus on photorealism and detail. Return ONLY a JSON array of {count}
+    strings, one prompt per scenario, with no explanations or additional text.
+    """
+
+# Labels used in the single-prompt templates, so batched requests read the same
+FIELD_LABELS = {
+    "environment": "Environment",
+    "time_weather": "Conditions",
+    "fire_stage": "Fire/smoke stage",
+    "pov": "Camera perspective",
+    "topic": "Topic",
+}
+
+
+def stream_llama(url, prompt_text, model, temperature, timeout=(5, 300), cancel=None, deadline=None):
+    """
+    Stream generated text from Ollama's /api/generate as it is produced
+
+    Ollama sends one NDJSON object per token batch; each line is decoded as
+    soon as it arrives instead of buffering the whole response body.
+
+    Args:
+        url (str): Ollama generate endpoint
+        prompt_text (str): Full prompt to send
+        model (str): Llama model name
+        temperature (float): Sampling temperature
+        timeout (tuple): Connect timeout and maximum gap between streamed lines
+        cancel (threading.Event): Stop reading and close the connection once set
+        deadline (float): Wall-clock time by which the whole response must be in
+
+    Yields:
+        str: Fragments of generated text
+
+    Raises:
+        DeadlineExceeded: The deadline passed mid-stream
+    """
+    if deadline is not None:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"No time left for a request to {url}")
+        # No single wait on the socket may outlast the deadline
+        timeout = (min(timeout[0], remaining), min(timeout[1], remaining))
+    payload = {"model": model, "prompt": prompt_text, "temperature": temperature, "stream": True}
+    with requests.post(url, json=payload, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if cancel is not None and cancel.is_set():
+                raise RuntimeError(f"Request to {url} cancelled")
+            if deadline is not None and time.time() > deadline:
+                raise DeadlineExceeded(f"{url} did not finish streaming before the deadline")
+            if not line:
+                continue
+            json_response = json.loads(line)
+            if "error" in json_response:
+                raise RuntimeError(f"Llama API error: {json_response['error']}")
+            if json_response.get("response"):
+                yield json_response["response"]
+            if json_response.get("done", False):
+                break
+
+
+class JSONArrayStreamParser:
+    """
+    Incrementally extract the elements of the first JSON array in a text stream
+
+    Text before the opening `[` (e.g. a Markdown code fence) is ignored.
+    Each top-level element is returned from `feed` as soon as its closing
+    character arrives. String elements are returned as-is; object elements
+    contribute their "prompt" field, or their first string value. Elements
+    that yield no prompt (malformed, empty or of another type) are returned
+    as None, so every element keeps its position in the array.
+    """
+
+    def __init__(self):
+        self.done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._element = None
+
+    def feed(self, text):
+        """
+        Consume a fragment of text
+
+        Args:
+            text (str): Next chunk of the stream
+
+        Returns:
+            list: Prompts completed by this chunk, None for unusable elements
+        """
+        items = []
+        for ch in text:
+            if self.done:
+                break
+            if self._depth == 0:
+                if ch == "[":
+                    self._depth = 1
+                continue
+            if self._element is not None:
+                self._element.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        items.append(self._finish())
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._element = [ch]
+            elif ch in "[{":
+                if self._depth == 1:
+                    self._element = [ch]
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 1 and self._element is not None:
+                    items.append(self._finish())
+                elif self._depth == 0:
+                    self.done = True
+        return items
+
+    def _finish(self):
+        raw = "".join(self._element)
+        self._element = None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping malformed array element from Llama: {raw[:80]}")
+            return None
+        if isinstance(value, dict):
+            value = value.get("prompt") or next((v for v in value.values() if isinstance(v, str)), None)
+        return (value.strip() or None) if isinstance(value, str) else None
+
+
+def build_batch_prompt(system_message, scenarios):
+    """
+    Render one Llama prompt asking for a prompt per scenario
+
+    Args:
+        system_message (str): System part of the prompt
+        scenarios (list): Scenario dicts, in the order the answers must follow
+
+    Returns:
+        str: The full prompt text
+    """
+    listing = []
+    for n, scenario in enumerate(scenarios, 1):
+        fields = "; ".join(f"{FIELD_LABELS.get(name, name)}: {value}" for name, value in scenario.items())
+        listing.append(f"    {n}. {fields}")
+    return system_message + "\n\n" + BATCH_INSTRUCTIONS.format(count=len(scenarios), scenarios="\n".join(listing))
+
+
+def generate_prompts_batch(url, system_message, scenarios, model, temperature, deadline=None):
+    """
+    Generate prompts for several scenarios with one streamed Llama request
+
+    Prompts are yielded as soon as each array element is complete, so the
+    diffusion stage can start on the first one while Llama is still writing
+    the rest. Answers are matched to scenarios by position; scenarios the
+    model did not answer, or answered with an unusable element, are yielded
+    with a None prompt so the caller can fall back to single requests.
+
+    Args:
+        url (str): Ollama generate endpoint
+        system_message (str): System part of the prompt
+        scenarios (list): Scenario dicts
+        model (str): Llama model name
+        temperature (float): Sampling temperature
+        deadline (float): Wall-clock time after which the rest of the batch is given up
+
+    Yields:
+        tuple: (prompt, scenario) in scenario order
+    """
+    prompt_text = build_batch_prompt(system_message, scenarios)
+    parser = JSONArrayStreamParser()
+    produced = 0
+    try:
+        for fragment in stream_llama(url, prompt_text, model, temperature, deadline=deadline):
+            for prompt in parser.feed(fragment):
+                if produced < len(scenarios):
+                    yield prompt, scenarios[produced]
+                    produced += 1
+            if parser.done:
+                break
+    except Exception as e:
+        logger.error(f"Batched Llama request failed after {produced}/{len(scenarios)} prompts: {e}")
+
+    if produced < len(scenarios):
+        logger.warning(f"Llama returned {produced} of {len(scenarios)} batched prompts")
+    for scenario in scenarios[produced:]:
+        yield None, scenario
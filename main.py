@@ -1,26 +1,110 @@
 import os
+import copy
 import json
 import time
+import atexit
+import itertools
 import random
 import requests
 import logging
-from websocket import WebSocketApp
 import threading
 import argparse
+import sqlite3
 from datetime import datetime
 from config import (
-    COMFYUI_API_URL, 
-    COMFYUI_VIEW_URL, 
     COMFYUI_BASE_URL, 
     COMFYUI_WS_URL, 
+    COMFYUI_NODES,
     LLAMA_API_URL, 
+    LLAMA_MODEL,
+    LLAMA_TEMPERATURE,
+    LLAMA_API_CANDIDATES,
+    LLAMA_KEEP_ALIVE,
+    LLAMA_TIMEOUT,
+    LLAMA_ATTEMPTS,
+    LLAMA_HEDGE_URLS,
+    LLAMA_HEDGE_QUANTILE,
+    BREAKER_FAILURES,
+    BREAKER_RESET,
+    LLAMA_BATCH_SIZE,
     OUTPUT_DIR, 
     METADATA_FILE, 
+    METADATA_LOG_FILE,
+    METADATA_FSYNC_EVERY,
     ENVIRONMENTS, 
     TIME_WEATHER, 
     FS_STAGES, 
-    POVs
+    POVs,
+    PIPELINE_PROMPT_QUEUE_DEPTH,
+    PIPELINE_MAX_INFLIGHT,
+    DOWNLOAD_WORKERS,
+    COMFYUI_OUTPUT_ROOT,
+    COMFYUI_TEMP_ROOT,
+    COLOCATED_TRANSFER,
+    PROMPT_CACHE_FILE,
+    PROMPT_CACHE_POLICY,
+    PROMPT_CACHE_VARIANTS,
+    PROMPT_CACHE_MAX_ENTRIES,
+    PROMPT_CACHE_MAX_AGE_DAYS,
+    SCENARIO_STRATEGY,
+    SCENARIO_WEIGHTS_FILE,
+    COVERAGE_FILE,
+    RUNS_DIR,
+    JOB_TIMEOUT,
+    COMFYUI_ATTEMPTS,
+    COMFYUI_DISCONNECT_GRACE,
+    ADAPTIVE_MAX_INFLIGHT,
+    ADAPTIVE_MAX_PROMPT_DEPTH,
+    PACK_SIZE,
+    MODEL_SWAP_PENALTY,
+    MODEL_MAX_WAIT,
+    POSTPROCESS_FORMATS,
+    POSTPROCESS_SIZES,
+    POSTPROCESS_QUALITY,
+    POSTPROCESS_THUMBNAIL,
+    POSTPROCESS_DELETE_PNG,
+    POSTPROCESS_WORKERS,
+    POSTPROCESS_DIR,
+    DEDUP_MODE,
+    DEDUP_RADIUS,
+    DEDUP_INDEX_FILE,
+    CASCADE,
+    CASCADE_DRAFT_STEPS,
+    CASCADE_DRAFT_SCALE,
+    CASCADE_REFINE_DENOISE,
+    CASCADE_FILTERS,
+    CASCADE_KEEP_DRAFTS,
+    CASCADE_DRAFT_DIR,
+    OUTPUT_FORMAT,
+    SHARD_DIR,
+    SHARD_MAX_MB,
+    SHARD_MAX_SAMPLES,
+    METADATA_INDEX_FILE,
+    METADATA_INDEX_LIVE,
+    ENDPOINT_CACHE_FILE,
+    ENDPOINT_CACHE_TTL,
+    WARMUP
 )
+from pipeline import run_pipeline
+from metadata_store import MetadataStore, import_legacy_json, iter_records
+from worker_pool import ComfyUINode, WorkerPool
+from comfyui_ws import get_ws_client
+from retrieval import (TRANSFER_METHODS, LocalOutputs, download_images, get_session, output_images,
+                       parse_output_roots, transfer_stats)
+from llama_batch import BATCH_INSTRUCTIONS, generate_prompts_batch, stream_llama
+from scenario_sampler import STRATEGIES as SCENARIO_STRATEGIES, CoverageIndex, ScenarioSampler, load_weights
+from controller import AdaptiveController
+from run_manifest import GENERATED, SUBMITTED, RETRIEVED, WRITTEN, REQUEUED, RunManifest
+from prompt_cache import POLICIES as PROMPT_CACHE_POLICIES, PromptCache, cache_key
+from model_scheduler import ModelAffinityQueue, ModelMix, parse_model_weights
+from timing import RunTimings
+from postprocess import PostProcessor, parse_sizes
+from dedup import MODES as DEDUP_MODES, DedupIndex, hash_images
+from shards import ShardWriter
+from metadata_index import MetadataIndex
+from endpoints import EndpointCache, preload_llama, probe_endpoints
+from resilience import HedgedClient
+from quality_gate import QualityGate, parse_filters
 
 # Set up logging
 log_dir = "logs"
@@ -37,22 +121,52 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Append-only metadata log, opened on first use
+metadata_store = None
+metadata_lock = threading.Lock()
+
+# SQLite query index updated as records are saved, opened on first use when METADATA_INDEX_LIVE is set
+metadata_index = None
+
+# Deadlines, hedging and circuit breakers for Llama calls, created on first use
+llama_client = None
+llama_client_lock = threading.Lock()
+
+# On-disk Llama prompt cache, enabled with open_prompt_cache
+prompt_cache = None
+
+# Coverage-driven scenario sampler, enabled with open_scenario_sampler
+scenario_sampler = None
+
+# Process pool converting retrieved images, enabled with open_post_processor
+post_processor = None
+
+# Perceptual hash index for near-duplicate checks, enabled with open_dedup_index
+dedup_index = None
+dedup_mode = "off"
+
+# Tar shard writer for OUTPUT_FORMAT=shards, enabled with open_shard_writer
+shard_writer = None
+
+# Draft scoring for cascaded generation, enabled with open_quality_gate
+quality_gate = None
+
+# Local ComfyUI output directories per base URL ("*" for all nodes), set by open_local_outputs
+local_outputs = {}
+
+SCENARIO_DIMENSIONS = {
+    "environment": ENVIRONMENTS,
+    "time_weather": TIME_WEATHER,
+    "fire_stage": FS_STAGES,
+    "pov": POVs
+}
+
 # Create output directory if it doesn't exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 logger.info(f"Ensuring output directory exists: {OUTPUT_DIR}")
 
 
-def generate_prompt_with_llama():
-    """
-    Generate image prompt using Llama
-    """
-
-    environment = random.choice(ENVIRONMENTS)
-    time_weather = random.choice(TIME_WEATHER)
-    fire_stage = random.choice(FS_STAGES)
-    pov = random.choice(POVs)
-
-    system_message = """
+AUTO_SYSTEM_MESSAGE = """
     You are an expert at creating detailed prompts
     for AI image generation. Create realistic, detailed
     prompt generating an image of smoke/fire detection
@@ -63,7 +177,7 @@ def generate_prompt_with_llama():
     and detailed.
     """
 
-    user_message = f"""
+AUTO_USER_TEMPLATE = """
     Create a single detailed image generation prompt for a scenario
     with:
         - Environment: {environment}
@@ -75,33 +189,352 @@ def generate_prompt_with_llama():
     no explanations or additional text.
     """
 
-    payload = {
-        "model": "llama3.1",
-        "prompt": system_message + "\n\n" + user_message,
-        "temperature": 0.7
-    }
+CUSTOM_SYSTEM_MESSAGE = """
+    You are an expert at creating detailed prompts
+    for AI image generation. Create realistic, detailed
+    prompts for the given topic.
+
+    Focus on creating photorealistic and detailed prompts
+    that would generate high-quality images.
+    """
+
+CUSTOM_USER_TEMPLATE = """
+    Create a single detailed image generation prompt for the topic:
+    {topic}
+
+    Focus on photorealism and detail. Return ONLY the prompt text with
+    no explanations or additional text.
+    """
+
+def _llama_request(url, prompt_text, model, temperature, cancel=None, deadline=None):
+    """One streamed Llama request, joined into the full response."""
+    return "".join(stream_llama(url, prompt_text, model, temperature, cancel=cancel, deadline=deadline))
+
+def get_llama_client():
+    """
+    Return the HedgedClient for Llama calls over LLAMA_API_URL and LLAMA_HEDGE_URLS
+
+    The client is rebuilt when LLAMA_API_URL changes, e.g. after endpoint discovery.
+    """
+    global llama_client
+    with llama_client_lock:
+        if llama_client is None or llama_client.endpoints[0] != LLAMA_API_URL:
+            llama_client = HedgedClient(
+                [LLAMA_API_URL] + LLAMA_HEDGE_URLS, _llama_request,
+                timeout=LLAMA_TIMEOUT,
+                attempts=LLAMA_ATTEMPTS,
+                hedge_quantile=LLAMA_HEDGE_QUANTILE,
+                failure_threshold=BREAKER_FAILURES,
+                reset_timeout=BREAKER_RESET
+            )
+        return llama_client
+
+def call_llama(prompt_text, model=LLAMA_MODEL, temperature=LLAMA_TEMPERATURE):
+    """
+    Send a prompt to the Llama API and return the generated text
+
+    The call is bounded by LLAMA_TIMEOUT, retried with backoff and hedged to
+    LLAMA_HEDGE_URLS when it runs past the usual latency (see get_llama_client).
 
+    Args:
+        prompt_text (str): The full prompt (system and user message)
+        model (str): Llama model name (default: LLAMA_MODEL)
+        temperature (float): Sampling temperature (default: LLAMA_TEMPERATURE)
+
+    Returns:
+        str: The generated text, or None on failure
+    """
     try:
-        response = requests.post(LLAMA_API_URL, json=payload)
-        if response.status_code == 200:
-
-            # Process streaming response
-            content = ""
-            for line in response.text.strip().split('\n'):
-                if line:
-                    json_response = json.loads(line)
-                    if 'response' in json_response:
-                        content += json_response['response']
-                    if json_response.get('done', False):
-                        break
-
-            return content, {"environment": environment, "time_weather": time_weather, "fire_stage": fire_stage, "pov": pov}
-        else:
-            print(f"Error from Llama API: {response.status_code}")
-            return None, None
+        return get_llama_client().call(prompt_text, model, temperature)
+    except requests.HTTPError as e:
+        print(f"Error from Llama API: {e.response.status_code}")
+        return None
     except Exception as e:
         print(f"Exception when calling Llama API: {e}")
+        return None
+
+def open_prompt_cache(policy=PROMPT_CACHE_POLICY):
+    """
+    Enable the on-disk prompt cache for this run
+
+    Args:
+        policy (str): One of prompt_cache.POLICIES; "off" disables the cache
+    """
+    global prompt_cache
+    if policy == "off":
+        prompt_cache = None
+        return None
+    prompt_cache = PromptCache(
+        PROMPT_CACHE_FILE,
+        policy=policy,
+        max_variants=PROMPT_CACHE_VARIANTS,
+        max_entries=PROMPT_CACHE_MAX_ENTRIES,
+        max_age_days=PROMPT_CACHE_MAX_AGE_DAYS
+    )
+    atexit.register(prompt_cache.close)
+    logger.info(f"Prompt cache {PROMPT_CACHE_FILE} opened with policy '{policy}': {prompt_cache.stats()}")
+    return prompt_cache
+
+def open_post_processor(formats=POSTPROCESS_FORMATS, sizes=POSTPROCESS_SIZES, thumbnail=POSTPROCESS_THUMBNAIL,
+                        delete_png=POSTPROCESS_DELETE_PNG):
+    """
+    Enable post-processing of retrieved images for this run
+
+    Args:
+        formats (list): Output formats (webp, jpeg, png); with no formats and no thumbnail it stays off
+        sizes (str): Center-cropped output sizes, e.g. "512,768x512"
+        thumbnail (int): Longest thumbnail edge in pixels (0 disables thumbnails)
+        delete_png (bool): Delete each PNG once its derived images are written
+    """
+    global post_processor
+    if not formats and not thumbnail:
+        post_processor = None
+        return None
+    post_processor = PostProcessor(
+        POSTPROCESS_DIR,
+        formats,
+        sizes=parse_sizes(sizes),
+        quality=POSTPROCESS_QUALITY,
+        thumbnail=thumbnail,
+        delete_source=delete_png,
+        max_workers=POSTPROCESS_WORKERS
+    )
+    logger.info(f"Post-processing images into {POSTPROCESS_DIR}: formats {formats}, sizes '{sizes}', "
+                f"thumbnail {thumbnail}, delete PNG {delete_png}")
+    return post_processor
+
+def open_dedup_index(mode=DEDUP_MODE):
+    """
+    Enable near-duplicate checks on retrieved images
+
+    Args:
+        mode (str): One of dedup.MODES: "flag" records the closest earlier image as
+            duplicate_of, "reject" deletes duplicates before metadata is written
+    """
+    global dedup_index, dedup_mode
+    dedup_mode = mode
+    if mode == "off":
+        dedup_index = None
+        return None
+    dedup_index = DedupIndex(DEDUP_INDEX_FILE, radius=DEDUP_RADIUS)
+    atexit.register(dedup_index.close)
+    logger.info(f"Near-duplicate check ({mode}): {dedup_index.stats()}")
+    return dedup_index
+
+def open_quality_gate(enabled=CASCADE, filters=CASCADE_FILTERS):
+    """
+    Enable cascaded generation: every prompt is drafted first and only drafts passing the gate are refined
+
+    Args:
+        enabled (bool): Whether to run the cascade
+        filters (str): name:threshold pairs for quality_gate.QualityGate
+    """
+    global quality_gate
+    if not enabled:
+        quality_gate = None
+        return None
+    quality_gate = QualityGate(parse_filters(filters))
+    os.makedirs(CASCADE_DRAFT_DIR, exist_ok=True)
+    logger.info(f"Cascaded generation: {CASCADE_DRAFT_STEPS}-step drafts at {CASCADE_DRAFT_SCALE:g}x, "
+                f"filters {filters}, refine denoise {CASCADE_REFINE_DENOISE:g}")
+    return quality_gate
+
+def open_local_outputs(spec=COMFYUI_OUTPUT_ROOT, method=COLOCATED_TRANSFER, temp_root=COMFYUI_TEMP_ROOT):
+    """
+    Take images from ComfyUI's output directory on disk instead of downloading them
+
+    Args:
+        spec (str): ComfyUI's output directory, or base_url=directory pairs (see retrieval.parse_output_roots)
+        method (str): One of retrieval.TRANSFER_METHODS
+        temp_root (str): ComfyUI's temp directory when there is a single output directory
+    """
+    global local_outputs
+    roots = parse_output_roots(spec or "")
+    local_outputs = {url: LocalOutputs(root, temp_root if url == "*" else None, method) for url, root in roots.items()}
+    for url, outputs in local_outputs.items():
+        reachable = os.path.isdir(outputs.roots["output"])
+        logger.info(f"Co-located outputs for {'all nodes' if url == '*' else url}: {outputs.roots['output']} "
+                    f"({method}{'' if reachable else ', not reachable yet; using HTTP until it is'})")
+    return local_outputs
+
+def local_outputs_for(base_url):
+    """The LocalOutputs of a ComfyUI node, or None when its images have to be downloaded."""
+    return local_outputs.get((base_url or "").rstrip("/")) or local_outputs.get("*")
+
+def check_duplicates(image_paths):
+    """
+    Hash a job's images and look each one up in the dedup index
+
+    Returns:
+        tuple: (paths to keep, {path: (hash hex, duplicate_of)})
+    """
+    kept, found = [], {}
+    for path, value in hash_images(image_paths):
+        if value is None:
+            kept.append(path)
+            continue
+        original, distance = dedup_index.check(value, path, keep_duplicates=dedup_mode != "reject")
+        if original is not None and dedup_mode == "reject":
+            logger.info(f"Rejecting {path}: {distance} bits from {original}")
+            os.remove(path)
+            continue
+        if original is not None:
+            logger.info(f"{path} is a near-duplicate of {original} ({distance} bits)")
+        kept.append(path)
+        found[path] = (f"{value:016x}", original)
+    return kept, found
+
+def open_shard_writer(output_format=OUTPUT_FORMAT):
+    """
+    Write images and their metadata to tar shards instead of loose files
+
+    Args:
+        output_format (str): "shards" enables the writer, "files" keeps one PNG per image
+    """
+    global shard_writer
+    if output_format != "shards":
+        shard_writer = None
+        return None
+    shard_writer = ShardWriter(SHARD_DIR, max_bytes=SHARD_MAX_MB * 1024 * 1024, max_samples=SHARD_MAX_SAMPLES)
+    atexit.register(shard_writer.close)
+    logger.info(f"Writing tar shards to {SHARD_DIR}")
+    return shard_writer
+
+def shard_image(image_path, entry, derived=None, png_deleted=False):
+    """
+    Move an image, its derived versions and its metadata record into the current shard
+
+    Returns:
+        dict: The sample's location, {"file": shard file name, "key": key}
+    """
+    key = os.path.splitext(os.path.basename(image_path))[0]
+    files = {} if png_deleted else {"png": image_path}
+    for name, path in (derived or {}).items():
+        extension = os.path.splitext(path)[1].lstrip(".")
+        files[name if name == extension else f"{name}.{extension}"] = path
+    location = shard_writer.write(key, files, entry)
+    for path in files.values():
+        if os.path.exists(path):
+            os.remove(path)
+    return location
+
+def generate_from_template(system_message, user_template, scenario):
+    """
+    Render a prompt template for a scenario and generate it, consulting the prompt cache
+
+    Args:
+        system_message (str): System part of the Llama prompt
+        user_template (str): User part, formatted with the scenario fields
+        scenario (dict): Scenario tuple or custom topic
+
+    Returns:
+        str: The generated image prompt, or None on failure
+    """
+    prompt_text = system_message + "\n\n" + user_template.format(**scenario)
+    generate = lambda: call_llama(prompt_text)
+    if prompt_cache is None:
+        return generate()
+    key = cache_key(LLAMA_MODEL, system_message + user_template, scenario, LLAMA_TEMPERATURE)
+    return prompt_cache.get_or_generate(key, scenario, generate)
+
+def generate_prompts_with_llama(mode, topic, count):
+    """
+    Generate several prompts with a single streamed Llama request
+
+    Prompts available from the prompt cache are yielded first; the rest are
+    requested together and yielded one by one as Llama finishes each of them.
+    Any the model skips are retried with a single-prompt request.
+
+    Args:
+        mode (str): Either "auto" for wildfire prompts or "custom" for custom topic
+        topic (str): The topic to generate prompts for (only used in custom mode)
+        count (int): Number of prompts to generate
+
+    Yields:
+        tuple: (prompt, metadata), with (None, None) for failed generations
+    """
+    if mode == "auto":
+        system_message, user_template = AUTO_SYSTEM_MESSAGE, AUTO_USER_TEMPLATE
+        scenarios = [draw_scenario() for _ in range(count)]
+    else:
+        system_message, user_template = CUSTOM_SYSTEM_MESSAGE, CUSTOM_USER_TEMPLATE
+        scenarios = [{"topic": topic} for _ in range(count)]
+
+    # Prompts come from the batch request here, so they are cached under its template, apart from single ones
+    key_for = lambda scenario: cache_key(LLAMA_MODEL, system_message + BATCH_INSTRUCTIONS, scenario,
+                                         LLAMA_TEMPERATURE)
+
+    pending = []
+    for scenario in scenarios:
+        cached = prompt_cache.lookup(key_for(scenario)) if prompt_cache is not None else None
+        if cached:
+            yield cached, scenario
+        else:
+            pending.append(scenario)
+    if not pending:
+        return
+
+    # One long stream is not hedged, but it goes to an endpoint whose breaker is closed and gets a deadline
+    client = get_llama_client()
+    url = next((url for url in client.endpoints if client.breakers[url].available()), LLAMA_API_URL)
+    batch = generate_prompts_batch(url, system_message, pending, LLAMA_MODEL, LLAMA_TEMPERATURE,
+                                   deadline=time.time() + LLAMA_TIMEOUT * len(pending))
+    for prompt, scenario in batch:
+        if prompt is None:
+            prompt = generate_from_template(system_message, user_template, scenario)
+        elif prompt_cache is not None:
+            prompt_cache.put(key_for(scenario), scenario, prompt)
+        yield (prompt, scenario) if prompt else (None, None)
+
+def refresh_coverage_index():
+    """Bring the persistent coverage index up to date with the metadata log and save it."""
+    index = CoverageIndex.load(SCENARIO_DIMENSIONS, COVERAGE_FILE)
+    added = index.update_from_log(METADATA_LOG_FILE)
+    index.save()
+    if added:
+        logger.info(f"Coverage index updated with {added} prompts")
+    return index
+
+def open_scenario_sampler(strategy=SCENARIO_STRATEGY, weights_file=SCENARIO_WEIGHTS_FILE):
+    """
+    Choose how draw_scenario picks scenario tuples for this run
+
+    Args:
+        strategy (str): One of scenario_sampler.STRATEGIES
+        weights_file (str): JSON file with per-dimension value weights (optional)
+    """
+    global scenario_sampler
+    weights = load_weights(weights_file)
+    if strategy == "random" and not weights:
+        scenario_sampler = None
+        return None
+    index = refresh_coverage_index() if strategy != "random" else None
+    scenario_sampler = ScenarioSampler(SCENARIO_DIMENSIONS, strategy=strategy, weights=weights, index=index)
+    if index is not None:
+        logger.info(f"Scenario coverage before run: {index.summary(SCENARIO_DIMENSIONS)}")
+    return scenario_sampler
+
+def draw_scenario():
+    """Pick the environment, conditions, fire stage and camera perspective for one prompt."""
+    if scenario_sampler is not None:
+        return scenario_sampler.next()
+    return {
+        "environment": random.choice(ENVIRONMENTS),
+        "time_weather": random.choice(TIME_WEATHER),
+        "fire_stage": random.choice(FS_STAGES),
+        "pov": random.choice(POVs)
+    }
+
+def generate_prompt_with_llama():
+    """
+    Generate image prompt using Llama
+    """
+    scenario = draw_scenario()
+
+    content = generate_from_template(AUTO_SYSTEM_MESSAGE, AUTO_USER_TEMPLATE, scenario)
+    if content is None:
         return None, None
+    return content, scenario
 
 def create_comfyui_workflow(prompt, batch_size=1, model_name="sd_xl_base_1.0.safetensors"):
     """
@@ -179,152 +612,347 @@ def create_comfyui_workflow(prompt, batch_size=1, model_name="sd_xl_base_1.0.saf
 
     return workflow
 
-def run_comfyui_workflow(workflow):
-    """Run a workflow in ComfyUI and return the generated image."""
+def create_packed_workflow(prompts, batch_size=1, model_name="sd_xl_base_1.0.safetensors"):
+    """
+    Create one ComfyUI workflow that renders several prompts
+
+    The checkpoint loader, negative prompt encoding and empty latent are
+    shared; each prompt gets its own positive CLIPTextEncode, KSampler
+    (with its own seed), VAEDecode and SaveImage branch.
+
+    Args:
+        prompts (list): The text prompts for image generation
+        batch_size (int): Number of images to generate per prompt (default: 1)
+        model_name (str): Name of the model checkpoint to use (default: sd_xl_base_1.0.safetensors)
+
+    Returns:
+        tuple: (workflow, save_nodes) where save_nodes[k] lists the SaveImage node ids of prompts[k]
+    """
+    # Start from the single-prompt graph and keep its shared nodes
+    base = create_comfyui_workflow(prompts[0], batch_size, model_name)
+    workflow = {node_id: base[node_id] for node_id in ("4", "5", "7")}
+    sampler_template = base["3"]["inputs"]
+    save_prefix = base["9"]["inputs"]["filename_prefix"]
+
+    save_nodes = []
+    for k, prompt in enumerate(prompts):
+        first = 100 + 4 * k
+        positive, sampler, decode, save = (str(first + offset) for offset in range(4))
+        workflow[positive] = {
+            "inputs": {"text": prompt, "clip": ["4", 1]},
+            "class_type": "CLIPTextEncode"
+        }
+        workflow[sampler] = {
+            "inputs": dict(sampler_template, seed=random.randint(1, 9999999), positive=[positive, 0]),
+            "class_type": "KSampler"
+        }
+        workflow[decode] = {
+            "inputs": {"samples": [sampler, 0], "vae": ["4", 2]},
+            "class_type": "VAEDecode"
+        }
+        workflow[save] = {
+            "inputs": {"filename_prefix": save_prefix, "images": [decode, 0]},
+            "class_type": "SaveImage"
+        }
+        save_nodes.append([save])
+    return workflow, save_nodes
+
+def create_draft_workflow(workflow, steps=CASCADE_DRAFT_STEPS, scale=CASCADE_DRAFT_SCALE):
+    """
+    Create the cheap first pass of a cascaded generation
+
+    The same graph as `workflow` (same prompt and seed) with fewer sampling
+    steps at a lower resolution. The draft goes to a PreviewImage node, so
+    ComfyUI does not keep it in its output directory.
+
+    Args:
+        workflow (dict): Full workflow from create_comfyui_workflow
+        steps (int): Draft sampling steps
+        scale (float): Draft resolution relative to the full image
+
+    Returns:
+        dict: The draft workflow; node "9" previews its images
+    """
+    draft = copy.deepcopy(workflow)
+    latent = draft["5"]["inputs"]
+    # Latents are 1/8 of the image size, so keep the sides multiples of 8
+    latent["width"] = max(64, int(latent["width"] * scale) // 8 * 8)
+    latent["height"] = max(64, int(latent["height"] * scale) // 8 * 8)
+    draft["3"]["inputs"]["steps"] = steps
+    draft["9"] = {
+        "inputs": {"images": ["8", 0]},
+        "class_type": "PreviewImage"
+    }
+    return draft
+
+def create_refine_workflow(draft, workflow, keep, denoise=CASCADE_REFINE_DENOISE):
+    """
+    Create the second pass of a cascaded generation
+
+    The draft's nodes are kept unchanged, so the draft latent comes from
+    ComfyUI's cache while the node still has it and is otherwise
+    recomputed identically from the same seed. Each kept latent is upscaled
+    to the full size and sampled again with the same seed at `denoise`
+    strength. When every draft image passed, the whole batch is refined
+    together; otherwise each kept image gets its own branch.
+
+    Args:
+        draft (dict): Workflow from create_draft_workflow
+        workflow (dict): The full workflow the draft was made from (final size and steps)
+        keep (list): Batch indices of the draft images that passed the quality gate
+        denoise (float): Share of the upscaled draft that is re-noised and sampled again
+
+    Returns:
+        tuple: (workflow, save_nodes) with the SaveImage node ids of the refined images
+    """
+    refine = {node_id: copy.deepcopy(draft[node_id]) for node_id in ("3", "4", "5", "6", "7")}
+    size = workflow["5"]["inputs"]
+    save_prefix = workflow["9"]["inputs"]["filename_prefix"]
+    batch_size = draft["5"]["inputs"]["batch_size"]
+    indices = [None] if len(keep) == batch_size else keep
+
+    save_nodes = []
+    for k, index in enumerate(indices):
+        first = 200 + 5 * k
+        select, upscale, sampler, decode, save = (str(first + offset) for offset in range(5))
+        samples = ["3", 0]
+        if index is not None:
+            refine[select] = {
+                "inputs": {"samples": samples, "batch_index": index, "length": 1},
+                "class_type": "LatentFromBatch"
+            }
+            samples = [select, 0]
+        refine[upscale] = {
+            "inputs": {"samples": samples, "upscale_method": "nearest-exact", "width": size["width"],
+                       "height": size["height"], "crop": "disabled"},
+            "class_type": "LatentUpscale"
+        }
+        refine[sampler] = {
+            "inputs": dict(workflow["3"]["inputs"], denoise=denoise, latent_image=[upscale, 0]),
+            "class_type": "KSampler"
+        }
+        refine[decode] = {
+            "inputs": {"samples": [sampler, 0], "vae": ["4", 2]},
+            "class_type": "VAEDecode"
+        }
+        refine[save] = {
+            "inputs": {"filename_prefix": save_prefix, "images": [decode, 0]},
+            "class_type": "SaveImage"
+        }
+        save_nodes.append(save)
+    return refine, save_nodes
+
+def create_warmup_workflow(model_name="sd_xl_base_1.0.safetensors"):
+    """
+    Create a minimal workflow that loads a checkpoint into ComfyUI
+
+    It keeps the node ids and checkpoint loader of create_comfyui_workflow, so
+    the first real job finds the model loaded, and runs one 64x64 sampling
+    step to warm up the text encoder, sampler and VAE too. The image goes to
+    a PreviewImage node (ComfyUI's temp directory) rather than the outputs.
+
+    Args:
+        model_name (str): Checkpoint to load
+
+    Returns:
+        tuple: (workflow, output node ids)
+    """
+    workflow = create_comfyui_workflow("", 1, model_name)
+    workflow["3"]["inputs"]["steps"] = 1
+    workflow["5"]["inputs"].update(width=64, height=64)
+    workflow["9"] = {"inputs": {"images": ["8", 0]}, "class_type": "PreviewImage"}
+    return workflow, ["9"]
+
+def submit_workflow(workflow, base_url=COMFYUI_BASE_URL, client_id=None):
+    """
+    Queue a workflow in ComfyUI
+
+    Args:
+        workflow (dict): The workflow graph to execute
+        base_url (str): ComfyUI server to queue it on (default: COMFYUI_BASE_URL)
+        client_id (str): WebSocket clientId that should receive the prompt's events
+
+    Returns:
+        str: The prompt_id assigned by ComfyUI
+    """
+    logger.info("Sending workflow to ComfyUI...")
+    payload = {"prompt": workflow}
+    if client_id:
+        payload["client_id"] = client_id
+    response = requests.post(f"{base_url}/prompt", json=payload, timeout=30)
+    response.raise_for_status()
+
+    # Get the prompt_id from the response
+    prompt_id = response.json()["prompt_id"]
+    logger.info(f"Workflow accepted with prompt_id: {prompt_id}")
+    return prompt_id
+
+def cancel_prompt(prompt_id, base_url=COMFYUI_BASE_URL):
+    """
+    Stop a prompt that is no longer waited for, so it does not occupy the node
+
+    The prompt is removed from the queue if it has not started yet and
+    interrupted if it is running.
+
+    Args:
+        prompt_id (str): prompt_id returned by submit_workflow
+        base_url (str): ComfyUI server the prompt was queued on
+    """
     try:
-        # Send the workflow to ComfyUI
-        logger.info("Sending workflow to ComfyUI...")
-        response = requests.post(COMFYUI_API_URL, json={"prompt": workflow})
+        requests.post(f"{base_url}/queue", json={"delete": [prompt_id]}, timeout=5)
+        response = requests.get(f"{base_url}/queue", timeout=5)
         response.raise_for_status()
-        
-        # Get the prompt_id from the response
-        prompt_id = response.json()["prompt_id"]
-        logger.info(f"Workflow accepted with prompt_id: {prompt_id}")
-        
-        # Create and start WebSocket in a separate thread
-        execution_status = {"completed": False}
-        last_progress = 0
-        
-        def on_message(ws, message):
-            nonlocal execution_status, last_progress
-            try:
-                data = json.loads(message)
-                if data.get("type") == "execution_complete":
-                    execution_status["completed"] = True
-                    logger.info("Execution completed")
-                elif data.get("type") == "executing":
-                    logger.info(f"Executing node: {data.get('data', {}).get('node')}")
-                elif data.get("type") == "progress":
-                    progress = min(1.0, data.get('data', {}).get('value', 0))
-                    if progress > last_progress:
-                        logger.info(f"Overall progress: {progress * 100:.1f}%")
-                        last_progress = progress
-            except Exception as e:
-                logger.error(f"Error processing WebSocket message: {e}")
-
-        def on_error(ws, error):
-            logger.error(f"WebSocket error: {error}")
-
-        def on_close(ws, close_status_code, close_msg):
-            logger.info("WebSocket connection closed")
-
-        def on_open(ws):
-            logger.info("WebSocket connection established")
-            
-        ws = WebSocketApp(
-            COMFYUI_WS_URL,
-            on_message=on_message,
-            on_error=on_error,
-            on_close=on_close,
-            on_open=on_open
-        )
-        
-        wst = threading.Thread(target=ws.run_forever)
-        wst.daemon = True
-        wst.start()
-        
-        # Wait for execution to complete with timeout
-        start_time = time.time()
-        while not execution_status["completed"]:
-            time.sleep(1)
-            elapsed = time.time() - start_time
-            
-            # Check if the prompt is still being processed
-            try:
-                history_response = requests.get(f"{COMFYUI_BASE_URL}/history/{prompt_id}")
-                if history_response.status_code == 200:
-                    history_data = history_response.json()
-                    if history_data.get(prompt_id, {}).get("status", {}).get("completed", False):
-                        execution_status["completed"] = True
-                        logger.info("Execution completed according to history API")
-            except Exception as e:
-                logger.warning(f"Error checking history: {e}")
-                
-            if elapsed > 300:  # 5 minute timeout
-                logger.error("Execution timed out after 5 minutes")
-                break
-        
-        # Close WebSocket connection
-        ws.close()
-        
-        # Wait a moment to ensure files are saved
-        time.sleep(2)
-        
-        try:
+        if any(item[1] == prompt_id for item in response.json().get("queue_running", [])):
+            requests.post(f"{base_url}/interrupt", json={"prompt_id": prompt_id}, timeout=5)
+            logger.warning(f"Interrupted {prompt_id} on {base_url}")
+    except Exception as e:
+        logger.warning(f"Could not cancel {prompt_id} on {base_url}: {e}")
+
+def output_node_ids(workflow):
+    """Return the ids of the SaveImage nodes whose outputs mark a workflow as finished."""
+    return [node_id for node_id, node in workflow.items() if node.get("class_type") == "SaveImage"]
+
+def wait_for_workflow(prompt_id, timeout=JOB_TIMEOUT, base_url=COMFYUI_BASE_URL, ws_url=COMFYUI_WS_URL,
+                      output_nodes=None, trace=None):
+    """
+    Block until ComfyUI has finished executing the given prompt
+
+    Completion is pushed over the run's shared WebSocket connection, so
+    there is no history polling and no fixed delay after the last node.
+
+    Args:
+        prompt_id (str): The prompt_id returned by submit_workflow
+        timeout (int): Seconds to wait before giving up (default: JOB_TIMEOUT)
+        base_url (str): ComfyUI server the prompt was queued on
+        ws_url (str): WebSocket URL of the same server
+        output_nodes (list): SaveImage node ids to wait for (default: wait for the whole prompt)
+        trace (dict): Filled with the per-node execution trace (see ComfyUIWebSocket.wait)
+
+    Returns:
+        dict: {node_id: output} reported by ComfyUI, or None on timeout/error or once the
+            server has been unreachable for COMFYUI_DISCONNECT_GRACE seconds
+    """
+    client = get_ws_client(base_url, ws_url)
+    return client.wait(prompt_id, output_nodes, timeout, trace, disconnect_grace=COMFYUI_DISCONNECT_GRACE)
+
+def image_destinations(outputs, output_nodes=None, stem=None):
+    """
+    Where each image of a finished prompt is saved
+
+    Args:
+        outputs (dict): Node outputs of the prompt
+        output_nodes (list): Only take images from these nodes, in this order
+        stem (str): Saved images are named FS_{stem}_{n}.png
+
+    Returns:
+        list: (node_id, index within the node's batch, image_info, destination path) tuples
+    """
+    destinations = []
+    position = {}
+    for node_id, image_info in output_images(outputs, output_nodes):
+        index = position[node_id] = position.get(node_id, -1) + 1
+        path = os.path.join(OUTPUT_DIR, f"FS_{stem}_{len(destinations)}.png")
+        destinations.append((node_id, index, image_info, path))
+    return destinations
+
+def retrieve_images(prompt_id, base_url=COMFYUI_BASE_URL, outputs=None, output_nodes=None, stem=None, skip=()):
+    """
+    Download the images produced by a finished prompt into OUTPUT_DIR
+
+    Args:
+        prompt_id (str): The prompt_id of a completed workflow
+        base_url (str): ComfyUI server the prompt ran on
+        outputs (dict): Node outputs from wait_for_workflow; fetched from /history when omitted
+        output_nodes (list): Only take images from these nodes, in this order (one prompt of a packed workflow)
+        stem (str): Saved images are named FS_{stem}_{n}.png (default: the prompt_id)
+        skip (collection): Destination paths already in the dataset, which are not downloaded again
+
+    Returns:
+        list: Local paths of the saved images (empty if none were found)
+    """
+    try:
+        if outputs is None:
             # Use the history endpoint to get output information
-            history_response = requests.get(f"{COMFYUI_BASE_URL}/history/{prompt_id}")
-            if history_response.status_code == 200:
-                history_data = history_response.json()
-                
-                # Extract the output image filename from history
-                outputs = history_data.get(prompt_id, {}).get("outputs", {})
-                image_paths = []
-                for node_id, node_output in outputs.items():
-                    if "images" in node_output:
-                        # Process all images in the batch
-                        for image_info in node_output["images"]:
-                            filename = image_info["filename"]
-                            subfolder = image_info.get("subfolder", "")
-                            
-                            # Build the correct URL for the view endpoint
-                            view_url = f"{COMFYUI_VIEW_URL}?filename={filename}"
-                            if subfolder:
-                                view_url += f"&subfolder={subfolder}"
-                                
-                            logger.info(f"Attempting to retrieve image with URL: {view_url}")
-                            
-                            # Download the image
-                            image_response = requests.get(view_url)
-                            image_response.raise_for_status()
-                            
-                            # Save the image with a unique identifier
-                            image_path = os.path.join(OUTPUT_DIR, f"FS_{prompt_id}_{len(image_paths)}.png")
-                            with open(image_path, "wb") as f:
-                                f.write(image_response.content)
-                                
-                            logger.info(f"Successfully saved image to {image_path}")
-                            image_paths.append(image_path)
-                
-                if image_paths:
-                    return prompt_id, image_paths
-        except Exception as e:
-            logger.error(f"Error retrieving image: {e}")
-        
+            history_response = get_session().get(f"{base_url}/history/{prompt_id}", timeout=30)
+            history_response.raise_for_status()
+            outputs = history_response.json().get(prompt_id, {}).get("outputs", {})
+        destinations = [destination for destination in image_destinations(outputs or {}, output_nodes,
+                                                                          stem or prompt_id)
+                        if destination[3] not in skip]
+        return download_images(base_url, [image_info for _, _, image_info, _ in destinations],
+                               [path for _, _, _, path in destinations], max_workers=DOWNLOAD_WORKERS,
+                               local=local_outputs_for(base_url))
+    except Exception as e:
+        logger.error(f"Error retrieving image: {e}")
+        return []
+
+def run_comfyui_workflow(workflow, timeout=JOB_TIMEOUT):
+    """Run a workflow in ComfyUI and return the generated image."""
+    try:
+        client = get_ws_client(COMFYUI_BASE_URL, COMFYUI_WS_URL)
+        prompt_id = submit_workflow(workflow, client_id=client.client_id)
+        outputs = wait_for_workflow(prompt_id, timeout, output_nodes=output_node_ids(workflow))
+
+        image_paths = retrieve_images(prompt_id, outputs=outputs) if outputs else []
+        if image_paths:
+            if post_processor is not None:
+                post_processor.submit(image_paths, lambda results: logger.info(
+                    f"Post-processed {prompt_id}: {[r['derived'] for r in results.values() if r]}"))
+            return prompt_id, image_paths
+
         logger.error("Failed to retrieve the generated image")
         return None, None
-        
+
     except Exception as e:
         logger.error(f"Error in workflow execution: {e}")
         return None, None
 
-def save_metadata(prompt, metadata, image_path, prompt_id):
+def get_metadata_store():
+    """Open the run's append-only metadata log, importing a legacy metadata.json once."""
+    global metadata_store
+    with metadata_lock:
+        if metadata_store is None:
+            if not os.path.exists(METADATA_LOG_FILE) and os.path.exists(METADATA_FILE):
+                try:
+                    import_legacy_json(METADATA_FILE, METADATA_LOG_FILE)
+                except (OSError, json.JSONDecodeError) as e:
+                    logger.error(f"Could not import {METADATA_FILE}: {e}")
+            metadata_store = MetadataStore(METADATA_LOG_FILE, fsync_every=METADATA_FSYNC_EVERY)
+            atexit.register(metadata_store.close)
+        return metadata_store
+
+def get_metadata_index():
+    """Open the SQLite metadata index and bring it up to date with the log, or None if disabled."""
+    global metadata_index
+    if not METADATA_INDEX_LIVE:
+        return None
+    with metadata_lock:
+        if metadata_index is None:
+            try:
+                index = MetadataIndex(METADATA_INDEX_FILE)
+                added = index.ingest_log(METADATA_LOG_FILE)
+                if added:
+                    logger.info(f"Metadata index caught up with {added} records")
+            except sqlite3.Error as e:
+                logger.error(f"Metadata index disabled, could not open {METADATA_INDEX_FILE}: {e}")
+                return None
+            atexit.register(index.close)
+            metadata_index = index
+        return metadata_index
+
+def save_metadata(prompt, metadata, image_path, prompt_id, model=None, derived=None, png_deleted=False,
+                  phash=None, duplicate_of=None, quality=None):
     """
     Save the metadata about the generated image
+
+    Args:
+        derived (dict): Post-processed versions of the image, {name: path}
+        png_deleted (bool): The PNG at image_path was removed after post-processing
+        phash (str): Perceptual hash of the image (hex)
+        duplicate_of (str): Earlier image this one nearly duplicates
+        quality (dict): Quality gate scores of the image's draft, {filter: score}
     """
     try:
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(METADATA_FILE), exist_ok=True)
-        
-        if not os.path.exists(METADATA_FILE):
-            all_metadata = []
-        else:
-            try:
-                with open(METADATA_FILE, "r") as f:
-                    all_metadata = json.load(f)
-            except json.JSONDecodeError:
-                logger.error("Error reading metadata file, starting with empty list")
-                all_metadata = []
-
         entry = {
             "timestamp": datetime.now().isoformat(),
             "prompt": prompt,
@@ -332,11 +960,25 @@ def save_metadata(prompt, metadata, image_path, prompt_id):
             "image_path": image_path,
             "prompt_id": prompt_id
         }
+        if model:
+            entry["model"] = model
+        if derived:
+            entry["derived"] = derived
+        if png_deleted:
+            entry["png_deleted"] = True
+        if phash:
+            entry["phash"] = phash
+        if duplicate_of:
+            entry["duplicate_of"] = duplicate_of
+        if quality:
+            entry["quality"] = quality
+        if shard_writer is not None:
+            entry["shard"] = shard_image(image_path, dict(entry), derived, png_deleted)
 
-        all_metadata.append(entry)
-
-        with open(METADATA_FILE, "w") as f:
-            json.dump(all_metadata, f, indent=2)
+        get_metadata_store().append(entry)
+        index = get_metadata_index()
+        if index is not None:
+            index.add(entry)
 
         logger.info(f"Metadata saved for image: {image_path}")
     except Exception as e:
@@ -349,51 +991,333 @@ def generate_custom_prompt_with_llama(topic):
     Args:
         topic (str): The topic to generate prompts for
     """
-    system_message = """
-    You are an expert at creating detailed prompts
-    for AI image generation. Create realistic, detailed
-    prompts for the given topic.
+    scenario = {"topic": topic}
 
-    Focus on creating photorealistic and detailed prompts
-    that would generate high-quality images.
+    content = generate_from_template(CUSTOM_SYSTEM_MESSAGE, CUSTOM_USER_TEMPLATE, scenario)
+    if content is None:
+        return None, None
+    return content, scenario
+
+def build_worker_pool(nodes=None):
     """
+    Create the ComfyUI worker pool for a run
 
-    user_message = f"""
-    Create a single detailed image generation prompt for the topic:
-    {topic}
+    Args:
+        nodes (list): ComfyUI base URLs (default: COMFYUI_NODES)
+    """
+    # COMFYUI_WS_URL may point somewhere other than the derived <base>/ws
+    return WorkerPool([
+        ComfyUINode(url, COMFYUI_WS_URL if url.rstrip("/") == COMFYUI_BASE_URL.rstrip("/") else None)
+        for url in (nodes or COMFYUI_NODES)
+    ], max_failures=BREAKER_FAILURES, cooldown=BREAKER_RESET, attempts=COMFYUI_ATTEMPTS,
+       swap_penalty=MODEL_SWAP_PENALTY)
 
-    Focus on photorealism and detail. Return ONLY the prompt text with
-    no explanations or additional text.
+def discover_endpoints(nodes, refresh=False):
     """
+    Probe the Llama and ComfyUI endpoints concurrently before the run starts
 
-    payload = {
-        "model": "llama3.1",
-        "prompt": system_message + "\n\n" + user_message,
-        "temperature": 0.7
-    }
+    The first Llama candidate that answers (LLAMA_API_URL, then
+    LLAMA_API_CANDIDATES) becomes LLAMA_API_URL. ComfyUI nodes that do not
+    answer are left out of the run, unless none answer, in which case all
+    are kept and the usual per-job retries apply.
 
-    try:
-        response = requests.post(LLAMA_API_URL, json=payload)
-        if response.status_code == 200:
-            # Process streaming response
-            content = ""
-            for line in response.text.strip().split('\n'):
-                if line:
-                    json_response = json.loads(line)
-                    if 'response' in json_response:
-                        content += json_response['response']
-                    if json_response.get('done', False):
-                        break
-
-            return content, {"topic": topic}
+    Args:
+        nodes (list): ComfyUI base URLs
+        refresh (bool): Probe again even if cached results are fresh
+
+    Returns:
+        list: ComfyUI base URLs to use
+    """
+    global LLAMA_API_URL
+    started = time.time()
+    cache = EndpointCache(ENDPOINT_CACHE_FILE, ttl=0 if refresh else ENDPOINT_CACHE_TTL)
+    candidates = list(dict.fromkeys([LLAMA_API_URL] + LLAMA_API_CANDIDATES))
+    results = probe_endpoints(candidates, nodes, LLAMA_MODEL, cache)
+    for kind, probes in results.items():
+        for url, result in probes.items():
+            state = "ok" if result["ok"] else f"unavailable ({result['error']})"
+            logger.info(f"{kind} {url}: {state}{' (cached)' if result.get('cached') else ''}")
+
+    llama_url = next((url for url in candidates if results["llama"][url]["ok"]), None)
+    if llama_url is None:
+        logger.error(f"No Llama endpoint answered, keeping {LLAMA_API_URL}")
+    elif llama_url != LLAMA_API_URL:
+        logger.warning(f"{LLAMA_API_URL} did not answer, using {llama_url}")
+        LLAMA_API_URL = llama_url
+
+    live = [url for url in nodes if results["comfyui"][url]["ok"]]
+    if not live:
+        logger.error("No ComfyUI node answered, keeping all of them")
+        live = list(nodes)
+    elif len(live) < len(nodes):
+        logger.warning(f"Leaving out unreachable ComfyUI nodes: {', '.join(u for u in nodes if u not in live)}")
+    logger.info(f"Endpoint discovery took {time.time() - started:.2f}s")
+    return live
+
+def start_warmup(pool, models):
+    """
+    Preload the Llama model and a checkpoint on every ComfyUI node in the background
+
+    Node i loads models[i % len(models)], so a mixed-checkpoint run starts
+    with its checkpoints spread across the nodes. The warm-up runs while the
+    first prompts are generated; failures are logged and otherwise ignored.
+
+    Args:
+        pool (WorkerPool): The run's ComfyUI nodes
+        models (list): Checkpoint names of the run
+
+    Returns:
+        list: The started threads
+    """
+    def warm_llama():
+        seconds = preload_llama(LLAMA_API_URL, LLAMA_MODEL, LLAMA_KEEP_ALIVE)
+        if seconds is not None:
+            logger.info(f"Preloaded {LLAMA_MODEL} in {seconds:.1f}s")
+
+    def warm_node(node, model):
+        started = time.time()
+        try:
+            workflow, output_nodes = create_warmup_workflow(model)
+            client = get_ws_client(node.base_url, node.ws_url)
+            prompt_id = submit_workflow(workflow, node.base_url, client.client_id)
+            # Queued ahead of any real job, so the node will have this checkpoint loaded
+            pool.assume_model(node, model)
+            if client.wait(prompt_id, output_nodes, JOB_TIMEOUT) is None:
+                logger.warning(f"Warm-up of {model} on {node.base_url} did not finish")
+                return
+        except Exception as e:
+            logger.warning(f"Warm-up of {model} on {node.base_url} failed: {e}")
+            return
+        logger.info(f"Loaded {model} on {node.base_url} in {time.time() - started:.1f}s")
+
+    threads = [threading.Thread(target=warm_llama, name="warmup-llama", daemon=True)]
+    threads += [threading.Thread(target=warm_node, args=(node, models[i % len(models)]), name=f"warmup-{i}",
+                                 daemon=True) for i, node in enumerate(pool.nodes)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def _prompt_stream(mode, topic, num_prompts, llm_batch_size=1):
+    """Yield (prompt, metadata) pairs for the requested mode, llm_batch_size prompts per Llama call."""
+    if llm_batch_size > 1:
+        for start in range(0, num_prompts, llm_batch_size):
+            yield from generate_prompts_with_llama(mode, topic, min(llm_batch_size, num_prompts - start))
+        return
+
+    for _ in range(num_prompts):
+        if mode == "auto":
+            yield generate_prompt_with_llama()
         else:
-            print(f"Error from Llama API: {response.status_code}")
-            return None, None
-    except Exception as e:
-        print(f"Exception when calling Llama API: {e}")
-        return None, None
+            yield generate_custom_prompt_with_llama(topic)
+
+def make_job_stages(batch_size, model_name, pool, manifest=None, controller=None, timings=None):
+    """
+    Build the execute/collect stage functions shared by sequential and pipelined runs
+
+    Args:
+        batch_size (int): Number of images to generate per prompt
+        model_name (str): Checkpoint for jobs that do not name their own "model"
+        pool (WorkerPool): ComfyUI nodes to dispatch to
+        manifest (RunManifest): Records each job's progress when given
+        controller (AdaptiveController): Supplies per-job timeouts from observed latency
+        timings (RunTimings): Records each job's stage spans (default: kept in memory only)
 
-def generate_batch(mode="auto", topic=None, num_prompts=2, batch_size=2, model_name="sd_xl_base_1.0.safetensors"):
+    Returns:
+        tuple: (execute, execute_pack, collect). execute and collect take a job
+            dict and return True on success; execute_pack runs several jobs as one
+            packed workflow and returns a success flag per job
+    """
+    if timings is None:
+        timings = RunTimings()
+
+    def run_workflow(workflow, output_nodes, key, model, jobs=1, on_submit=None, stage_prefix="", prefer=None):
+        """
+        Run a workflow on `prefer` or the least-loaded node, moving on after failures
+
+        Returns:
+            tuple: (node, prompt_id, outputs), with None for prompt_id and outputs if every attempt failed
+        """
+
+        def run_on(node):
+            client = get_ws_client(node.base_url, node.ws_url)
+            with timings.span(key, f"{stage_prefix}submit"):
+                prompt_id = submit_workflow(workflow, node.base_url, client.client_id)
+            submitted = time.time()
+            if on_submit is not None:
+                on_submit(node, prompt_id)
+            timeout = controller.job_timeout() if controller is not None else JOB_TIMEOUT * jobs
+            trace = {}
+            outputs = wait_for_workflow(prompt_id, timeout, node.base_url, node.ws_url,
+                                        output_nodes=output_nodes, trace=trace)
+            if trace.get("started"):
+                # Events can overtake the /prompt response, so the start may precede `submitted`
+                timings.add(key, f"{stage_prefix}comfyui_queue", max(0.0, trace["started"] - submitted), submitted)
+                timings.add(key, f"{stage_prefix}execute", time.time() - trace["started"], trace["started"])
+                timings.add_execution(key, workflow, trace)
+            if outputs is None:
+                # Free the node before the job is retried elsewhere
+                cancel_prompt(prompt_id, node.base_url)
+                return None
+            return prompt_id, outputs
+
+        node, result = pool.run(run_on, model=model, prefer=prefer)
+        return (node,) + (result or (None, None))
+
+    def record_submitted(jobs, save_nodes, model):
+        """on_submit callback that ties jobs to their prompt and save nodes, as recover_jobs expects."""
+
+        def on_submit(node, prompt_id):
+            for k, job in enumerate(jobs):
+                job["prompt_id"] = prompt_id
+                job["output_nodes"] = save_nodes[k]
+                job["image_stem"] = prompt_id if len(jobs) == 1 else f"{prompt_id}_{k}"
+                job["model"] = model
+                if manifest is not None:
+                    manifest.record(job["index"], SUBMITTED, prompt_id=prompt_id, node=node.base_url,
+                                    output_nodes=job["output_nodes"], image_stem=job["image_stem"], model=model)
+        return on_submit
+
+    def score_drafts(base_url, prompt_id, outputs):
+        """Download a job's draft images and run them through the quality gate; returns [(passed, scores)]."""
+        images = [image_info for _, image_info in output_images(outputs, ["9"])]
+        paths = [os.path.join(CASCADE_DRAFT_DIR, f"FS_{prompt_id}_{n}.png") for n in range(len(images))]
+        saved = set(download_images(base_url, images, paths, max_workers=DOWNLOAD_WORKERS,
+                                    local=local_outputs_for(base_url)))
+        results = []
+        for path in paths:
+            results.append(quality_gate.check(path) if path in saved else (False, {}))
+            if path in saved and not CASCADE_KEEP_DRAFTS:
+                os.remove(path)
+        return results
+
+    def execute_cascade(job):
+        """Draft a job, score the draft on the CPU and refine only the images that pass."""
+        model = job.get("model") or model_name
+        key = job["index"]
+        workflow = create_comfyui_workflow(job["prompt"], batch_size, model)
+        draft = create_draft_workflow(workflow)
+        node, draft_id, outputs = run_workflow(draft, ["9"], key, model, stage_prefix="draft_")
+        if not outputs:
+            job["outputs"] = None
+            return False
+        with timings.span(key, "quality_gate"):
+            results = score_drafts(node.base_url, draft_id, outputs)
+        keep = [n for n, (passed, _) in enumerate(results) if passed]
+        if not keep:
+            logger.info(f"All {len(results)} drafts of prompt {key + 1} failed the quality gate: "
+                        f"{[scores for _, scores in results]}")
+            job["rejected"] = True
+            job["outputs"] = None
+            return True
+        refine, save_nodes = create_refine_workflow(draft, workflow, keep)
+        # Draft scores per refined image: {save node: [scores by batch index]}
+        if len(save_nodes) == 1 and len(keep) > 1:
+            job["quality"] = {save_nodes[0]: [results[n][1] for n in keep]}
+        else:
+            job["quality"] = {save: [results[n][1]] for save, n in zip(save_nodes, keep)}
+
+        # The draft's node still has the draft latent cached; elsewhere it would be sampled again
+        node, _, outputs = run_workflow(refine, save_nodes, key, model, prefer=node,
+                                        on_submit=record_submitted([job], [save_nodes], model))
+        job["base_url"] = node.base_url if node else None
+        job["outputs"] = outputs
+        return bool(outputs)
+
+    def execute_pack(jobs):
+        # Packed jobs always share a checkpoint (see ModelAffinityQueue)
+        model = jobs[0].get("model") or model_name
+        key = jobs[0]["index"]
+        for job in jobs:
+            timings.add(job["index"], "llm", job.get("llm_seconds"))
+            if job.get("generated_at"):
+                timings.add(job["index"], "buffer", time.time() - job["generated_at"], job["generated_at"])
+        if quality_gate is not None:
+            # Each job's refine pass depends on its own draft, so cascaded jobs are not packed
+            return [execute_cascade(job) for job in jobs]
+        if len(jobs) == 1:
+            workflow = create_comfyui_workflow(jobs[0]["prompt"], batch_size, model)
+            save_nodes = [output_node_ids(workflow)]
+        else:
+            workflow, save_nodes = create_packed_workflow([job["prompt"] for job in jobs], batch_size, model)
+
+        node, _, outputs = run_workflow(workflow, [node_id for ids in save_nodes for node_id in ids], key, model,
+                                        jobs=len(jobs), on_submit=record_submitted(jobs, save_nodes, model))
+        results = []
+        for job in jobs:
+            job["base_url"] = node.base_url if node else None
+            # Map the packed graph's outputs back to the prompt that produced them
+            job["outputs"] = {node_id: outputs[node_id] for node_id in job.get("output_nodes", [])
+                              if node_id in outputs} if outputs else None
+            results.append(bool(job["outputs"]))
+        return results
+
+    def execute(job):
+        return execute_pack([job])[0]
+
+    def collect(job):
+        if job.get("rejected"):
+            # Nothing passed the quality gate, so there is nothing to retrieve
+            if manifest is not None:
+                manifest.record(job["index"], WRITTEN, rejected=True)
+            return True
+        image_paths = job.get("image_paths")
+        if not image_paths:
+            with timings.span(job["index"], "download"):
+                image_paths = retrieve_images(
+                    job["prompt_id"], job["base_url"], job.get("outputs"),
+                    output_nodes=job.get("output_nodes"), stem=job.get("image_stem"),
+                    skip=job.get("recorded", ()))
+        if not image_paths:
+            logger.error(f"Failed to retrieve the generated image for prompt {job['index'] + 1}")
+            return False
+        # Draft scores are matched by save node and batch index, so a failed download cannot shift them
+        quality = {}
+        if job.get("quality") and job.get("outputs"):
+            stem = job.get("image_stem") or job["prompt_id"]
+            for node_id, index, _, path in image_destinations(job["outputs"], job.get("output_nodes"), stem):
+                node_scores = job["quality"].get(node_id, [])
+                if path in image_paths and index < len(node_scores):
+                    quality[path] = node_scores[index]
+            if len(quality) < len(image_paths):
+                logger.warning(f"No draft scores for {len(image_paths) - len(quality)} images of prompt "
+                               f"{job['index'] + 1}")
+        hashes = {}
+        if dedup_index is not None:
+            with timings.span(job["index"], "dedup"):
+                image_paths, hashes = check_duplicates(image_paths)
+        if manifest is not None:
+            manifest.record(job["index"], RETRIEVED, image_paths=image_paths)
+
+        def write_metadata(processed=None):
+            with timings.span(job["index"], "metadata"):
+                for image_path in image_paths:
+                    result = (processed or {}).get(image_path)
+                    phash, duplicate_of = hashes.get(image_path, (None, None))
+                    save_metadata(job["prompt"], job["metadata"], image_path, job["prompt_id"], job.get("model"),
+                                  derived=result["derived"] if result else None,
+                                  png_deleted=bool(result and result["source_deleted"]),
+                                  phash=phash, duplicate_of=duplicate_of, quality=quality.get(image_path))
+                if manifest is not None:
+                    manifest.record(job["index"], WRITTEN)
+            if processed:
+                timings.add(job["index"], "postprocess", max((r["seconds"] for r in processed.values() if r),
+                                                             default=None))
+            if job.get("generated_at"):
+                timings.add(job["index"], "total", job.get("llm_seconds", 0) + time.time() - job["generated_at"])
+
+        if post_processor is not None and image_paths:
+            # Metadata is written once the derived paths are known; the pipeline moves on meanwhile
+            post_processor.submit(image_paths, write_metadata)
+        else:
+            write_metadata()
+        return True
+
+    return execute, execute_pack, collect
+
+def generate_batch(mode="auto", topic=None, num_prompts=2, batch_size=2, model_name="sd_xl_base_1.0.safetensors",
+                   pipelined=False, prompt_queue_depth=PIPELINE_PROMPT_QUEUE_DEPTH,
+                   max_inflight=PIPELINE_MAX_INFLIGHT, nodes=None, llm_batch_size=LLAMA_BATCH_SIZE,
+                   manifest=None, adaptive=False, pack_size=PACK_SIZE, timings=None, warmup=False):
     """
     Generate a batch of images based on the specified mode
     
@@ -402,30 +1326,208 @@ def generate_batch(mode="auto", topic=None, num_prompts=2, batch_size=2, model_n
         topic (str): The topic to generate prompts for (only used in custom mode)
         num_prompts (int): Number of different prompts to generate
         batch_size (int): Number of images to generate per prompt
-        model_name (str): Name of the model checkpoint to use
+        model_name (str): Checkpoint to use, or a weighted list such as "a.safetensors:3,b.safetensors:1";
+            several checkpoints imply pipelined mode
+        pipelined (bool): Overlap prompt generation, execution and download (default: False)
+        prompt_queue_depth (int): Prompts generated ahead of execution in pipelined mode
+        max_inflight (int): Workflows queued in ComfyUI at the same time in pipelined mode
+        nodes (list): ComfyUI base URLs to dispatch to; several nodes imply pipelined mode
+        llm_batch_size (int): Prompts requested from Llama per call (default: LLAMA_BATCH_SIZE)
+        manifest (RunManifest): Run manifest to record job progress in; a resumed
+            manifest's finished jobs are skipped and its unfinished ones completed
+        adaptive (bool): Tune in-flight workflows, prompt buffering and timeouts from
+            observed queue depth and latency (implies pipelined mode)
+        pack_size (int): Prompts packed into one ComfyUI workflow (implies pipelined mode when > 1)
+        timings (RunTimings): Collects per-job stage spans for the run's performance report
+        warmup (bool): Preload the Llama model and the checkpoints while the first prompts are generated
+
+    Returns:
+        dict: Counters for generated, failed and completed jobs
     """
-    for i in range(num_prompts):
-        if mode == "auto":
-            prompt, metadata = generate_prompt_with_llama()
+    pool = build_worker_pool(nodes)
+    controller = None
+    if adaptive:
+        controller = AdaptiveController(
+            pool,
+            max_inflight=max(ADAPTIVE_MAX_INFLIGHT, len(pool)),
+            max_prompt_depth=ADAPTIVE_MAX_PROMPT_DEPTH,
+            default_timeout=JOB_TIMEOUT
+        )
+    models = ModelMix(parse_model_weights(model_name))
+    if warmup:
+        start_warmup(pool, [model for model, _ in models.models])
+    execute, execute_pack, collect = make_job_stages(batch_size, models.models[0][0], pool, manifest, controller,
+                                                     timings)
+
+    # Jobs left over from an interrupted run come first
+    requeued = []
+    start_index = 0
+    if manifest is not None:
+        requeued = recover_jobs(manifest, collect)
+        start_index = manifest.next_index()
+        # The requeued prompts were just marked REQUEUED, so active_count no longer includes them
+        num_prompts = max(0, num_prompts - manifest.active_count() - len(requeued))
+
+    if mode == "auto" and scenario_sampler is not None:
+        scenario_sampler.plan(num_prompts)
+
+    prompts = itertools.chain(requeued, _prompt_stream(mode, topic, num_prompts, llm_batch_size))
+    if manifest is not None:
+        prompts = manifest.track(prompts, start_index)
+    total = len(requeued) + num_prompts
+
+    if pipelined or adaptive or pack_size > 1 or len(pool) > 1 or len(models) > 1:
+        prompt_queue = None
+        if len(models) > 1:
+            # Hand each node jobs for the checkpoint it already has loaded
+            prompt_queue = ModelAffinityQueue(pool.peek_model, max_wait=MODEL_MAX_WAIT)
+            logger.info(f"Mixing checkpoints: {models.models}")
+        stats = run_pipeline(
+            prompts,
+            execute,
+            collect,
+            pack_size=pack_size,
+            execute_pack=execute_pack,
+            # Keep at least a full pack buffered
+            prompt_queue_depth=max(prompt_queue_depth, pack_size),
+            max_inflight=max(max_inflight, len(pool)),
+            start_index=start_index,
+            controller=controller,
+            prompt_queue=prompt_queue,
+            prepare=lambda job: job.update(model=models.next())
+        )
+        stats["checkpoint_swaps"] = pool.swap_count()
+        logger.info(f"ComfyUI nodes: {pool.summary()}")
+        if controller is not None:
+            logger.info(f"Adaptive controller: {controller.summary()}")
+        return stats
+
+    stats = {"generated": 0, "prompt_failures": 0, "execute_failures": 0, "collect_failures": 0, "completed": 0}
+    waiting_since = time.time()
+    for i, (prompt, metadata) in enumerate(prompts, start_index):
+        llm_seconds = time.time() - waiting_since
+        if not prompt:
+            logger.error(f"Failed to generate prompt {i+1}/{start_index + total}")
+            stats["prompt_failures"] += 1
+            waiting_since = time.time()
+            continue
+
+        logger.info(f"Generated prompt {i+1}/{start_index + total}: {prompt}")
+        stats["generated"] += 1
+        job = {"index": i, "prompt": prompt, "metadata": metadata, "model": models.next(),
+               "llm_seconds": llm_seconds, "generated_at": time.time()}
+        if not execute(job):
+            logger.error(f"Failed to generate images for prompt {i+1}/{start_index + total}")
+            stats["execute_failures"] += 1
+        elif collect(job):
+            stats["completed"] += 1
         else:
-            prompt, metadata = generate_custom_prompt_with_llama(topic)
-            
-        if prompt:
-            logger.info(f"Generated prompt {i+1}/{num_prompts}: {prompt}")
-            
-            # Create and run workflow
-            workflow = create_comfyui_workflow(prompt, batch_size, model_name)
-            result = run_comfyui_workflow(workflow)
-            
-            if result:
-                prompt_id, image_paths = result
-                if image_paths:
-                    for image_path in image_paths:
-                        save_metadata(prompt, metadata, image_path, prompt_id)
-            else:
-                logger.error(f"Failed to generate images for prompt {i+1}/{num_prompts}")
+            stats["collect_failures"] += 1
+        waiting_since = time.time()
+    return stats
+
+def recover_jobs(manifest, collect, queued_timeout=600):
+    """
+    Finish the work an interrupted run left behind
+
+    Jobs whose images were retrieved only need their metadata written, for
+    the images the metadata log does not have yet; their files may since
+    have been sharded or deleted, so they are never downloaded again.
+    Submitted jobs are looked up in ComfyUI's /history by prompt_id and
+    collected if they finished; ones still in the server's queue are waited
+    for; ones the server no longer knows are resubmitted. Generated but never
+    submitted prompts are returned so the caller can queue them again.
+
+    Args:
+        manifest (RunManifest): The resumed run's manifest
+        collect (callable): The run's collect stage
+        queued_timeout (int): Seconds to wait for prompts still queued on a server
+
+    Returns:
+        list: (prompt, metadata) pairs to resubmit
+    """
+    requeue = []
+    waiting = []
+    retrieved = manifest.in_state(RETRIEVED)
+    recorded = recorded_image_paths({job["prompt_id"] for _, job in retrieved}) if retrieved else set()
+
+    for key, job in retrieved:
+        missing = [path for path in job["image_paths"] if path not in recorded]
+        if not missing:
+            # The crash came after the metadata was written but before the job was marked done
+            manifest.record(key, WRITTEN)
+            continue
+        job = dict(job, index=key, image_paths=missing)
+        if all(os.path.exists(path) for path in missing):
+            collect(job)
         else:
-            logger.error(f"Failed to generate prompt {i+1}/{num_prompts}")
+            job["recorded"] = recorded
+            waiting.append(job)
+
+    for key, job in manifest.in_state(SUBMITTED):
+        waiting.append(dict(job, index=key))
+
+    deadline = time.time() + queued_timeout
+    while waiting:
+        still_queued = []
+        for job in waiting:
+            base_url = job.get("node") or COMFYUI_BASE_URL
+            status = prompt_status(job["prompt_id"], base_url)
+            if status == "completed":
+                logger.info(f"Collecting prompt {job['index'] + 1} ({job['prompt_id']}) from {base_url}")
+                job.update(base_url=base_url, outputs=None, image_paths=None)
+                collect(job)
+            elif status == "queued" and time.time() < deadline:
+                still_queued.append(job)
+            else:
+                requeue.append(job)
+        waiting = still_queued
+        if waiting:
+            # Events for these prompts went to the old run's clientId, so poll until they finish
+            logger.info(f"Waiting for {len(waiting)} prompts still queued in ComfyUI")
+            time.sleep(5)
+
+    for key, job in manifest.in_state(GENERATED):
+        requeue.append(dict(job, index=key))
+
+    for job in requeue:
+        manifest.record(job["index"], REQUEUED)
+    logger.info(f"Resumed run: {len(requeue)} prompts to resubmit, {manifest.counts()}")
+    return [(job["prompt"], job["metadata"]) for job in requeue]
+
+def recorded_image_paths(prompt_ids):
+    """Image paths the metadata log already has a record for, among the given prompts."""
+    return {entry.get("image_path") for entry in iter_records(METADATA_LOG_FILE)
+            if entry.get("prompt_id") in prompt_ids}
+
+def prompt_status(prompt_id, base_url):
+    """
+    Look a prompt up on a ComfyUI server
+
+    Returns:
+        str: "completed", "queued" (pending or running), "failed" or "unknown"
+    """
+    session = get_session()
+    try:
+        response = session.get(f"{base_url}/history/{prompt_id}", timeout=10)
+        response.raise_for_status()
+        entry = response.json().get(prompt_id)
+        if entry:
+            status = entry.get("status", {})
+            if status.get("status_str") == "error":
+                return "failed"
+            if status.get("completed", False):
+                return "completed"
+
+        response = session.get(f"{base_url}/queue", timeout=10)
+        response.raise_for_status()
+        queue_data = response.json()
+        for item in queue_data.get("queue_running", []) + queue_data.get("queue_pending", []):
+            if len(item) > 1 and item[1] == prompt_id:
+                return "queued"
+    except Exception as e:
+        logger.warning(f"Could not look up prompt {prompt_id} on {base_url}: {e}")
+    return "unknown"
 
 def main():
     parser = argparse.ArgumentParser(description='Generate images using ComfyUI and Llama')
@@ -438,20 +1540,152 @@ def main():
     parser.add_argument('--batch-size', type=int, default=2,
                       help='Number of images to generate per prompt')
     parser.add_argument('--model', type=str, default="sd_xl_base_1.0.safetensors",
-                      help='Model checkpoint to use')
+                      help='Model checkpoint to use, or a weighted list of checkpoints to mix '
+                           '(e.g. "sd_xl_base_1.0.safetensors:3,other.safetensors:1")')
+    parser.add_argument('--pipeline', action='store_true',
+                      help='Overlap Llama prompt generation, ComfyUI execution and image download')
+    parser.add_argument('--prompt-queue-depth', type=int, default=PIPELINE_PROMPT_QUEUE_DEPTH,
+                      help='Prompts generated ahead of execution in pipeline mode')
+    parser.add_argument('--max-inflight', type=int, default=PIPELINE_MAX_INFLIGHT,
+                      help='Workflows queued in ComfyUI at the same time in pipeline mode')
+    parser.add_argument('--adaptive', action='store_true',
+                      help='Tune in-flight workflows, prompt buffering and job timeouts from observed '
+                           'ComfyUI queue depth and latency (implies --pipeline)')
+    parser.add_argument('--pack-size', type=int, default=PACK_SIZE,
+                      help='Pack up to this many prompts into one ComfyUI workflow sharing the checkpoint '
+                           'loader and negative prompt (implies --pipeline)')
+    parser.add_argument('--comfyui-nodes', type=str,
+                      help='Comma-separated ComfyUI base URLs; work goes to the least-loaded node')
+    parser.add_argument('--prompt-cache', choices=PROMPT_CACHE_POLICIES, default=PROMPT_CACHE_POLICY,
+                      help='Reuse Llama prompts from the on-disk cache: off, reuse (generate on miss), '
+                           'fill (generate until each key has enough variants) or fresh (always generate, store result)')
+    parser.add_argument('--sampler', choices=SCENARIO_STRATEGIES, default=SCENARIO_STRATEGY,
+                      help='How auto mode picks scenarios: random, or fill under-represented cells first '
+                           '(stratified), pairs of dimension values (pairwise) or spread values evenly (lhs)')
+    parser.add_argument('--scenario-weights', type=str, default=SCENARIO_WEIGHTS_FILE,
+                      help='JSON file of per-dimension value weights for the scenario sampler')
+    parser.add_argument('--llm-batch-size', type=int, default=LLAMA_BATCH_SIZE,
+                      help='Prompts requested from Llama in one streamed call')
+    parser.add_argument('--postprocess', type=str, default=",".join(POSTPROCESS_FORMATS),
+                      help='Comma-separated formats (webp, jpeg, png) to convert retrieved images to in a '
+                           'background process pool')
+    parser.add_argument('--postprocess-sizes', type=str, default=POSTPROCESS_SIZES,
+                      help='Center-cropped sizes for converted images, e.g. "512,768x512" (default: original size)')
+    parser.add_argument('--thumbnail', type=int, default=POSTPROCESS_THUMBNAIL,
+                      help='Also write JPEG thumbnails with this longest edge (0 disables)')
+    parser.add_argument('--delete-png', action='store_true', default=POSTPROCESS_DELETE_PNG,
+                      help='Delete each PNG once its converted versions are written')
+    parser.add_argument('--dedup', choices=DEDUP_MODES, default=DEDUP_MODE,
+                      help='Check retrieved images against earlier ones by perceptual hash: flag near-duplicates '
+                           'in metadata or reject (delete) them')
+    parser.add_argument('--output-format', choices=['files', 'shards'], default=OUTPUT_FORMAT,
+                      help='Save loose PNG files, or tar shards (WebDataset layout) with an offset index in SHARD_DIR')
+    parser.add_argument('--cascade', action='store_true', default=CASCADE,
+                      help='Render a cheap draft of each prompt first and refine only drafts that pass the quality '
+                           'filters')
+    parser.add_argument('--cascade-filters', type=str, default=CASCADE_FILTERS,
+                      help='Draft quality filters as name:threshold pairs, e.g. fire:0.05,sharpness:100')
+    parser.add_argument('--comfyui-output-root', type=str, default=COMFYUI_OUTPUT_ROOT,
+                      help='ComfyUI\'s output directory on this machine, or base_url=directory pairs; images found '
+                           'there are taken from disk instead of downloaded over HTTP')
+    parser.add_argument('--transfer', choices=TRANSFER_METHODS, default=COLOCATED_TRANSFER,
+                      help='How images are taken from a co-located ComfyUI output directory')
+    parser.add_argument('--no-warmup', dest='warmup', action='store_false', default=WARMUP,
+                      help='Do not preload the Llama model and ComfyUI checkpoints at startup')
+    parser.add_argument('--refresh-endpoints', action='store_true',
+                      help='Probe the Llama and ComfyUI endpoints again even if ENDPOINT_CACHE_FILE is fresh')
+    parser.add_argument('--run-id', type=str,
+                      help='Name of this run\'s manifest in OUTPUT_DIR/runs (default: a timestamp)')
+    parser.add_argument('--resume', type=str, metavar='RUN_ID',
+                      help='Resume an interrupted run: collect its queued prompts and skip finished work')
 
     args = parser.parse_args()
 
-    if args.mode == 'custom' and not args.topic:
-        parser.error("--topic is required when using custom mode")
+    if args.resume:
+        manifest_path = RunManifest.path_for(RUNS_DIR, args.resume)
+        if not os.path.exists(manifest_path):
+            parser.error(f"No run manifest found at {manifest_path}")
+        manifest = RunManifest(manifest_path)
+        # The interrupted run's generation parameters win over the command line
+        for name, value in manifest.params.items():
+            setattr(args, name, value)
+    else:
+        if args.mode == 'custom' and not args.topic:
+            parser.error("--topic is required when using custom mode")
+        run_id = args.run_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+        manifest = RunManifest(os.path.join(RUNS_DIR, f"{run_id}.jsonl"), params={
+            "mode": args.mode,
+            "topic": args.topic,
+            "num_prompts": args.num_prompts,
+            "batch_size": args.batch_size,
+            "model": args.model,
+            "output_format": args.output_format,
+            "cascade": args.cascade,
+            "cascade_filters": args.cascade_filters
+        })
+        logger.info(f"Run manifest: {manifest.path} (resume with --resume {run_id})")
+    atexit.register(manifest.close)
+    # Stage timings go next to the manifest: <run>.spans.jsonl, <run>.timings.json and <run>.prom
+    run_base = manifest.path[:-len(".jsonl")] if manifest.path.endswith(".jsonl") else manifest.path
+    timings = RunTimings(spans_path=f"{run_base}.spans.jsonl")
+    atexit.register(timings.close)
 
-    generate_batch(
+    nodes = discover_endpoints(args.comfyui_nodes.split(",") if args.comfyui_nodes else COMFYUI_NODES,
+                               refresh=args.refresh_endpoints)
+    open_prompt_cache(args.prompt_cache)
+    open_dedup_index(args.dedup)
+    open_quality_gate(args.cascade, args.cascade_filters)
+    open_local_outputs(args.comfyui_output_root, args.transfer)
+    open_shard_writer(args.output_format)
+    # Catch the query index up with the log now rather than on the first saved image
+    get_metadata_index()
+    # Started before the pipeline threads so the worker processes fork from a quiet process
+    open_post_processor([f.strip().lower() for f in args.postprocess.split(",") if f.strip()],
+                        args.postprocess_sizes, args.thumbnail, args.delete_png)
+    if args.mode == 'auto':
+        open_scenario_sampler(args.sampler, args.scenario_weights)
+
+    stats = generate_batch(
         mode=args.mode,
         topic=args.topic,
         num_prompts=args.num_prompts,
         batch_size=args.batch_size,
-        model_name=args.model
+        model_name=args.model,
+        pipelined=args.pipeline,
+        prompt_queue_depth=args.prompt_queue_depth,
+        max_inflight=args.max_inflight,
+        nodes=nodes,
+        llm_batch_size=args.llm_batch_size,
+        manifest=manifest,
+        adaptive=args.adaptive,
+        pack_size=args.pack_size,
+        timings=timings,
+        warmup=args.warmup
     )
+    logger.info(f"Run finished: {stats}")
+    if post_processor is not None:
+        logger.info("Waiting for post-processing to finish...")
+        post_processor.close()
+        logger.info(f"Post-processing: {post_processor.stats()}")
+    if dedup_index is not None:
+        logger.info(f"Near-duplicates: {dedup_index.stats()}")
+    if quality_gate is not None:
+        logger.info(f"Draft quality gate: {quality_gate.stats()}")
+    if local_outputs:
+        logger.info(f"Image transfers: {transfer_stats()}")
+    if shard_writer is not None:
+        shard_writer.close()
+        logger.info(f"Shards: {shard_writer.stats()}")
+    summary = timings.write(f"{run_base}.timings.json", f"{run_base}.prom", extra={"stats": stats})
+    logger.info("Stage timings (p50/p99 s): " + ", ".join(
+        f"{stage} {values['p50']:.2f}/{values['p99']:.2f}" for stage, values in summary["stages"].items()))
+
+    if llama_client is not None:
+        logger.info(f"Llama calls: {llama_client.stats()}")
+    if prompt_cache is not None:
+        logger.info(f"Prompt cache: {prompt_cache.stats()}")
+    if scenario_sampler is not None and scenario_sampler.strategy != "random":
+        logger.info(f"Scenario coverage after run: {refresh_coverage_index().summary(SCENARIO_DIMENSIONS)}")
 
 if __name__ == "__main__":
     main()
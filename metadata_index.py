@@ -0,0 +1,289 @@
+import os
+import json
+import sqlite3
+import logging
+import argparse
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Scenario fields read from each record's "metadata"; custom-mode records only have a topic
+DIMENSIONS = ("environment", "time_weather", "fire_stage", "pov", "topic")
+# Columns that can be filtered on and counted
+COLUMNS = DIMENSIONS + ("model", "prompt_id", "timestamp")
+INDEXED = DIMENSIONS + ("model", "timestamp")
+
+
+def _row(entry):
+    scenario = entry.get("metadata") or {}
+    shard = entry.get("shard") or {}
+    return (
+        entry.get("image_path"),
+        entry.get("prompt_id"),
+        entry.get("timestamp"),
+        *(scenario.get(name) for name in DIMENSIONS),
+        entry.get("model"),
+        entry.get("phash"),
+        entry.get("duplicate_of"),
+        shard.get("file"),
+        json.dumps(entry, ensure_ascii=False),
+    )
+
+
+_INSERT = (f"INSERT OR REPLACE INTO images (image_path, prompt_id, timestamp, {', '.join(DIMENSIONS)}, model, "
+           f"phash, duplicate_of, shard, record) VALUES ({', '.join('?' * (len(DIMENSIONS) + 8))})")
+
+
+class MetadataIndex:
+    """
+    SQLite index over the metadata log for filtered queries and counts
+
+    One row per image, keyed by image_path, with the scenario dimensions,
+    model and timestamp as indexed columns and the full record kept as JSON.
+    Rows are upserted, so ingesting the same record twice (live while a run
+    saves it, then again from the log) is harmless. `ingest_log` remembers
+    the byte offset it has read up to and only parses records appended since.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(f"""
+            CREATE TABLE IF NOT EXISTS images (
+                id INTEGER PRIMARY KEY,
+                image_path TEXT UNIQUE,
+                prompt_id TEXT,
+                timestamp TEXT,
+                {', '.join(f'{name} TEXT' for name in DIMENSIONS)},
+                model TEXT,
+                phash TEXT,
+                duplicate_of TEXT,
+                shard TEXT,
+                record TEXT NOT NULL
+            )
+        """)
+        for column in INDEXED:
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS images_{column} ON images({column})")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, offset INTEGER NOT NULL)")
+        self._db.commit()
+
+    def add(self, entry):
+        """Index one metadata record as it is saved."""
+        with self._lock:
+            self._db.execute(_INSERT, _row(entry))
+            self._db.commit()
+
+    def ingest_log(self, log_path, batch_size=5000):
+        """
+        Index records appended to a JSONL metadata log since the last ingest
+
+        Args:
+            log_path (str): JSONL metadata log
+            batch_size (int): Records per transaction
+
+        Returns:
+            int: Number of records ingested
+        """
+        if not os.path.exists(log_path):
+            return 0
+        source = os.path.abspath(log_path)
+        with self._lock:
+            row = self._db.execute("SELECT offset FROM sources WHERE path = ?", (source,)).fetchone()
+        offset = row[0] if row else 0
+        if os.path.getsize(log_path) < offset:
+            # The log was compacted or replaced; read it again (upserts keep rows unique)
+            offset = 0
+
+        count = 0
+        batch = []
+        with open(log_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Incomplete record still being written
+                offset += len(line)
+                try:
+                    batch.append(_row(json.loads(line)))
+                except json.JSONDecodeError:
+                    continue
+                if len(batch) >= batch_size:
+                    count += self._write_batch(batch, source, offset)
+                    batch = []
+        count += self._write_batch(batch, source, offset)
+        return count
+
+    def _write_batch(self, rows, source, offset):
+        with self._lock:
+            with self._db:
+                self._db.executemany(_INSERT, rows)
+                self._db.execute("INSERT OR REPLACE INTO sources (path, offset) VALUES (?, ?)", (source, offset))
+        return len(rows)
+
+    def _where(self, filters=None, since=None, until=None, duplicates=True):
+        clauses, params = [], []
+        for column, values in (filters or {}).items():
+            if column not in COLUMNS:
+                raise ValueError(f"Unknown column {column!r} (expected one of {', '.join(COLUMNS)})")
+            values = [values] if isinstance(values, str) else list(values)
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if not duplicates:
+            clauses.append("duplicate_of IS NULL")
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, filters=None, since=None, until=None, duplicates=True, limit=None):
+        """
+        Yield the metadata records matching every filter, oldest first
+
+        Args:
+            filters (dict): {column: value or list of values}; a list matches any of its values
+            since (str): Only records with timestamp >= since (ISO format, e.g. "2026-01-31")
+            until (str): Only records with timestamp < until
+            duplicates (bool): Include images flagged as near-duplicates
+            limit (int): Maximum number of records
+
+        Rows are streamed from the cursor on a connection of their own: a WAL
+        reader sees one snapshot and does not hold up live indexing, however
+        slowly the caller consumes them.
+        """
+        where, params = self._where(filters, since, until, duplicates)
+        sql = f"SELECT record FROM images{where} ORDER BY timestamp"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        db = sqlite3.connect(self.path)
+        try:
+            for (record,) in db.execute(sql, params):
+                yield json.loads(record)
+        finally:
+            db.close()
+
+    def counts(self, column, filters=None, since=None, until=None, duplicates=True):
+        """
+        Images per value of one column
+
+        Returns:
+            list: (value, count) pairs, most frequent first
+        """
+        if column not in COLUMNS:
+            raise ValueError(f"Unknown column {column!r} (expected one of {', '.join(COLUMNS)})")
+        where, params = self._where(filters, since, until, duplicates)
+        with self._lock:
+            return self._db.execute(f"SELECT {column}, COUNT(*) FROM images{where} GROUP BY {column} "
+                                    f"ORDER BY COUNT(*) DESC", params).fetchall()
+
+    def coverage(self, rows, columns, filters=None, since=None, until=None, duplicates=True):
+        """
+        Cross-tabulate two columns
+
+        Returns:
+            dict: {row value: {column value: count}}; combinations without images are absent
+        """
+        for column in (rows, columns):
+            if column not in COLUMNS:
+                raise ValueError(f"Unknown column {column!r} (expected one of {', '.join(COLUMNS)})")
+        where, params = self._where(filters, since, until, duplicates)
+        table = {}
+        with self._lock:
+            for row_value, column_value, count in self._db.execute(
+                    f"SELECT {rows}, {columns}, COUNT(*) FROM images{where} GROUP BY {rows}, {columns}", params):
+                table.setdefault(row_value, {})[column_value] = count
+        return table
+
+    def stats(self):
+        with self._lock:
+            images, prompts = self._db.execute("SELECT COUNT(*), COUNT(DISTINCT prompt_id) FROM images").fetchone()
+        return {"images": images, "prompts": prompts}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _parse_filters(pairs):
+    filters = {}
+    for pair in pairs:
+        column, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Filters look like column=value, got {pair!r}")
+        filters.setdefault(column.strip(), []).append(value.strip())
+    return filters
+
+
+def print_coverage(table, row_values=None, column_values=None):
+    """Print a cross-tab with every known value, so empty combinations show up as 0."""
+    row_values = list(row_values or []) + sorted(set(table) - set(row_values or []), key=str)
+    seen_columns = {value for counts in table.values() for value in counts}
+    column_values = list(column_values or []) + sorted(seen_columns - set(column_values or []), key=str)
+    width = max([len(str(value)) for value in row_values] + [8])
+    print(" " * width + "".join(f"{str(value)[:14]:>16}" for value in column_values))
+    for row_value in row_values:
+        counts = table.get(row_value, {})
+        print(f"{str(row_value):<{width}}" + "".join(f"{counts.get(value, 0):>16}" for value in column_values))
+
+
+def main():
+    from config import METADATA_LOG_FILE, METADATA_INDEX_FILE, ENVIRONMENTS, TIME_WEATHER, FS_STAGES, POVs
+
+    known_values = {"environment": ENVIRONMENTS, "time_weather": TIME_WEATHER, "fire_stage": FS_STAGES, "pov": POVs}
+
+    parser = argparse.ArgumentParser(description='Query the metadata index')
+    parser.add_argument('--index', type=str, default=METADATA_INDEX_FILE, help='SQLite index file')
+    parser.add_argument('--log', type=str, default=METADATA_LOG_FILE, help='JSONL metadata log to ingest')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('ingest', help='Index records appended to the metadata log since the last ingest')
+    query_parser = subparsers.add_parser('query', help='Print matching records as JSON lines')
+    counts_parser = subparsers.add_parser('counts', help='Images per value of one column')
+    coverage_parser = subparsers.add_parser('coverage', help='Images per combination of two columns')
+    for sub in (query_parser, counts_parser, coverage_parser):
+        sub.add_argument('--where', action='append', default=[], metavar='COLUMN=VALUE',
+                         help=f'Filter (repeatable; repeating a column matches any of its values). '
+                              f'Columns: {", ".join(COLUMNS)}')
+        sub.add_argument('--since', type=str, help='Only images saved at or after this ISO timestamp')
+        sub.add_argument('--until', type=str, help='Only images saved before this ISO timestamp')
+        sub.add_argument('--no-duplicates', action='store_true', help='Leave out images flagged as near-duplicates')
+    query_parser.add_argument('--limit', type=int, help='Maximum number of records')
+    query_parser.add_argument('--paths', action='store_true', help='Print image paths only')
+    counts_parser.add_argument('column', choices=COLUMNS)
+    coverage_parser.add_argument('rows', choices=COLUMNS)
+    coverage_parser.add_argument('columns', choices=COLUMNS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    index = MetadataIndex(args.index)
+    try:
+        # Every command first catches up with the log, so results are never staler than the last saved image
+        added = index.ingest_log(args.log)
+        if args.command == 'ingest':
+            logger.info(f"Ingested {added} records: {index.stats()}")
+            return
+        try:
+            filters = _parse_filters(args.where)
+            options = dict(filters=filters, since=args.since, until=args.until, duplicates=not args.no_duplicates)
+            if args.command == 'query':
+                for record in index.query(limit=args.limit, **options):
+                    print(record["image_path"] if args.paths else json.dumps(record, ensure_ascii=False))
+            elif args.command == 'counts':
+                for value, count in index.counts(args.column, **options):
+                    print(f"{count:>10}  {value}")
+            else:
+                print_coverage(index.coverage(args.rows, args.columns, **options),
+                               known_values.get(args.rows), known_values.get(args.columns))
+        except ValueError as e:
+            parser.error(str(e))
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
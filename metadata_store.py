@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataStore:
+    """
+    Append-only JSONL metadata log
+
+    Each record is one line, so saving an image's metadata costs a single
+    small write instead of rewriting the whole dataset. Writes are flushed
+    immediately but fsync'd in batches: after `fsync_every` records or
+    `fsync_interval` seconds after the first unsynced one, whichever comes
+    first; a timer covers the second case when no further record arrives.
+    A crash can therefore lose at most the last unsynced batch, never the
+    records before it.
+    """
+
+    def __init__(self, path, fsync_every=50, fsync_interval=5.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.time()
+        self._timer = None
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        repair_tail(path)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def append(self, entry):
+        """
+        Append one record to the log
+
+        Args:
+            entry (dict): JSON-serializable metadata record
+        """
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if (self._unsynced >= self.fsync_every
+                    or time.time() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            elif self._timer is None:
+                # Sync a quiet tail of the log too, not only once the next record arrives
+                self._timer = threading.Timer(self.fsync_interval, self._sync_due)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def sync(self):
+        """Force buffered records to disk."""
+        with self._lock:
+            self._sync()
+
+    def _sync_due(self):
+        with self._lock:
+            self._timer = None
+            if not self._file.closed:
+                self._sync()
+
+    def _sync(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._sync()
+            self._file.close()
+
+
+def repair_tail(path):
+    """
+    Drop a partially written last line left behind by a crash
+
+    Args:
+        path (str): JSONL file to check; missing files are ignored
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b"\n":
+            return
+        # Walk back to the last complete line
+        size = f.tell()
+        block = 4096
+        pos = size
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            idx = chunk.rfind(b"\n")
+            if idx != -1:
+                pos += idx + 1
+                break
+        logger.warning(f"Truncating incomplete record at end of {path} ({size - pos} bytes)")
+        f.truncate(pos)
+
+
+def iter_records(path):
+    """
+    Yield metadata records from a JSONL log, skipping unreadable lines
+
+    Args:
+        path (str): JSONL metadata file
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.error(f"Skipping corrupt metadata record at {path}:{line_number}")
+
+
+def import_legacy_json(json_path, jsonl_path):
+    """
+    Convert an old metadata.json array into the JSONL log
+
+    Args:
+        json_path (str): Legacy metadata.json file
+        jsonl_path (str): JSONL log to create
+
+    Returns:
+        int: Number of records imported
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    tmp_path = jsonl_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for entry in records:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, jsonl_path)
+    logger.info(f"Imported {len(records)} records from {json_path} into {jsonl_path}")
+    return len(records)
+
+
+def export_json(jsonl_path, json_path, indent=2):
+    """
+    Compact the JSONL log into the legacy metadata.json array format
+
+    The export is written to a temporary file and renamed into place, so an
+    interrupted export never leaves a truncated metadata.json behind.
+
+    Args:
+        jsonl_path (str): JSONL metadata log
+        json_path (str): Destination JSON file
+        indent (int): JSON indentation (default: 2, as the old format used)
+
+    Returns:
+        int: Number of records exported
+    """
+    count = 0
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for entry in iter_records(jsonl_path):
+            f.write(",\n" if count else "\n")
+            body = json.dumps(entry, indent=indent, ensure_ascii=False)
+            f.write("\n".join(" " * indent + line for line in body.split("\n")))
+            count += 1
+        f.write("\n]\n" if count else "]\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, json_path)
+    logger.info(f"Exported {count} records from {jsonl_path} to {json_path}")
+    return count
+
+
+def compact(jsonl_path):
+    """
+    Rewrite the JSONL log without corrupt or blank lines (offline only)
+
+    Args:
+        jsonl_path (str): JSONL metadata log
+
+    Returns:
+        int: Number of records kept
+    """
+    count = 0
+    tmp_path = jsonl_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for entry in iter_records(jsonl_path):
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, jsonl_path)
+    return count
+
+
+def main():
+    from config import METADATA_FILE, METADATA_LOG_FILE
+
+    parser = argparse.ArgumentParser(description='Maintain the append-only metadata log')
+    parser.add_argument('command', choices=['export', 'compact', 'import'],
+                      help='export: write metadata.json from the log; compact: drop corrupt lines; '
+                           'import: build the log from an existing metadata.json')
+    parser.add_argument('--log', type=str, default=METADATA_LOG_FILE,
+                      help='JSONL metadata log')
+    parser.add_argument('--json', type=str, default=METADATA_FILE,
+                      help='Legacy JSON metadata file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.command == 'export':
+        export_json(args.log, args.json)
+    elif args.command == 'compact':
+        logger.info(f"Kept {compact(args.log)} records in {args.log}")
+    else:
+        import_legacy_json(args.json, args.log)
+
+
+if __name__ == "__main__":
+    main()
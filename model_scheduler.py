@@ -0,0 +1,138 @@
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
+
+
+def parse_model_weights(spec):
+    """
+    Parse a --model value into (checkpoint, weight) pairs
+
+    Accepts a single checkpoint name or a comma-separated list of
+    `name:weight` entries, e.g. "sd_xl_base_1.0.safetensors:3,juggernaut.safetensors:1".
+    Entries without a weight count as 1.
+
+    Returns:
+        list: (checkpoint, weight) tuples
+    """
+    models = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, weight = entry, 1.0
+        if ":" in entry:
+            head, tail = entry.rsplit(":", 1)
+            try:
+                name, weight = head, float(tail)
+            except ValueError:
+                pass
+        if weight > 0:
+            models.append((name, weight))
+    if not models:
+        raise ValueError(f"No usable checkpoint in model list: {spec!r}")
+    return models
+
+
+class ModelMix:
+    """
+    Deterministic weighted assignment of checkpoints to jobs
+
+    Uses smooth weighted round-robin, so any window of jobs follows the
+    requested proportions closely instead of drifting like a random draw.
+    """
+
+    def __init__(self, models):
+        self.models = list(models)
+        self._current = [0.0] * len(self.models)
+        self._total = sum(weight for _, weight in self.models)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.models)
+
+    def next(self):
+        with self._lock:
+            for i, (_, weight) in enumerate(self.models):
+                self._current[i] += weight
+            best = max(range(len(self.models)), key=lambda i: self._current[i])
+            self._current[best] -= self._total
+            return self.models[best][0]
+
+
+class ModelAffinityQueue:
+    """
+    Prompt queue that hands out jobs grouped by checkpoint
+
+    A drop-in for the pipeline's FIFO prompt queue. `get` returns a job for
+    the checkpoint the next ComfyUI node already has loaded (as reported by
+    `preferred_model()`), so a node keeps rendering one model while there is
+    buffered work for it. Otherwise it switches to the model with the most
+    buffered jobs. A job that has waited longer than `max_wait` seconds is
+    served first regardless, so a rare model is never starved.
+
+    `get_nowait` only returns jobs for the checkpoint the calling thread took
+    last, so prompts packed into one workflow always share a checkpoint.
+
+    Items without a "model" key (the pipeline's end markers) are returned only
+    once no jobs are left.
+    """
+
+    def __init__(self, preferred_model=None, max_wait=600.0):
+        self.preferred_model = preferred_model or (lambda: None)
+        self.max_wait = max_wait
+        self._jobs = OrderedDict()
+        self._markers = deque()
+        self._cond = threading.Condition()
+        self._taken = threading.local()
+
+    def put(self, item):
+        with self._cond:
+            if isinstance(item, dict) and "model" in item:
+                self._jobs.setdefault(item["model"], deque()).append((time.time(), item))
+            else:
+                self._markers.append(item)
+            self._cond.notify()
+
+    def get(self):
+        with self._cond:
+            while not self._jobs and not self._markers:
+                self._cond.wait()
+            return self._take()
+
+    def get_nowait(self):
+        with self._cond:
+            if self._jobs:
+                model = getattr(self._taken, "model", None)
+                if model is not None and model not in self._jobs:
+                    raise queue.Empty
+                return self._take(model)
+            if not self._markers:
+                raise queue.Empty
+            return self._take()
+
+    def qsize(self):
+        with self._cond:
+            return sum(len(jobs) for jobs in self._jobs.values())
+
+    def _take(self, model=None):
+        if not self._jobs:
+            return self._markers.popleft()
+        if model is None:
+            model = self._choose()
+
+        _, job = self._jobs[model].popleft()
+        if not self._jobs[model]:
+            del self._jobs[model]
+        self._taken.model = model
+        return job
+
+    def _choose(self):
+        oldest_model = min(self._jobs, key=lambda model: self._jobs[model][0][0])
+        if time.time() - self._jobs[oldest_model][0][0] > self.max_wait:
+            model = oldest_model
+        else:
+            model = self.preferred_model()
+            if model not in self._jobs:
+                model = max(self._jobs, key=lambda name: len(self._jobs[name]))
+        return model
@@ -0,0 +1,196 @@
+import time
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's input queue
+_DONE = object()
+
+
+class _Gate:
+    """Counting gate whose limit is read from a callable, so it can change while threads wait."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.active >= max(1, self.limit()):
+                # Re-check periodically in case the limit was raised
+                self._cond.wait(timeout=1.0)
+            self.active += 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+
+def run_pipeline(prompts, execute, collect, prompt_queue_depth=2, max_inflight=2, collect_workers=1,
+                 start_index=0, controller=None, pack_size=1, execute_pack=None, prompt_queue=None,
+                 prepare=None):
+    """
+    Run prompt generation, ComfyUI execution and image collection concurrently
+
+    The producer stage pulls (prompt, metadata) pairs from `prompts` into a
+    bounded queue, so Llama keeps working while the GPU is busy. Up to
+    `max_inflight` executor threads each submit one workflow and wait for it,
+    which keeps ComfyUI's own queue non-empty. Finished jobs are handed to the
+    collector stage for download and metadata writing.
+
+    With a controller (see controller.AdaptiveController) both limits are
+    read from it on every job instead, and it is fed Llama and job timings.
+
+    With `pack_size` > 1 an executor takes up to that many prompts that are
+    already buffered and hands them to `execute_pack` as one workflow; it
+    never waits for a pack to fill up.
+
+    `prompt_queue` replaces the FIFO prompt buffer, e.g. with a
+    model_scheduler.ModelAffinityQueue that reorders jobs by checkpoint;
+    `prepare` fills in extra job fields (such as the checkpoint) before a
+    job is buffered.
+
+    Args:
+        prompts (iterable): Yields (prompt, metadata) tuples; a None prompt marks a failed generation.
+            Job dicts carry "llm_seconds" (time spent waiting for the prompt) and "generated_at"
+            (when it was ready for execution) for the stage functions' timings
+        execute (callable): execute(job) submits and waits for a job dict, returns True on success
+        collect (callable): collect(job) retrieves images and saves metadata, returns True on success
+        prompt_queue_depth (int): Number of generated prompts buffered ahead of execution
+        max_inflight (int): Number of workflows submitted to ComfyUI at the same time
+        collect_workers (int): Number of threads downloading images and writing metadata
+        start_index (int): Job index of the first prompt (non-zero when resuming a run)
+        controller (AdaptiveController): Adjusts both limits from observed latencies (optional)
+        pack_size (int): Maximum number of prompts executed as one workflow
+        execute_pack (callable): execute_pack(jobs) runs several jobs together, returns a list of bools
+        prompt_queue: Queue-like buffer (put/get/get_nowait) for generated jobs (default: FIFO)
+        prepare (callable): prepare(job) is called on each new job dict before it is buffered
+
+    Returns:
+        dict: Counters for generated, failed and completed jobs
+    """
+    if controller is not None:
+        executor_count = controller.max_inflight
+        inflight_gate = _Gate(lambda: controller.inflight_limit)
+        buffer_gate = _Gate(lambda: controller.prompt_depth)
+    else:
+        executor_count = max(1, max_inflight)
+        inflight_gate = _Gate(lambda: executor_count)
+        buffer_gate = _Gate(lambda: prompt_queue_depth)
+    if prompt_queue is None:
+        prompt_queue = queue.Queue()
+    result_queue = queue.Queue()
+    stats = {"generated": 0, "prompt_failures": 0, "execute_failures": 0,
+             "collect_failures": 0, "completed": 0}
+    stats_lock = threading.Lock()
+
+    def count(key):
+        with stats_lock:
+            stats[key] += 1
+
+    def produce():
+        iterator = iter(prompts)
+        index = start_index
+        try:
+            while True:
+                started = time.time()
+                try:
+                    prompt, metadata = next(iterator)
+                except StopIteration:
+                    break
+                llm_seconds = time.time() - started
+                if controller is not None:
+                    controller.observe_llm(llm_seconds)
+                index += 1
+                if not prompt:
+                    logger.error(f"Failed to generate prompt {index}")
+                    count("prompt_failures")
+                    continue
+                logger.info(f"Generated prompt {index}: {prompt}")
+                count("generated")
+                job = {"index": index - 1, "prompt": prompt, "metadata": metadata, "llm_seconds": llm_seconds,
+                       "generated_at": time.time()}
+                if prepare is not None:
+                    prepare(job)
+                buffer_gate.acquire()
+                prompt_queue.put(job)
+        except Exception as e:
+            logger.error(f"Prompt producer stopped: {e}")
+        finally:
+            for _ in range(executor_count):
+                prompt_queue.put(_DONE)
+
+    def take_pack(first):
+        jobs = [first]
+        while len(jobs) < pack_size:
+            try:
+                job = prompt_queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is _DONE:
+                prompt_queue.put(_DONE)
+                break
+            buffer_gate.release()
+            jobs.append(job)
+        return jobs
+
+    def run_executor():
+        while True:
+            inflight_gate.acquire()
+            job = prompt_queue.get()
+            if job is _DONE:
+                inflight_gate.release()
+                return
+            buffer_gate.release()
+            jobs = take_pack(job) if pack_size > 1 and execute_pack is not None else [job]
+            started = time.time()
+            try:
+                results = execute_pack(jobs) if len(jobs) > 1 else [execute(job)]
+            except Exception as e:
+                logger.error(f"Error executing prompt {job['index'] + 1}: {e}")
+                results = [False] * len(jobs)
+            inflight_gate.release()
+            if controller is not None:
+                controller.observe_job(time.time() - started, failed=not any(results))
+            for job, ok in zip(jobs, results):
+                if ok:
+                    result_queue.put(job)
+                else:
+                    logger.error(f"Failed to generate images for prompt {job['index'] + 1}")
+                    count("execute_failures")
+
+    def run_collector():
+        while True:
+            job = result_queue.get()
+            if job is _DONE:
+                return
+            try:
+                ok = collect(job)
+            except Exception as e:
+                logger.error(f"Error collecting prompt {job['index'] + 1}: {e}")
+                ok = False
+            count("completed" if ok else "collect_failures")
+
+    producer = threading.Thread(target=produce, name="prompt-producer", daemon=True)
+    executors = [threading.Thread(target=run_executor, name=f"executor-{n}", daemon=True)
+                 for n in range(executor_count)]
+    collectors = [threading.Thread(target=run_collector, name=f"collector-{n}", daemon=True)
+                  for n in range(max(1, collect_workers))]
+
+    for thread in [producer, *executors, *collectors]:
+        thread.start()
+
+    producer.join()
+    for thread in executors:
+        thread.join()
+    for _ in collectors:
+        result_queue.put(_DONE)
+    for thread in collectors:
+        thread.join()
+
+    logger.info(f"Pipeline finished: {stats}")
+    return stats
@@ -0,0 +1,192 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Pillow format name and file extension per output format
+FORMATS = {
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+    "jpg": ("JPEG", "jpg"),
+    "png": ("PNG", "png"),
+}
+
+
+def parse_sizes(spec):
+    """
+    Parse "512,768x512" into [(512, 512), (768, 512)]
+
+    Returns:
+        list: (width, height) tuples; empty keeps the original size only
+    """
+    sizes = []
+    for entry in (spec or "").split(","):
+        entry = entry.strip().lower()
+        if not entry:
+            continue
+        width, _, height = entry.partition("x")
+        sizes.append((int(width), int(height or width)))
+    return sizes
+
+
+def _save(image, path, pil_format, quality):
+    """Write an image atomically: to a temporary name first, then rename it into place."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.part"
+    options = {"quality": quality} if pil_format in ("WEBP", "JPEG") else {}
+    if pil_format == "WEBP":
+        options["method"] = 4
+    elif pil_format == "JPEG":
+        options["optimize"] = True
+    image.save(tmp_path, pil_format, **options)
+    os.replace(tmp_path, path)
+
+
+def process_image(path, output_root, formats, sizes, quality=85, thumbnail=256, delete_source=False):
+    """
+    Derive compressed, resized and thumbnail versions of one generated image
+
+    Runs in a worker process. Resized versions are center-cropped to exactly
+    the requested size; thumbnails keep the aspect ratio. Derived files go to
+    `output_root/<format>_<width>x<height>/` (or `<format>/` at full size)
+    and `output_root/thumbnails/`, named after the source image.
+
+    Args:
+        path (str): Source PNG
+        output_root (str): Directory for derived images
+        formats (list): Output formats, keys of FORMATS
+        sizes (list): (width, height) targets; empty converts at the original size
+        quality (int): WebP/JPEG quality
+        thumbnail (int): Longest thumbnail edge in pixels (0 disables thumbnails)
+        delete_source (bool): Remove the PNG once every derived file is written
+
+    Returns:
+        dict: {"derived": {name: path}, "seconds": float, "source_deleted": bool}
+    """
+    started = time.time()
+    stem = os.path.splitext(os.path.basename(path))[0]
+    derived = {}
+    with Image.open(path) as source:
+        image = source.convert("RGB")
+
+    for name in formats:
+        pil_format, extension = FORMATS[name]
+        for size in sizes or [None]:
+            if size is None:
+                variant, key = image, name
+            else:
+                variant = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+                key = f"{name}_{size[0]}x{size[1]}"
+            target = os.path.join(output_root, key, f"{stem}.{extension}")
+            _save(variant, target, pil_format, quality)
+            derived[key] = target
+
+    if thumbnail:
+        thumb = image.copy()
+        thumb.thumbnail((thumbnail, thumbnail), Image.Resampling.LANCZOS)
+        target = os.path.join(output_root, "thumbnails", f"{stem}.jpg")
+        _save(thumb, target, "JPEG", quality)
+        derived["thumbnail"] = target
+
+    deleted = False
+    if delete_source and derived:
+        os.remove(path)
+        deleted = True
+    return {"derived": derived, "seconds": time.time() - started, "source_deleted": deleted}
+
+
+def _lower_priority(nice):
+    if nice and hasattr(os, "nice"):
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+
+class PostProcessor:
+    """
+    Convert, resize and thumbnail retrieved images in a process pool
+
+    Work is submitted after images are downloaded and never waited for on
+    the generation path: `submit` returns at once and calls back with the
+    derived paths when every image of a job is done. Worker processes run at
+    a lower CPU priority (`nice`) so Llama, downloads and the pipeline
+    threads keep theirs.
+    """
+
+    def __init__(self, output_root, formats, sizes=None, quality=85, thumbnail=256, delete_source=False,
+                 max_workers=2, nice=10):
+        unknown = [name for name in formats if name not in FORMATS]
+        if unknown:
+            raise ValueError(f"Unsupported post-processing formats: {', '.join(unknown)}")
+        if delete_source and not formats and not thumbnail:
+            raise ValueError("Refusing to delete source PNGs without any derived output")
+        self.output_root = output_root
+        self.options = {"formats": list(formats), "sizes": list(sizes or []), "quality": quality,
+                        "thumbnail": thumbnail, "delete_source": delete_source}
+        self.processed = 0
+        self.failed = 0
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._executor = ProcessPoolExecutor(max_workers=max(1, max_workers), initializer=_lower_priority,
+                                             initargs=(nice,))
+        # Start the workers now rather than on the first image, while the caller has few threads
+        self._executor.submit(os.getpid).result()
+
+    def submit(self, paths, callback):
+        """
+        Queue a job's images for post-processing
+
+        Args:
+            paths (list): Image paths of one job
+            callback (callable): Called once with {path: result of process_image} when all
+                are done; failed images map to None
+        """
+        if not paths:
+            callback({})
+            return
+        results = {}
+        remaining = [len(paths)]
+        lock = threading.Lock()
+        with self._idle:
+            self._pending += 1
+
+        def done(path, future):
+            try:
+                results[path] = future.result()
+                self.processed += 1
+            except Exception as e:
+                logger.error(f"Post-processing failed for {path}: {e}")
+                results[path] = None
+                self.failed += 1
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                try:
+                    callback(results)
+                except Exception as e:
+                    logger.error(f"Post-processing callback failed: {e}")
+                finally:
+                    with self._idle:
+                        self._pending -= 1
+                        self._idle.notify_all()
+
+        for path in paths:
+            future = self._executor.submit(process_image, path, self.output_root, **self.options)
+            future.add_done_callback(lambda f, path=path: done(path, f))
+
+    def close(self, wait=True):
+        """Wait for queued work (and its callbacks) to finish and stop the worker processes."""
+        if wait:
+            with self._idle:
+                while self._pending:
+                    self._idle.wait()
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        return {"processed": self.processed, "failed": self.failed}
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# off:   always call Llama, never touch the cache
+# reuse: return a cached variant when one exists, generate only on a miss
+# fill:  generate until a key has `max_variants` variants, then reuse them
+# fresh: always call Llama, but store the result for later runs
+POLICIES = ("off", "reuse", "fill", "fresh")
+
+
+def cache_key(model, template, scenario, temperature):
+    """
+    Hash the inputs that determine a Llama generation
+
+    Args:
+        model (str): Llama model name
+        template (str): The system/user prompt template the text is rendered from
+        scenario (dict): Scenario tuple or custom topic the prompt is about
+        temperature (float): Sampling temperature
+
+    Returns:
+        str: Hex digest identifying the cache key
+    """
+    material = json.dumps([model, template, scenario, temperature], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """
+    On-disk cache of Llama prompt generations, up to `max_variants` per key
+
+    Entries older than `max_age_days` are dropped when the cache is opened,
+    and the least recently used entries are dropped once the cache holds
+    more than `max_entries` prompts.
+    """
+
+    def __init__(self, path, policy="fill", max_variants=3, max_entries=100000, max_age_days=30):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown prompt cache policy: {policy}")
+        self.path = path
+        self.policy = policy
+        self.max_variants = max(1, max_variants)
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS prompts (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL,
+                scenario TEXT,
+                prompt TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                uses INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS prompts_key ON prompts(key)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS prompts_last_used ON prompts(last_used)")
+        self._db.commit()
+        self.evict()
+
+    def get_or_generate(self, key, scenario, generate):
+        """
+        Return a prompt for `key`, calling `generate()` when the policy requires it
+
+        Args:
+            key (str): Value from cache_key
+            scenario (dict): Stored alongside the prompt for inspection
+            generate (callable): Produces a fresh prompt string, or None on failure
+
+        Returns:
+            str: The prompt, or None if generation failed and nothing was cached
+        """
+        if self.policy == "off":
+            return generate()
+
+        prompt = self.lookup(key)
+        if prompt:
+            return prompt
+
+        prompt = generate()
+        if prompt:
+            self.put(key, scenario, prompt)
+            return prompt
+
+        variants = self._variants(key)
+        if variants:
+            logger.warning("Llama generation failed, falling back to a cached prompt")
+            return self._use(variants)
+        return None
+
+    def lookup(self, key):
+        """
+        Return a cached prompt if the policy allows reusing one for `key`
+
+        Args:
+            key (str): Value from cache_key
+
+        Returns:
+            str: A cached prompt, or None when a fresh generation is needed
+        """
+        if self.policy == "off":
+            return None
+        variants = self._variants(key)
+        if (self.policy == "fresh"
+                or not variants
+                or (self.policy == "fill" and len(variants) < self.max_variants)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._use(variants)
+
+    def _use(self, variants):
+        # Prefer the least used variant so reuse spreads across all of them
+        least = min(uses for _, _, uses in variants)
+        row_id, prompt, _ = random.choice([v for v in variants if v[2] == least])
+        with self._lock:
+            self._db.execute("UPDATE prompts SET uses = uses + 1, last_used = ? WHERE id = ?",
+                             (time.time(), row_id))
+            self._db.commit()
+        return prompt
+
+    def _variants(self, key):
+        with self._lock:
+            return self._db.execute("SELECT id, prompt, uses FROM prompts WHERE key = ?", (key,)).fetchall()
+
+    def put(self, key, scenario, prompt):
+        """
+        Store a freshly generated prompt, keeping only the newest max_variants for its key
+
+        Args:
+            key (str): Value from cache_key
+            scenario (dict): Scenario or topic the prompt was generated for
+            prompt (str): The generated prompt
+        """
+        if self.policy == "off":
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO prompts (key, scenario, prompt, created, last_used, uses) VALUES (?, ?, ?, ?, ?, 1)",
+                (key, json.dumps(scenario, ensure_ascii=False), prompt, now, now))
+            self._db.execute("""
+                DELETE FROM prompts WHERE key = ? AND id NOT IN (
+                    SELECT id FROM prompts WHERE key = ? ORDER BY created DESC LIMIT ?
+                )
+            """, (key, key, self.max_variants))
+            self._db.commit()
+
+    def evict(self):
+        """Drop entries past max_age_days, then least recently used ones beyond max_entries."""
+        with self._lock:
+            removed = 0
+            if self.max_age_days:
+                cutoff = time.time() - self.max_age_days * 86400
+                removed += self._db.execute("DELETE FROM prompts WHERE created < ?", (cutoff,)).rowcount
+            if self.max_entries:
+                removed += self._db.execute("""
+                    DELETE FROM prompts WHERE id IN (
+                        SELECT id FROM prompts ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,)).rowcount
+            self._db.commit()
+        if removed:
+            logger.info(f"Evicted {removed} entries from prompt cache {self.path}")
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM prompts").fetchone()
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
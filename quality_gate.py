@@ -0,0 +1,197 @@
+import os
+import logging
+import argparse
+import importlib
+import threading
+from collections import Counter
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+# Images are scored on a thumbnail of at most this many pixels per side, so
+# thresholds mean the same for a half-size draft and a full-size image
+SCORE_SIZE = 256
+
+# 3x3 Laplacian; the offset keeps negative responses from being clipped to zero
+_LAPLACIAN = ImageFilter.Kernel((3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0], scale=1, offset=128)
+
+
+def fire_smoke_share(image):
+    """
+    Share of pixels with flame or smoke colours
+
+    Flame pixels are bright, saturated reds to yellows; smoke pixels are
+    unsaturated greys of medium brightness. A wildfire scene without either
+    is most likely a failed render.
+
+    Args:
+        image (PIL.Image): RGB image
+
+    Returns:
+        float: Fraction of matching pixels (0-1)
+    """
+    hue, saturation, value = image.convert("HSV").split()
+    # Per-band masks (255 where the condition holds); Pillow's HSV bands are 0-255, hue 30 is about 42 degrees
+    mask = lambda band, low, high: band.point(lambda v: 255 if low <= v <= high else 0)
+    flame = ImageChops.multiply(ImageChops.multiply(mask(hue, 0, 30), mask(saturation, 100, 255)),
+                                mask(value, 150, 255))
+    smoke = ImageChops.multiply(mask(saturation, 0, 40), mask(value, 80, 220))
+    return ImageStat.Stat(ImageChops.lighter(flame, smoke)).mean[0] / 255
+
+
+def sharpness(image):
+    """
+    Variance of the Laplacian of the grayscale image
+
+    Blurry or washed-out images have few edges and score close to zero.
+
+    Args:
+        image (PIL.Image): RGB image
+
+    Returns:
+        float: Laplacian variance (0-16256)
+    """
+    return ImageStat.Stat(image.convert("L").filter(_LAPLACIAN)).var[0]
+
+
+def brightness(image):
+    """Mean grayscale value (0-255); catches black or blown-out frames."""
+    return ImageStat.Stat(image.convert("L")).mean[0]
+
+
+FILTERS = {
+    "fire": fire_smoke_share,
+    "sharpness": sharpness,
+    "brightness": brightness,
+}
+
+
+def load_filter(name):
+    """
+    Look up a scoring function by name
+
+    Args:
+        name (str): A key of FILTERS, or the dotted path of a function such as
+            "my_filters.aesthetic_score" that takes a PIL image and returns a float
+
+    Returns:
+        callable: The scoring function
+    """
+    if name in FILTERS:
+        return FILTERS[name]
+    module_name, _, function_name = name.rpartition(".")
+    if not module_name:
+        raise ValueError(f"Unknown quality filter {name!r} (expected one of {', '.join(FILTERS)} or module.function)")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def parse_filters(spec):
+    """
+    Parse a filter spec such as "fire:0.05,sharpness:100"
+
+    Args:
+        spec (str): Comma-separated name:threshold pairs; an image passes when
+            every score is at least its threshold
+
+    Returns:
+        dict: {filter name: threshold}
+    """
+    thresholds = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, separator, threshold = part.rpartition(":")
+        if not separator or not name:
+            raise ValueError(f"Expected name:threshold in quality filter spec, got {part!r}")
+        thresholds[name.strip()] = float(threshold)
+    return thresholds
+
+
+class QualityGate:
+    """
+    Score images with cheap CPU filters and pass those that reach every threshold
+
+    Args:
+        thresholds (dict): {filter name: minimum score}, see parse_filters and load_filter
+    """
+
+    def __init__(self, thresholds):
+        self.filters = [(name, load_filter(name), threshold) for name, threshold in thresholds.items()]
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def score(self, source):
+        """
+        Score one image
+
+        Args:
+            source (str or file): Image path or file object
+
+        Returns:
+            dict: {filter name: score}
+        """
+        with Image.open(source) as image:
+            image = image.convert("RGB")
+        image.thumbnail((SCORE_SIZE, SCORE_SIZE))
+        return {name: round(float(function(image)), 4) for name, function, _ in self.filters}
+
+    def check(self, source):
+        """
+        Score an image and decide whether it passes
+
+        Returns:
+            tuple: (passed, scores); unreadable images fail with empty scores
+        """
+        try:
+            scores = self.score(source)
+        except Exception as e:
+            logger.warning(f"Could not score {source}: {e}")
+            with self._lock:
+                self.counts["unreadable"] += 1
+                self.counts["rejected"] += 1
+            return False, {}
+        failed = [name for name, _, threshold in self.filters if scores[name] < threshold]
+        with self._lock:
+            self.counts["checked"] += 1
+            self.counts["rejected" if failed else "passed"] += 1
+            for name in failed:
+                self.counts[f"failed_{name}"] += 1
+        return not failed, scores
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+def iter_images(paths):
+    """Yield image files from a list of files and directories."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score images with the draft quality filters, e.g. to pick '
+                                                 'CASCADE_FILTERS thresholds')
+    parser.add_argument('paths', nargs='+', help='Images or directories of images')
+    parser.add_argument('--filters', type=str, default="fire:0.05,sharpness:100",
+                        help='Comma-separated name:threshold pairs (filters: ' + ", ".join(FILTERS) + ')')
+    args = parser.parse_args()
+
+    gate = QualityGate(parse_filters(args.filters))
+    for path in iter_images(args.paths):
+        passed, scores = gate.check(path)
+        print(f"{'pass' if passed else 'FAIL'}  {path}  " + "  ".join(f"{k}={v}" for k, v in scores.items()))
+    print(gate.stats())
+
+
+if __name__ == "__main__":
+    main()
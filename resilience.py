@@ -0,0 +1,268 @@
+import time
+import queue
+import random
+import logging
+import threading
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class DeadlineExceeded(TimeoutError):
+    """A call did not finish before its deadline."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Every endpoint's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stop sending work to an endpoint that keeps failing
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    rejects calls for `reset_timeout` seconds. It then lets a single trial
+    call through (half-open): success closes it again, failure re-opens it
+    for another `reset_timeout`.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def available(self, now=None):
+        """Whether a call would be allowed right now, without claiming the half-open trial."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return (now or time.time()) - self.opened_at >= self.reset_timeout
+            return not self._trial
+
+    def allow(self):
+        """Claim permission for one call; in the half-open state only one caller gets it."""
+        with self._lock:
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"Circuit for {self.name} closed again")
+            self.state = CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.time()
+                self.trips += 1
+                self._trial = False
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failures; "
+                               f"retrying in {self.reset_timeout:.0f}s")
+
+
+class LatencyTracker:
+    """Recent call latencies, for quantiles such as the hedging threshold."""
+
+    def __init__(self, window=200, min_samples=10):
+        self.min_samples = min_samples
+        self._values = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._values.append(seconds)
+
+    def quantile(self, q, default=None):
+        """Nearest-rank quantile of the window, or `default` until `min_samples` calls were seen."""
+        with self._lock:
+            if len(self._values) < self.min_samples:
+                return default
+            ordered = sorted(self._values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def backoff_delay(attempt, base=1.0, maximum=30.0):
+    """Full-jitter exponential backoff: uniform in [0, min(maximum, base * 2^attempt)]."""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+class HedgedClient:
+    """
+    Call one of several equivalent endpoints with deadlines, hedging, retries and circuit breakers
+
+    `call(url, *args, cancel=event, deadline=timestamp)` does the actual
+    request; it should give up once `cancel` is set or `deadline` passes.
+    Each call runs against the first endpoint whose breaker allows it. If
+    that has not answered after the `hedge_quantile` of recent latencies,
+    the same call is also sent to the next endpoint and the first answer
+    wins; the loser is cancelled. A failed request immediately fails over to
+    the next endpoint. When every endpoint failed, the call is retried with
+    jittered exponential backoff, up to `attempts` times, all within
+    `timeout` seconds.
+
+    Args:
+        endpoints (list): Endpoint URLs, most preferred first
+        call (callable): call(url, *args, cancel=..., deadline=...) -> result
+        timeout (float): Deadline of a whole call, including hedges and retries
+        attempts (int): Rounds over the endpoints before giving up
+        hedge_quantile (float): Latency quantile after which a hedge is sent
+        min_hedge_delay (float): Never hedge earlier than this many seconds
+        max_hedges (int): Extra concurrent requests per round
+        backoff (float): Base delay of the retry backoff
+        failure_threshold (int): Consecutive failures that open an endpoint's breaker
+        reset_timeout (float): Seconds an open breaker rejects calls
+    """
+
+    def __init__(self, endpoints, call, timeout=120.0, attempts=3, hedge_quantile=0.95, min_hedge_delay=1.0,
+                 max_hedges=1, backoff=1.0, failure_threshold=5, reset_timeout=30.0):
+        self.endpoints = list(dict.fromkeys(endpoints))
+        self.call_fn = call
+        self.timeout = timeout
+        self.attempts = max(1, attempts)
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedges = max_hedges
+        self.backoff = backoff
+        self.breakers = {url: CircuitBreaker(url, failure_threshold, reset_timeout) for url in self.endpoints}
+        self.latency = LatencyTracker()
+        self.counts = Counter()
+        # Rounds, their request threads and concurrent callers all update the counts
+        self._lock = threading.Lock()
+
+    def hedge_delay(self):
+        """Seconds to wait for the first request before hedging, or None while there is too little history."""
+        threshold = self.latency.quantile(self.hedge_quantile)
+        return None if threshold is None else max(self.min_hedge_delay, threshold)
+
+    def call(self, *args):
+        """
+        Run the call with the resilience policy
+
+        Returns:
+            The first successful result
+
+        Raises:
+            DeadlineExceeded, CircuitOpenError or the last request's exception
+        """
+        deadline = time.time() + self.timeout
+        self._count("calls")
+        last_error = None
+        for attempt in range(self.attempts):
+            if attempt:
+                delay = min(backoff_delay(attempt - 1, self.backoff), deadline - time.time())
+                if delay <= 0:
+                    break
+                self._count("retries")
+                logger.warning(f"Retrying in {delay:.1f}s after: {last_error}")
+                time.sleep(delay)
+            try:
+                return self._round(args, deadline)
+            except DeadlineExceeded:
+                self._count("deadline_exceeded")
+                raise
+            except Exception as e:
+                last_error = e
+        self._count("failures")
+        raise last_error or DeadlineExceeded(f"No attempt finished within {self.timeout:.0f}s")
+
+    def _next_endpoint(self, used):
+        for url in self.endpoints:
+            if url not in used and self.breakers[url].allow():
+                return url
+        return None
+
+    def _round(self, args, deadline):
+        """One pass over the endpoints: the first request plus hedges and failovers."""
+        cancel = threading.Event()
+        results = queue.Queue()
+        used = []
+
+        def run(url, started):
+            try:
+                result = self.call_fn(url, *args, cancel=cancel, deadline=deadline)
+            except Exception as e:
+                if not cancel.is_set():
+                    self.breakers[url].failure()
+                results.put((url, None, e))
+                return
+            self.breakers[url].success()
+            self.latency.add(time.time() - started)
+            results.put((url, result, None))
+
+        def launch():
+            url = self._next_endpoint(used)
+            if url is None:
+                return False
+            used.append(url)
+            threading.Thread(target=run, args=(url, time.time()), name="hedged-call", daemon=True).start()
+            return True
+
+        if not launch():
+            self._count("rejected")
+            raise CircuitOpenError(f"All endpoints are unavailable: {', '.join(self.endpoints)}")
+        pending, hedges, last_error = 1, 0, None
+        hedge_delay = self.hedge_delay()
+        hedge_at = time.time() + hedge_delay if hedge_delay is not None else None
+        try:
+            while pending:
+                now = time.time()
+                wake = deadline
+                if hedge_at is not None and hedges < self.max_hedges:
+                    wake = min(wake, hedge_at)
+                try:
+                    url, result, error = results.get(timeout=max(0.0, wake - now))
+                except queue.Empty:
+                    if time.time() >= deadline:
+                        raise DeadlineExceeded(f"No answer from {', '.join(used)} within the deadline")
+                    hedges += 1
+                    if launch():
+                        pending += 1
+                        self._count("hedges")
+                        logger.info(f"Hedging to {used[-1]} after {hedge_delay:.1f}s without an answer")
+                    continue
+                pending -= 1
+                if error is None:
+                    if url != used[0]:
+                        self._count("hedge_wins")
+                    return result
+                last_error = error
+                logger.warning(f"Request to {url} failed: {error}")
+                if launch():
+                    pending += 1
+                    self._count("failovers")
+        finally:
+            cancel.set()
+        raise last_error
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        return dict(counts, breaker_trips={url: b.trips for url, b in self.breakers.items() if b.trips},
+                    hedge_delay=self.hedge_delay())
@@ -0,0 +1,319 @@
+import os
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; reflinks fall back to a plain copy
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+
+# How co-located images are brought into the dataset (see LocalOutputs)
+TRANSFER_METHODS = ("hardlink", "reflink", "move", "copy")
+
+# Linux ioctl that makes a file share another file's blocks copy-on-write (btrfs, XFS)
+FICLONE = 0x40049409
+
+# Images fetched per way ("http", "hardlink", "reflink", "move", "copy") since the process started
+_transfers = Counter()
+_transfers_lock = threading.Lock()
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size=16):
+    """
+    Return the process-wide keep-alive session used for /view downloads
+
+    Args:
+        pool_size (int): Connections kept open per ComfyUI host
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def output_images(outputs, node_ids=None):
+    """
+    Flatten ComfyUI node outputs into a list of image entries
+
+    Args:
+        outputs (dict): {node_id: output} from the WebSocket or /history
+        node_ids (list): Take these nodes' images, in this order (default: every node, in the
+            order the outputs arrived, which is execution order rather than node id order)
+
+    Returns:
+        list: (node_id, image_info) tuples, each node's images in batch order
+    """
+    images = []
+    for node_id in (outputs if node_ids is None else node_ids):
+        for image_info in outputs.get(node_id, {}).get("images", []):
+            images.append((node_id, image_info))
+    return images
+
+
+def download_image(base_url, image_info, dest_path, session=None, timeout=(5, 120)):
+    """
+    Stream one image from ComfyUI's /view endpoint to disk
+
+    The body is written in chunks to a temporary file next to `dest_path`
+    and renamed over it once complete, so a failed download never leaves a
+    truncated image under the final name.
+
+    Args:
+        base_url (str): ComfyUI server the image lives on
+        image_info (dict): Entry from a node's "images" output (filename, subfolder, type)
+        dest_path (str): Where to save the image
+        session (requests.Session): Session to use (default: the shared session)
+        timeout (tuple): Connect and read timeouts in seconds
+
+    Returns:
+        str: dest_path
+    """
+    session = session or get_session()
+    params = {
+        "filename": image_info["filename"],
+        "subfolder": image_info.get("subfolder", ""),
+        "type": image_info.get("type", "output"),
+    }
+    logger.info(f"Attempting to retrieve image {params['filename']} from {base_url}")
+
+    directory = os.path.dirname(dest_path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".download-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            with session.get(f"{base_url}/view", params=params, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    logger.info(f"Successfully saved image to {dest_path}")
+    return dest_path
+
+
+def _count(method):
+    with _transfers_lock:
+        _transfers[method] += 1
+
+
+def transfer_stats():
+    """Images fetched over HTTP and through the filesystem, by method."""
+    with _transfers_lock:
+        return dict(_transfers)
+
+
+def _reflink(src, dest):
+    if fcntl is None:
+        raise OSError("reflinks are not supported on this platform")
+    with open(src, "rb") as source, open(dest, "wb") as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+
+
+class LocalOutputs:
+    """
+    A ComfyUI node's output and temp directories as seen from this machine
+
+    When ComfyUI runs on the same host or writes to a shared mount, its
+    images can be taken straight from disk instead of over HTTP. `method`
+    decides how: "hardlink" adds a second name for the same file, "reflink"
+    makes a copy-on-write clone, "move" renames the file out of ComfyUI's
+    output directory and "copy" copies it. If the preferred way is not
+    possible (e.g. a hardlink across filesystems) the next cheaper one is
+    used, down to a plain copy.
+
+    Args:
+        output_root (str): ComfyUI's output directory (SaveImage)
+        temp_root (str): ComfyUI's temp directory (PreviewImage); default: "temp" next to output_root
+        method (str): One of TRANSFER_METHODS
+    """
+
+    # Ways tried in order for each method
+    FALLBACKS = {
+        "hardlink": ("hardlink", "reflink", "copy"),
+        "reflink": ("reflink", "copy"),
+        "move": ("move", "reflink", "copy"),
+        "copy": ("copy",),
+    }
+
+    def __init__(self, output_root, temp_root=None, method="hardlink"):
+        if method not in TRANSFER_METHODS:
+            raise ValueError(f"Unknown transfer method {method!r} (expected one of {', '.join(TRANSFER_METHODS)})")
+        self.roots = {
+            "output": os.path.realpath(output_root),
+            "temp": os.path.realpath(temp_root or os.path.join(os.path.dirname(os.path.abspath(output_root)), "temp")),
+        }
+        self.method = method
+
+    def path_for(self, image_info):
+        """
+        Local path of an image from a node's outputs
+
+        Returns:
+            str: The file's path, or None if it is not under the node's directories or does not exist
+        """
+        root = self.roots.get(image_info.get("type", "output"))
+        if root is None:
+            return None
+        path = os.path.realpath(os.path.join(root, image_info.get("subfolder", ""), image_info["filename"]))
+        # Never follow a subfolder or filename outside of ComfyUI's directories
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            return None
+        return path
+
+    def transfer(self, src, dest_path):
+        """
+        Bring a local ComfyUI image to dest_path
+
+        The new file appears under its final name only once complete.
+
+        Returns:
+            str: The way it was done ("hardlink", "reflink", "move" or "copy")
+
+        Raises:
+            OSError: When even a plain copy failed
+        """
+        directory = os.path.dirname(dest_path) or "."
+        for way in self.FALLBACKS[self.method]:
+            if way == "move":
+                try:
+                    os.replace(src, dest_path)
+                    return way
+                except OSError as e:
+                    logger.debug(f"Cannot rename {src} to {dest_path}: {e}")
+                    continue
+            tmp_path = os.path.join(directory, f".transfer-{uuid.uuid4().hex}.part")
+            try:
+                if way == "hardlink":
+                    os.link(src, tmp_path)
+                elif way == "reflink":
+                    _reflink(src, tmp_path)
+                else:
+                    shutil.copyfile(src, tmp_path)
+                os.replace(tmp_path, dest_path)
+            except OSError as e:
+                if way == "copy":
+                    raise
+                logger.debug(f"Cannot {way} {src} to {dest_path}: {e}")
+                continue
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            if self.method == "move":
+                # The rename crossed filesystems; finish the move
+                os.remove(src)
+            return way
+        raise OSError(f"Could not transfer {src}")
+
+
+def parse_output_roots(spec):
+    """
+    Parse COMFYUI_OUTPUT_ROOT
+
+    Args:
+        spec (str): One directory for every node, or comma-separated
+            base_url=directory pairs for nodes with different paths
+
+    Returns:
+        dict: {base_url: directory}, with "*" for the directory shared by all nodes
+    """
+    roots = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        url, separator, directory = part.rpartition("=")
+        roots[url.strip().rstrip("/") if separator else "*"] = directory.strip()
+    return roots
+
+
+def fetch_image(base_url, image_info, dest_path, local=None):
+    """
+    Save one image from ComfyUI, through the filesystem when it is reachable and over /view otherwise
+
+    Args:
+        base_url (str): ComfyUI server the image lives on
+        image_info (dict): Entry from a node's "images" output (filename, subfolder, type)
+        dest_path (str): Where to save the image
+        local (LocalOutputs): The node's directories on this machine, if co-located
+
+    Returns:
+        str: dest_path
+    """
+    src = local.path_for(image_info) if local is not None else None
+    if src is not None:
+        try:
+            way = local.transfer(src, dest_path)
+            _count(way)
+            logger.info(f"Took {image_info['filename']} from {src} ({way})")
+            return dest_path
+        except OSError as e:
+            logger.warning(f"Could not take {src} from disk, downloading it instead: {e}")
+    download_image(base_url, image_info, dest_path)
+    _count("http")
+    return dest_path
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(max_workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download")
+        return _executor
+
+
+def download_images(base_url, images, dest_paths, max_workers=4, local=None):
+    """
+    Download a batch of images concurrently
+
+    Args:
+        base_url (str): ComfyUI server the images live on
+        images (list): image_info dicts, as in a node's "images" output
+        dest_paths (list): Destination path for each image
+        max_workers (int): Size of the shared download thread pool
+        local (LocalOutputs): Take images from these directories when they are there (see fetch_image)
+
+    Returns:
+        list: Saved paths, in input order; failed downloads are omitted
+    """
+    if len(images) > 1:
+        executor = _get_executor(max_workers)
+        futures = [executor.submit(fetch_image, base_url, info, path, local)
+                   for info, path in zip(images, dest_paths)]
+        fetch = lambda i: futures[i].result()
+    else:
+        # A single image is not worth a thread hop
+        fetch = lambda i: fetch_image(base_url, images[i], dest_paths[i], local)
+
+    results = []
+    for i, info in enumerate(images):
+        try:
+            results.append(fetch(i))
+        except Exception as e:
+            logger.error(f"Error retrieving image {info.get('filename')}: {e}")
+    return results
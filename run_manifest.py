@@ -0,0 +1,104 @@
+import os
+import time
+import logging
+from metadata_store import MetadataStore, iter_records
+
+logger = logging.getLogger(__name__)
+
+# Job states, in the order a job moves through them
+GENERATED = "generated"
+SUBMITTED = "submitted"
+RETRIEVED = "retrieved"
+WRITTEN = "written"
+# A generated job that was handed to a new job key when the run was resumed
+REQUEUED = "requeued"
+
+
+class RunManifest:
+    """
+    Durable per-run record of every job's progress
+
+    The manifest is an append-only JSONL file. The first record holds the
+    run's parameters; every other record is a state transition for one job
+    (prompt generated -> submitted with its prompt_id -> images retrieved ->
+    metadata written). Each record is fsync'd before the run moves on, so
+    after a crash the manifest says exactly which work can be skipped,
+    which prompt_ids to collect from ComfyUI and which prompts to resubmit.
+    """
+
+    def __init__(self, path, params=None):
+        self.path = path
+        self.params = params or {}
+        self.jobs = {}
+
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self._store = MetadataStore(path, fsync_every=1)
+        if exists:
+            self._load()
+        else:
+            self._store.append({"run": self.params, "t": time.time()})
+
+    @classmethod
+    def path_for(cls, runs_dir, run_id):
+        """Resolve a run id (or an explicit manifest path) to a manifest file."""
+        if os.path.exists(run_id) or run_id.endswith(".jsonl"):
+            return run_id
+        return os.path.join(runs_dir, f"{run_id}.jsonl")
+
+    def _load(self):
+        for record in iter_records(self.path):
+            if "run" in record:
+                self.params = record["run"]
+                continue
+            job = self.jobs.setdefault(record["job"], {})
+            job.update({k: v for k, v in record.items() if k not in ("job", "t")})
+        logger.info(f"Loaded run manifest {self.path}: {self.counts()}")
+
+    def record(self, key, state, **fields):
+        """
+        Append a state transition for one job
+
+        Args:
+            key (int): Job index within the run
+            state (str): New state (GENERATED, SUBMITTED, RETRIEVED, WRITTEN, REQUEUED)
+            **fields: State-specific data, e.g. prompt_id or image_paths
+        """
+        self.jobs.setdefault(key, {}).update(fields, state=state)
+        self._store.append({"job": key, "state": state, "t": time.time(), **fields})
+
+    def track(self, prompts, start_index):
+        """
+        Record each generated prompt as it passes through
+
+        Args:
+            prompts (iterable): (prompt, metadata) pairs
+            start_index (int): Job key of the first prompt
+
+        Yields:
+            tuple: The same (prompt, metadata) pairs
+        """
+        for offset, (prompt, metadata) in enumerate(prompts):
+            if prompt:
+                self.record(start_index + offset, GENERATED, prompt=prompt, metadata=metadata)
+            yield prompt, metadata
+
+    def next_index(self):
+        return max(self.jobs, default=-1) + 1
+
+    def in_state(self, *states):
+        """Return (key, job) pairs currently in any of the given states."""
+        return [(key, job) for key, job in sorted(self.jobs.items()) if job.get("state") in states]
+
+    def active_count(self):
+        """Jobs that still stand for a prompt of the run (requeued ones were replaced)."""
+        return sum(1 for job in self.jobs.values() if job.get("state") != REQUEUED)
+
+    def counts(self):
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.get("state")] = counts.get(job.get("state"), 0) + 1
+        return counts
+
+    def close(self):
+        self._store.close()
+
@@ -0,0 +1,267 @@
+import os
+import json
+import heapq
+import random
+import logging
+import itertools
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("random", "stratified", "pairwise", "lhs")
+
+# Random candidates scored per pick by the pairwise strategy
+PAIRWISE_CANDIDATES = 64
+
+
+class CoverageIndex:
+    """
+    How many prompts each scenario cell already has in the dataset
+
+    Counts are built from the metadata log and saved with the byte offset
+    they cover, so each run only reads records appended since the last one.
+    A prompt with several images counts once.
+    """
+
+    def __init__(self, dimensions, path=None):
+        self.dimensions = list(dimensions)
+        self.path = path
+        self.cells = Counter()
+        self.log_offset = 0
+        self._pairs = None
+
+    @classmethod
+    def load(cls, dimensions, path):
+        index = cls(dimensions, path)
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("dimensions") == index.dimensions:
+                    index.cells = Counter({tuple(k.split("|")): v for k, v in data.get("cells", {}).items()})
+                    index.log_offset = data.get("log_offset", 0)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Rebuilding coverage index, could not read {path}: {e}")
+        return index
+
+    def update_from_log(self, log_path):
+        """
+        Count scenarios from metadata records appended since the last update
+
+        Args:
+            log_path (str): JSONL metadata log
+
+        Returns:
+            int: Number of new prompts counted
+        """
+        if not os.path.exists(log_path):
+            return 0
+        if os.path.getsize(log_path) < self.log_offset:
+            # The log was compacted or replaced; start over
+            self.cells.clear()
+            self.log_offset = 0
+
+        added = 0
+        seen = set()
+        with open(log_path, "rb") as f:
+            f.seek(self.log_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Incomplete record still being written
+                self.log_offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                cell = self.cell_of(entry.get("metadata") or {})
+                prompt_id = entry.get("prompt_id")
+                if cell is None or (prompt_id, cell) in seen:
+                    continue
+                seen.add((prompt_id, cell))
+                self.cells[cell] += 1
+                added += 1
+        self._pairs = None
+        return added
+
+    def cell_of(self, scenario):
+        try:
+            return tuple(scenario[name] for name in self.dimensions)
+        except KeyError:
+            return None
+
+    def add(self, scenario, count=1):
+        cell = self.cell_of(scenario)
+        self.cells[cell] += count
+        if self._pairs is not None:
+            for pair in self._pairs_of(cell):
+                self._pairs[pair] += count
+
+    def pair_counts(self):
+        if self._pairs is None:
+            self._pairs = Counter()
+            for cell, count in self.cells.items():
+                for pair in self._pairs_of(cell):
+                    self._pairs[pair] += count
+        return self._pairs
+
+    @staticmethod
+    def _pairs_of(cell):
+        return [((i, cell[i]), (j, cell[j])) for i, j in itertools.combinations(range(len(cell)), 2)]
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "dimensions": self.dimensions,
+                "log_offset": self.log_offset,
+                "cells": {"|".join(cell): count for cell, count in self.cells.items()},
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def summary(self, values):
+        total = 1
+        for name in self.dimensions:
+            total *= len(values[name])
+        covered = sum(1 for cell, count in self.cells.items() if count > 0)
+        return {"cells": total, "covered": covered, "prompts": sum(self.cells.values())}
+
+
+class ScenarioSampler:
+    """
+    Choose scenario tuples so a run fills under-represented parts of the grid first
+
+    Strategies:
+        random      independent weighted choice per dimension (the old behaviour)
+        stratified  always take the cell with the lowest count relative to its weight
+        pairwise    greedily cover every pair of dimension values evenly
+        lhs         Latin hypercube: each dimension's values are spread evenly
+                    over a planned block, least covered values first
+
+    Per-dimension weights scale how often a value should appear; values
+    without a weight default to 1.
+    """
+
+    def __init__(self, values, strategy="stratified", weights=None, index=None, seed=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown sampling strategy: {strategy}")
+        self.values = values
+        self.dimensions = list(values)
+        self.strategy = strategy
+        self.weights = {
+            name: [float((weights or {}).get(name, {}).get(value, 1.0)) for value in values[name]]
+            for name in self.dimensions
+        }
+        self.index = index or CoverageIndex(self.dimensions)
+        self.rng = random.Random(seed)
+        self._planned = deque()
+
+    def plan(self, n):
+        """Precompute the next n scenarios (needed by lhs, which spreads values over a block)."""
+        self._planned.extend(self.sample(n))
+
+    def next(self):
+        """Return the next scenario, from the current plan if there is one."""
+        if self._planned:
+            return self._planned.popleft()
+        return self.sample(1)[0]
+
+    def sample(self, n):
+        """
+        Draw n scenarios; each is counted in the index so later draws account for it
+
+        Returns:
+            list: Scenario dicts keyed by dimension name
+        """
+        if self.strategy == "random":
+            cells = (self._random_cell() for _ in range(n))
+        elif self.strategy == "stratified":
+            cells = self._stratified(n)
+        elif self.strategy == "pairwise":
+            # Lazy, so each pick is scored against the index including the picks before it
+            cells = (self._pairwise_cell() for _ in range(n))
+        else:
+            cells = self._latin_hypercube(n)
+
+        scenarios = []
+        for cell in cells:
+            scenario = dict(zip(self.dimensions, cell))
+            self.index.add(scenario)
+            scenarios.append(scenario)
+        return scenarios
+
+    def _random_cell(self):
+        return tuple(self.rng.choices(self.values[name], weights=self.weights[name])[0]
+                     for name in self.dimensions)
+
+    def _cell_weight(self, indices):
+        weight = 1.0
+        for name, i in zip(self.dimensions, indices):
+            weight *= self.weights[name][i]
+        return weight
+
+    def _stratified(self, n):
+        # Priority = (count + 1) / weight: low counts and high weights come first
+        heap = []
+        ranges = [range(len(self.values[name])) for name in self.dimensions]
+        for indices in itertools.product(*ranges):
+            weight = self._cell_weight(indices)
+            if weight <= 0:
+                continue
+            cell = tuple(self.values[name][i] for name, i in zip(self.dimensions, indices))
+            count = self.index.cells.get(cell, 0)
+            heap.append(((count + 1) / weight, self.rng.random(), cell, weight))
+        heapq.heapify(heap)
+
+        cells = []
+        for _ in range(n):
+            priority, _, cell, weight = heapq.heappop(heap)
+            cells.append(cell)
+            heapq.heappush(heap, (priority + 1 / weight, self.rng.random(), cell, weight))
+        return cells
+
+    def _pairwise_cell(self):
+        pairs = self.index.pair_counts()
+        best, best_score = None, -1.0
+        for _ in range(PAIRWISE_CANDIDATES):
+            cell = self._random_cell()
+            score = sum(1.0 / (1 + pairs.get(pair, 0)) for pair in CoverageIndex._pairs_of(cell))
+            if score > best_score:
+                best, best_score = cell, score
+        return best
+
+    def _latin_hypercube(self, n):
+        columns = []
+        for d, name in enumerate(self.dimensions):
+            values = self.values[name]
+            weights = self.weights[name]
+            marginal = Counter()
+            for cell, count in self.index.cells.items():
+                marginal[cell[d]] += count
+            # Deal n slots over the values in proportion to weight, least covered first
+            slots = []
+            taken = Counter()
+            for _ in range(n):
+                i = min(
+                    (i for i in range(len(values)) if weights[i] > 0),
+                    key=lambda i: ((marginal[values[i]] + taken[i] + 1) / weights[i], self.rng.random())
+                )
+                taken[i] += 1
+                slots.append(values[i])
+            self.rng.shuffle(slots)
+            columns.append(slots)
+        return list(zip(*columns))
+
+
+def load_weights(path):
+    """
+    Read per-dimension weights from a JSON file
+
+    The file maps dimension names to {value: weight}, e.g.
+    {"pov": {"ground level perspective": 2.0}}.
+    """
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,249 @@
+import io
+import os
+import json
+import time
+import logging
+import tarfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+BLOCK = tarfile.BLOCKSIZE
+
+
+def _padded(size):
+    return -(-size // BLOCK) * BLOCK
+
+
+def index_path(tar_path):
+    """Offset index next to a shard: shard-000001.tar -> shard-000001.idx.jsonl"""
+    return tar_path[:-len(".tar")] + ".idx.jsonl"
+
+
+def load_index(tar_path):
+    """
+    Read a finalized shard's offset index
+
+    Returns:
+        list: {"key", "members": {extension: [data offset, size]}} per sample, in shard order
+    """
+    with open(index_path(tar_path), encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_member(tar_path, offset, size):
+    """Read one member's bytes straight from its offset, without walking the tar headers."""
+    with open(tar_path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def _fsync_dir(directory):
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class ShardWriter:
+    """
+    Size-bounded tar shards in the WebDataset layout
+
+    Each sample is a group of members sharing a key (`{key}.png`,
+    `{key}.webp`, ..., `{key}.json`), with the JSON metadata written last.
+    A shard is written as `{prefix}-NNNNNN.tar.part` and finalized once it
+    would exceed `max_bytes` or holds `max_samples` samples: the tar is
+    closed and fsync'd, its offset index (`.idx.jsonl`, one line per sample
+    with each member's data offset and size) is written atomically, and only
+    then is the shard renamed to `.tar`. Readers therefore only ever see
+    complete shards that have an index, and can seek or memory-map samples
+    directly.
+
+    A `.part` left behind by a crash is salvaged on the next start: samples
+    whose JSON member was fully written are kept, the rest is truncated.
+    Keys already present in a shard are skipped, so re-collecting a job on
+    resume does not duplicate its samples.
+    """
+
+    def __init__(self, directory, prefix="shard", max_bytes=1 << 30, max_samples=10000):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_samples = max_samples
+        self.samples = 0
+        self.shards = 0
+        self._keys = {}
+        self._number = 0
+        self._file = None
+        self._tar = None
+        self._entries = []
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _shard_path(self, number):
+        return os.path.join(self.directory, f"{self.prefix}-{number:06d}.tar")
+
+    def _shard_number(self, name):
+        try:
+            return int(name[len(self.prefix) + 1:].split(".")[0])
+        except ValueError:
+            return None
+
+    def _scan(self):
+        names = [name for name in sorted(os.listdir(self.directory)) if name.startswith(self.prefix + "-")]
+        for name in names:
+            if name.endswith(".tar.part"):
+                self._recover(os.path.join(self.directory, name))
+
+        for name in sorted(os.listdir(self.directory)):
+            number = self._shard_number(name) if name.startswith(self.prefix + "-") else None
+            if number is None or not name.endswith(".tar"):
+                continue
+            self._number = max(self._number, number + 1)
+            try:
+                for entry in load_index(os.path.join(self.directory, name)):
+                    self._keys[entry["key"]] = name
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read the index of shard {name}: {e}")
+        if self._keys:
+            logger.info(f"Found {len(self._keys)} samples in {self._number} shards under {self.directory}")
+
+    def _recover(self, part_path):
+        """Keep the complete samples of an unfinished shard and finalize it."""
+        file_size = os.path.getsize(part_path)
+        entries, end = [], 0
+        key, members = None, {}
+        try:
+            with tarfile.open(part_path, "r:") as tar:
+                for member in tar:
+                    if member.offset_data + member.size > file_size:
+                        break
+                    name, _, extension = member.name.partition(".")
+                    if name != key:
+                        key, members = name, {}
+                    members[extension] = [member.offset_data, member.size]
+                    if extension == "json":
+                        entries.append({"key": key, "members": members})
+                        end = member.offset_data + _padded(member.size)
+                        key, members = None, {}
+        except (tarfile.TarError, EOFError, OSError) as e:
+            logger.warning(f"Stopped reading {part_path} at a damaged member: {e}")
+
+        if not entries:
+            logger.warning(f"Removing {part_path}: no complete samples")
+            os.remove(part_path)
+            return
+        with open(part_path, "r+b") as f:
+            f.truncate(end)
+            f.seek(end)
+            # End-of-archive marker
+            f.write(b"\0" * (2 * BLOCK))
+            f.flush()
+            os.fsync(f.fileno())
+        self._publish(part_path, entries)
+        logger.info(f"Recovered {len(entries)} samples from {part_path}")
+
+    def _publish(self, part_path, entries):
+        tar_path = part_path[:-len(".part")]
+        idx_path = index_path(tar_path)
+        tmp_path = idx_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, idx_path)
+        os.replace(part_path, tar_path)
+        _fsync_dir(self.directory)
+        self.shards += 1
+
+    def _open(self):
+        path = self._shard_path(self._number) + ".part"
+        self._number += 1
+        self._file = open(path, "wb")
+        self._tar = tarfile.open(fileobj=self._file, mode="w", format=tarfile.PAX_FORMAT)
+        self._entries = []
+
+    def _finalize(self):
+        if self._tar is None:
+            return
+        part_path = self._file.name
+        end = self._tar.offset
+        self._tar.close()
+        # tarfile pads the archive to a 10 KiB record; two zero blocks already end it validly
+        self._file.truncate(end + 2 * BLOCK)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._tar = self._file = None
+        if self._entries:
+            self._publish(part_path, self._entries)
+            logger.info(f"Finalized shard {os.path.basename(part_path[:-len('.part')])} "
+                        f"({len(self._entries)} samples)")
+        else:
+            os.remove(part_path)
+        self._entries = []
+
+    def write(self, key, files, metadata):
+        """
+        Append one sample to the current shard
+
+        Args:
+            key (str): Sample key, unique across the dataset (no dots; member names of up to 100
+                characters fit a plain ustar header, longer ones add a PAX header beyond the size estimate)
+            files (dict): {extension: path or bytes}, e.g. {"png": image_path}
+            metadata (dict): Written as the sample's `{key}.json` member
+
+        Returns:
+            dict: {"file": shard file name, "key": key}
+        """
+        payload = []
+        for extension, data in files.items():
+            if isinstance(data, str):
+                with open(data, "rb") as f:
+                    data = f.read()
+            payload.append((extension, data))
+        payload.append(("json", json.dumps(metadata, ensure_ascii=False).encode("utf-8")))
+        size = sum(BLOCK + _padded(len(data)) for _, data in payload)
+
+        with self._lock:
+            if key in self._keys:
+                logger.info(f"Sample {key} is already in shard {self._keys[key]}")
+                return {"file": self._keys[key], "key": key}
+            # The finalized shard also holds the two end-of-archive blocks
+            if self._tar is not None and self._entries and (
+                    self._tar.offset + size + 2 * BLOCK > self.max_bytes or len(self._entries) >= self.max_samples):
+                self._finalize()
+            if self._tar is None:
+                self._open()
+
+            members = {}
+            # A whole-second mtime fits the ustar header; a float would add a PAX header to every member
+            now = int(time.time())
+            for extension, data in payload:
+                info = tarfile.TarInfo(f"{key}.{extension}")
+                info.size = len(data)
+                info.mtime = now
+                info.mode = 0o644
+                self._tar.addfile(info, io.BytesIO(data))
+                members[extension] = [self._tar.offset - _padded(len(data)), len(data)]
+            # Flush per sample so a crash loses at most the sample being written
+            self._file.flush()
+
+            name = os.path.basename(self._file.name)[:-len(".part")]
+            self._entries.append({"key": key, "members": members})
+            self._keys[key] = name
+            self.samples += 1
+            return {"file": name, "key": key}
+
+    def stats(self):
+        return {"samples": self.samples, "shards_finalized": self.shards, "known_samples": len(self._keys)}
+
+    def close(self):
+        """Finalize the current shard."""
+        with self._lock:
+            self._finalize()
@@ -0,0 +1,17 @@
+import os
+import pytest
+
+
+@pytest.fixture(scope="session")
+def main_module(tmp_path_factory):
+    """main, imported with OUTPUT_DIR and its logs/ directory inside a scratch directory."""
+    workdir = tmp_path_factory.mktemp("main")
+    os.environ["OUTPUT_DIR"] = str(workdir / "output")
+    os.environ["PROMPT_CACHE_POLICY"] = "off"
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import main
+    finally:
+        os.chdir(cwd)
+    return main
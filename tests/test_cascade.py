@@ -0,0 +1,118 @@
+import os
+from types import SimpleNamespace
+from PIL import Image
+from quality_gate import QualityGate
+
+
+def full_workflow(main, batch_size=3):
+    return main.create_comfyui_workflow("a wildfire", batch_size, "m.safetensors")
+
+
+def test_draft_workflow_is_smaller_and_previewed(main_module):
+    workflow = full_workflow(main_module)
+    draft = main_module.create_draft_workflow(workflow, steps=5, scale=0.3)
+    assert draft["3"]["inputs"]["steps"] == 5
+    assert draft["3"]["inputs"]["seed"] == workflow["3"]["inputs"]["seed"]
+    # 512 * 0.3 = 153 is rounded down to a multiple of 8
+    assert draft["5"]["inputs"]["width"] == 152
+    assert draft["9"] == {"inputs": {"images": ["8", 0]}, "class_type": "PreviewImage"}
+    # The full workflow is left as it was
+    assert workflow["9"]["class_type"] == "SaveImage" and workflow["5"]["inputs"]["width"] == 512
+
+
+def test_refine_selects_each_kept_latent(main_module):
+    workflow = full_workflow(main_module)
+    draft = main_module.create_draft_workflow(workflow)
+    refine, save_nodes = main_module.create_refine_workflow(draft, workflow, keep=[0, 2], denoise=0.4)
+    assert len(save_nodes) == 2
+    # The draft sampler is reused as is, so ComfyUI can serve it from its cache
+    assert refine["3"] == draft["3"]
+    for index, save in zip([0, 2], save_nodes):
+        decode = refine[save]["inputs"]["images"][0]
+        sampler = refine[decode]["inputs"]["samples"][0]
+        upscale = refine[sampler]["inputs"]["latent_image"][0]
+        select = refine[upscale]["inputs"]["samples"][0]
+        assert refine[select] == {"inputs": {"samples": ["3", 0], "batch_index": index, "length": 1},
+                                  "class_type": "LatentFromBatch"}
+        assert refine[upscale]["class_type"] == "LatentUpscale"
+        assert refine[upscale]["inputs"]["width"] == workflow["5"]["inputs"]["width"]
+        assert refine[upscale]["inputs"]["height"] == workflow["5"]["inputs"]["height"]
+        assert refine[sampler]["inputs"]["denoise"] == 0.4
+        assert refine[sampler]["inputs"]["steps"] == workflow["3"]["inputs"]["steps"]
+        assert refine[sampler]["inputs"]["seed"] == workflow["3"]["inputs"]["seed"]
+
+
+def test_refine_whole_batch_in_one_branch(main_module):
+    workflow = full_workflow(main_module)
+    draft = main_module.create_draft_workflow(workflow)
+    refine, save_nodes = main_module.create_refine_workflow(draft, workflow, keep=[0, 1, 2])
+    assert len(save_nodes) == 1
+    assert not any(node["class_type"] == "LatentFromBatch" for node in refine.values())
+    upscales = [node for node in refine.values() if node["class_type"] == "LatentUpscale"]
+    assert [node["inputs"]["samples"] for node in upscales] == [["3", 0]]
+
+
+def test_cascade_scores_drafts_and_refines_the_passing_ones(tmp_path, monkeypatch, main_module):
+    main = main_module
+    monkeypatch.setattr(main, "quality_gate", QualityGate({"brightness": 100}))
+    monkeypatch.setattr(main, "CASCADE_DRAFT_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "get_ws_client", lambda base_url, ws_url: SimpleNamespace(client_id="c"))
+    submitted = []
+
+    def submit_workflow(workflow, base_url, client_id):
+        submitted.append(workflow)
+        return f"pid{len(submitted)}"
+
+    def wait_for_workflow(prompt_id, timeout, base_url, ws_url, output_nodes=None, trace=None):
+        return {node_id: {"images": [{"filename": f"{node_id}_{n}.png"} for n in range(2)]}
+                for node_id in output_nodes}
+
+    def download_images(base_url, images, paths, max_workers=4, local=None):
+        # The second draft is black and fails the brightness threshold
+        for path, color in zip(paths, ["white", "black"]):
+            Image.new("RGB", (32, 32), color).save(path)
+        return paths
+
+    monkeypatch.setattr(main, "submit_workflow", submit_workflow)
+    monkeypatch.setattr(main, "wait_for_workflow", wait_for_workflow)
+    monkeypatch.setattr(main, "download_images", download_images)
+    node = SimpleNamespace(base_url="http://127.0.0.1:9", ws_url="ws://127.0.0.1:9/ws")
+    preferred = []
+    pool = SimpleNamespace(run=lambda fn, model=None, prefer=None: (preferred.append(prefer), (node, fn(node)))[1])
+    execute, _, _ = main.make_job_stages(2, "m.safetensors", pool)
+
+    job = {"index": 0, "prompt": "a wildfire", "metadata": {}}
+    assert execute(job)
+    draft, refine = submitted
+    assert draft["9"]["class_type"] == "PreviewImage"
+    selects = [n for n in refine.values() if n["class_type"] == "LatentFromBatch"]
+    assert [n["inputs"]["batch_index"] for n in selects] == [0]
+    (save,) = job["output_nodes"]
+    assert list(job["quality"]) == [save] and job["quality"][save][0]["brightness"] == 255
+    # The refine pass goes back to the draft's node; drafts are not kept
+    assert preferred == [None, node]
+    assert os.listdir(tmp_path) == []
+
+
+def test_cascade_rejects_a_job_when_every_draft_fails(tmp_path, monkeypatch, main_module):
+    main = main_module
+    monkeypatch.setattr(main, "quality_gate", QualityGate({"brightness": 256}))
+    monkeypatch.setattr(main, "CASCADE_DRAFT_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "get_ws_client", lambda base_url, ws_url: SimpleNamespace(client_id="c"))
+    monkeypatch.setattr(main, "submit_workflow", lambda workflow, base_url, client_id: "pid")
+    monkeypatch.setattr(main, "wait_for_workflow", lambda *args, **kwargs: {"9": {"images": [{"filename": "a"}]}})
+
+    def download_images(base_url, images, paths, max_workers=4, local=None):
+        for path in paths:
+            Image.new("RGB", (32, 32), "white").save(path)
+        return paths
+
+    monkeypatch.setattr(main, "download_images", download_images)
+    node = SimpleNamespace(base_url="http://127.0.0.1:9", ws_url="ws://127.0.0.1:9/ws")
+    pool = SimpleNamespace(run=lambda fn, model=None, prefer=None: (node, fn(node)))
+    execute, _, collect = main.make_job_stages(1, "m.safetensors", pool)
+    job = {"index": 0, "prompt": "a wildfire", "metadata": {}}
+    # The job succeeds without a refine pass and leaves nothing to collect
+    assert execute(job)
+    assert job["rejected"] and job["outputs"] is None
+    assert collect(job)
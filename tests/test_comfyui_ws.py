@@ -0,0 +1,128 @@
+import json
+import time
+import struct
+import pytest
+import requests
+import comfyui_ws
+from comfyui_ws import ComfyUIWebSocket
+from fake_servers import FakeComfyUI
+
+
+def send(client, event_type, **data):
+    client._on_message(None, json.dumps({"type": event_type, "data": data}))
+
+
+@pytest.fixture
+def offline_client():
+    """A client whose connection attempts fail, fed events by hand."""
+    client = ComfyUIWebSocket("ws://127.0.0.1:9/ws", "http://127.0.0.1:9", reconnect_delay=60)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def comfyui():
+    server = FakeComfyUI(sample_time=0.1, load_time=0.0, decode_time=0.01, progress=False, jitter=0.0).start()
+    yield server
+    server.stop()
+
+
+def submit(server, client, main):
+    workflow = main.create_comfyui_workflow("a wildfire", 1, "model.safetensors")
+    response = requests.post(f"{server.url}/prompt", json={"prompt": workflow, "client_id": client.client_id})
+    return response.json()["prompt_id"]
+
+
+def test_events_are_routed_by_prompt_id(offline_client):
+    first = offline_client.register("p1", ["9"])
+    second = offline_client.register("p2", ["9"])
+    send(offline_client, "executing", prompt_id="p2", node="9")
+    send(offline_client, "executed", prompt_id="p2", node="9", output={"images": ["b"]})
+    assert second.result(timeout=1) == {"9": {"images": ["b"]}}
+    assert not first.done()
+    send(offline_client, "executed", prompt_id="p1", node="9", output={"images": ["a"]})
+    assert first.result(timeout=1) == {"9": {"images": ["a"]}}
+
+
+def test_events_before_register_are_replayed(offline_client):
+    send(offline_client, "execution_start", prompt_id="p1")
+    send(offline_client, "executed", prompt_id="p1", node="9", output={"images": ["a"]})
+    assert offline_client.register("p1", ["9"]).result(timeout=1) == {"9": {"images": ["a"]}}
+
+
+def test_execution_error_fails_only_its_prompt(offline_client):
+    failing = offline_client.register("p1", ["9"])
+    other = offline_client.register("p2", ["9"])
+    send(offline_client, "execution_error", prompt_id="p1", node_type="KSampler", exception_message="out of memory")
+    with pytest.raises(RuntimeError, match="KSampler: out of memory"):
+        failing.result(timeout=1)
+    assert not other.done()
+
+
+def test_finished_prompt_without_all_outputs_is_read_from_history(offline_client, monkeypatch):
+    class History:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"p1": {"status": {"completed": True}, "outputs": {"9": {"images": ["cached"]}}}}
+
+    requested = []
+    monkeypatch.setattr(comfyui_ws.requests, "get", lambda url, timeout: requested.append(url) or History())
+    future = offline_client.register("p1", ["9"])
+    # Every node came from ComfyUI's cache, so no `executed` event arrives
+    send(offline_client, "execution_cached", prompt_id="p1", nodes=["3", "9"])
+    send(offline_client, "execution_success", prompt_id="p1")
+    assert future.result(timeout=1) == {"9": {"images": ["cached"]}}
+    assert requested == ["http://127.0.0.1:9/history/p1"]
+
+
+def test_end_of_prompt_resolves_with_the_outputs_seen(offline_client):
+    future = offline_client.register("p1", ["9", "10"])
+    send(offline_client, "executed", prompt_id="p1", node="9", output={"images": ["a"]})
+    send(offline_client, "executed", prompt_id="p1", node="10", output={"images": ["b"]})
+    send(offline_client, "executing", prompt_id="p1", node=None)
+    assert future.result(timeout=1) == {"9": {"images": ["a"]}, "10": {"images": ["b"]}}
+
+
+def test_wait_returns_outputs_and_trace(comfyui, main_module):
+    client = ComfyUIWebSocket(comfyui.url.replace("http", "ws") + "/ws", comfyui.url)
+    try:
+        assert client.connected.wait(5)
+        prompt_id = submit(comfyui, client, main_module)
+        trace = {}
+        outputs = client.wait(prompt_id, ["9"], timeout=10, trace=trace)
+        assert outputs["9"]["images"][0]["filename"].endswith(".png")
+        assert trace["started"] is not None and "3" in trace["nodes"]
+    finally:
+        client.close()
+
+
+def test_events_lost_while_disconnected_are_recovered_after_reconnect(comfyui, main_module):
+    client = ComfyUIWebSocket(comfyui.url.replace("http", "ws") + "/ws", comfyui.url, reconnect_delay=1.0)
+    try:
+        assert client.connected.wait(5)
+        prompt_id = submit(comfyui, client, main_module)
+        # Drop the connection; the prompt finishes before the client reconnects
+        for ws in list(comfyui.clients.values()):
+            ws.send_frame(0x8, struct.pack(">H", 1001))
+            ws.closed = True
+        outputs = client.wait(prompt_id, ["9"], timeout=10)
+        assert outputs is not None and "9" in outputs
+        assert client.connected.is_set()
+    finally:
+        client.close()
+
+
+def test_wait_gives_up_when_the_server_stays_down(main_module):
+    server = FakeComfyUI(sample_time=30, load_time=0.0, progress=False, jitter=0.0).start()
+    client = ComfyUIWebSocket(server.url.replace("http", "ws") + "/ws", server.url, reconnect_delay=0.2)
+    try:
+        assert client.connected.wait(5)
+        prompt_id = submit(server, client, main_module)
+        server.stop()
+        started = time.time()
+        assert client.wait(prompt_id, ["9"], timeout=60, disconnect_grace=0.5) is None
+        assert time.time() - started < 15
+    finally:
+        client.close()
@@ -0,0 +1,125 @@
+import pytest
+import controller
+from controller import AdaptiveController, LatencyWindow
+
+
+class FakeNode:
+    def __init__(self, queue_depth=0, available=True):
+        self.queue_depth = queue_depth
+        self.available = available
+
+    def is_available(self):
+        return self.available
+
+
+class FakePool:
+    def __init__(self, *nodes):
+        self.nodes = list(nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A manual clock for the completion times the controller records."""
+    now = [1000.0]
+    monkeypatch.setattr(controller.time, "time", lambda: now[0])
+    return now
+
+
+def test_latency_window_percentiles():
+    window = LatencyWindow(size=4)
+    assert window.percentile(50) is None
+    for seconds in [9, 1, 2, 3, 4]:
+        window.add(seconds)
+    # The oldest sample fell out of the window
+    assert len(window) == 4
+    assert [window.percentile(p) for p in (0, 25, 50, 75, 99, 100)] == [1, 1, 2, 3, 4, 4]
+
+
+def test_initial_limit_is_one_per_node_within_bounds():
+    assert AdaptiveController(FakePool(FakeNode(), FakeNode())).inflight_limit == 2
+    assert AdaptiveController(FakePool(*[FakeNode()] * 10), max_inflight=4).inflight_limit == 4
+    assert AdaptiveController(FakePool(FakeNode()), initial_inflight=3).inflight_limit == 3
+
+
+def test_limit_grows_by_one_while_queues_are_short(clock):
+    node = FakeNode(queue_depth=0)
+    control = AdaptiveController(FakePool(node), max_inflight=4, target_queue=2)
+    limits = []
+    for _ in range(5):
+        control.observe_job(10.0)
+        limits.append(control.inflight_limit)
+    assert limits == [2, 3, 4, 4, 4]
+
+
+def test_limit_shrinks_by_one_while_queues_are_long(clock):
+    node = FakeNode(queue_depth=5)
+    control = AdaptiveController(FakePool(node), min_inflight=2, initial_inflight=4, target_queue=2)
+    limits = []
+    for _ in range(3):
+        control.observe_job(10.0)
+        limits.append(control.inflight_limit)
+    assert limits == [3, 2, 2]
+
+
+def test_limit_holds_near_the_target_queue(clock):
+    control = AdaptiveController(FakePool(FakeNode(queue_depth=2), FakeNode(queue_depth=3)), initial_inflight=3)
+    control.observe_job(10.0)
+    assert control.inflight_limit == 3
+    # One idle node is enough to add work
+    control.pool.nodes.append(FakeNode(queue_depth=0))
+    control.observe_job(10.0)
+    assert control.inflight_limit == 4
+
+
+def test_unavailable_nodes_do_not_count(clock):
+    pool = FakePool(FakeNode(queue_depth=0, available=False), FakeNode(queue_depth=5))
+    control = AdaptiveController(pool, initial_inflight=3, target_queue=2)
+    control.observe_job(10.0)
+    assert control.inflight_limit == 2
+
+
+def test_failures_halve_the_limit_down_to_the_minimum(clock):
+    control = AdaptiveController(FakePool(FakeNode(queue_depth=2)), min_inflight=1, initial_inflight=8)
+    limits = []
+    for _ in range(5):
+        control.observe_job(0, failed=True)
+        limits.append(control.inflight_limit)
+    assert limits == [4, 2, 1, 1, 1]
+    # Failed jobs are not latency samples
+    assert len(control.job_latency) == 0
+
+
+def test_timeout_follows_p99_after_enough_samples(clock):
+    control = AdaptiveController(FakePool(FakeNode(queue_depth=2)), default_timeout=300, min_timeout=30,
+                                 max_timeout=1800, timeout_factor=3.0, min_samples=5)
+    for seconds in [20, 20, 20, 40]:
+        control.observe_job(seconds)
+    assert control.job_timeout() == 300
+    control.observe_job(50)
+    assert control.job_timeout() == 150
+    # Clamped at both ends
+    fast = AdaptiveController(FakePool(FakeNode(queue_depth=2)), min_samples=1)
+    fast.observe_job(1)
+    assert fast.job_timeout() == 30
+    fast.observe_job(1000)
+    assert fast.job_timeout() == 1800
+
+
+def test_prompt_depth_covers_llama_latency_at_the_completion_rate(clock):
+    control = AdaptiveController(FakePool(FakeNode(queue_depth=2)), max_prompt_depth=6)
+    for seconds in [4.0] * 19 + [10.0]:
+        control.observe_llm(seconds)
+    # One job every 2 s: a 4 s Llama p95 needs 2 prompts ahead, plus one
+    for _ in range(5):
+        control.observe_job(10.0)
+        clock[0] += 2
+    assert control.throughput() == pytest.approx(0.5)
+    assert control.prompt_depth == 3
+    # Faster completions need a deeper buffer, up to the maximum
+    for _ in range(200):
+        control.observe_job(10.0)
+        clock[0] += 0.1
+    assert control.prompt_depth == 6
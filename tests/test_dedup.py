@@ -0,0 +1,118 @@
+import os
+import random
+import pytest
+from PIL import Image
+from dedup import BKTree, DedupIndex, hamming, hash_images, scan
+
+
+def make_image(path, seed, size=64):
+    rng = random.Random(seed)
+    image = Image.new("L", (size, size))
+    image.putdata([rng.randrange(256) for _ in range(size * size)])
+    image.convert("RGB").save(path)
+    return str(path)
+
+
+def test_bktree_search_matches_brute_force():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for n, value in enumerate(values):
+        tree.add(value, n)
+    # Near copies of a few stored values, plus a random query
+    queries = [values[3] ^ 0b101, values[42] ^ (1 << 63), rng.getrandbits(64)]
+    for query in queries:
+        for radius in (0, 2, 6, 20):
+            expected = sorted(hamming(query, value) for value in values if hamming(query, value) <= radius)
+            assert [distance for distance, _ in tree.search(query, radius)] == expected
+
+
+def test_bktree_returns_closest_first():
+    tree = BKTree()
+    tree.add(0b1111, "far")
+    tree.add(0b0001, "near")
+    assert tree.search(0, 4) == [(1, "near"), (4, "far")]
+    assert len(tree) == 2
+
+
+def test_check_flags_a_near_copy(tmp_path):
+    index = DedupIndex(radius=6)
+    assert index.check(0xFFFF, "a.png") == (None, None)
+    assert index.check(0xFFFE, "b.png") == ("a.png", 1)
+    assert index.stats()["duplicates"] == 1
+
+
+def test_rejected_duplicates_are_not_indexed():
+    index = DedupIndex(radius=6)
+    index.check(0xFFFF, "a.png", keep_duplicates=False)
+    assert index.check(0xFFFE, "b.png", keep_duplicates=False) == ("a.png", 1)
+    assert len(index.tree) == 1
+
+
+def test_rechecking_an_indexed_image_does_not_match_itself(tmp_path):
+    index_path = str(tmp_path / "index.jsonl")
+    index = DedupIndex(index_path, radius=6)
+    index.check(0x1234, "a.png")
+    index.check(0xF0F0F0F0, "b.png")
+    index.close()
+
+    # A resumed run re-collects the same images against the persisted index
+    resumed = DedupIndex(index_path, radius=6)
+    assert resumed.check(0x1234, "a.png", keep_duplicates=False) == (None, None)
+    assert resumed.check(0xF0F0F0F0, "b.png") == (None, None)
+    assert len(resumed.tree) == 2
+    assert resumed.stats()["duplicates"] == 0
+    resumed.close()
+    assert len(DedupIndex(index_path).tree) == 2
+
+
+def test_rechecking_a_flagged_duplicate_keeps_its_original(tmp_path):
+    index_path = str(tmp_path / "index.jsonl")
+    index = DedupIndex(index_path, radius=6)
+    index.check(0xFFFF, "a.png")
+    assert index.check(0xFFFE, "b.png") == ("a.png", 1)
+    index.close()
+
+    resumed = DedupIndex(index_path, radius=6)
+    # a.png was indexed first, so it is still nobody's duplicate; b.png still points at a.png
+    assert resumed.check(0xFFFF, "a.png") == (None, None)
+    assert resumed.check(0xFFFE, "b.png") == ("a.png", 1)
+
+
+def test_scan_with_existing_index_keeps_indexed_images(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    paths = [make_image(images / f"{n}.png", seed=n) for n in range(3)]
+    index_path = str(tmp_path / "index.jsonl")
+
+    assert scan(str(images), index_path=index_path, workers=1)["duplicates"] == 0
+    counts = scan(str(images), index_path=index_path, delete=True, workers=1)
+    assert counts == {"scanned": 3, "unreadable": 0, "duplicates": 0, "deleted": 0}
+    assert all(os.path.exists(path) for path in paths)
+
+
+def test_scan_deletes_a_copy(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    original = make_image(images / "a.png", seed=1)
+    Image.open(original).save(images / "b.png")
+
+    counts = scan(str(images), delete=True, workers=1)
+    assert counts["duplicates"] == 1 and counts["deleted"] == 1
+    assert os.path.exists(original) and not os.path.exists(images / "b.png")
+
+
+def test_hash_images_reports_unreadable_files(tmp_path):
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    good = make_image(tmp_path / "good.png", seed=0)
+    results = dict(hash_images([str(broken), good]))
+    assert results[str(broken)] is None
+    assert isinstance(results[good], int)
+
+
+def test_index_of_another_algorithm_is_refused(tmp_path):
+    index_path = tmp_path / "index.jsonl"
+    index_path.write_text('{"hash": "00000000000000ff", "path": "a.png", "algorithm": "dhash"}\n')
+    with pytest.raises(ValueError, match="dhash"):
+        DedupIndex(str(index_path))
@@ -0,0 +1,111 @@
+import pytest
+import requests
+import endpoints
+from endpoints import EndpointCache, probe_comfyui, probe_endpoints, probe_llama
+
+LLAMA = "http://llama:11434/api/generate"
+COMFYUI = "http://comfyui:8188"
+
+
+class FakeResponse:
+    def __init__(self, status=200, body=None):
+        self.status_code = status
+        self.body = body or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Server Error")
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(endpoints.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Answers the probes' GETs from `server.routes` and records the URLs asked for."""
+
+    class Server:
+        def __init__(self):
+            self.routes = {
+                "http://llama:11434/api/tags": FakeResponse(body={"models": [{"name": "llama3:latest"}]}),
+                f"{COMFYUI}/system_stats": FakeResponse(),
+            }
+            self.requested = []
+
+        def get(self, url, timeout=None):
+            self.requested.append(url)
+            answer = self.routes.get(url)
+            if answer is None:
+                raise requests.ConnectionError(f"Connection refused: {url}")
+            return answer
+
+    fake = Server()
+    monkeypatch.setattr(endpoints.requests, "get", fake.get)
+    return fake
+
+
+def test_probe_llama_checks_the_model(server):
+    assert probe_llama(LLAMA, "llama3")["ok"]
+    assert probe_llama(LLAMA, "llama3:latest")["ok"]
+    result = probe_llama(LLAMA, "mistral")
+    assert not result["ok"] and result["error"] == "model mistral not installed"
+    assert server.requested == ["http://llama:11434/api/tags"] * 3
+
+
+def test_probe_failures_are_reported(server):
+    server.routes[f"{COMFYUI}/system_stats"] = FakeResponse(status=500)
+    assert "500" in probe_comfyui(COMFYUI + "/")["error"]
+    result = probe_llama("http://down:11434/api/generate", "llama3")
+    assert not result["ok"] and "Connection refused" in result["error"]
+
+
+def test_cache_entries_expire_after_the_ttl(clock):
+    cache = EndpointCache(ttl=300)
+    cache.put("comfyui x", {"ok": True})
+    clock[0] += 299.9
+    assert cache.get("comfyui x") == {"ok": True, "checked": 1000.0}
+    clock[0] += 0.1
+    assert cache.get("comfyui x") is None
+    assert cache.get("comfyui y") is None
+
+
+def test_probe_endpoints_reuses_fresh_results(tmp_path, clock, server):
+    path = str(tmp_path / "endpoints.json")
+    results = probe_endpoints([LLAMA], [COMFYUI, "http://down:8188"], "llama3", EndpointCache(path, ttl=60))
+    assert results["llama"][LLAMA]["ok"] and results["comfyui"][COMFYUI]["ok"]
+    assert not results["comfyui"]["http://down:8188"]["ok"]
+    assert len(server.requested) == 3
+
+    # A later run within the TTL probes nothing, and does not retry the endpoint that was down
+    clock[0] += 30
+    results = probe_endpoints([LLAMA], [COMFYUI, "http://down:8188"], "llama3", EndpointCache(path, ttl=60))
+    assert len(server.requested) == 3
+    assert all(result["cached"] for kind in results.values() for result in kind.values())
+    assert not results["comfyui"]["http://down:8188"]["ok"]
+
+    # Once the entries expire, the endpoint that came back up is seen as up
+    clock[0] += 31
+    server.routes["http://down:8188/system_stats"] = FakeResponse()
+    results = probe_endpoints([LLAMA], [COMFYUI, "http://down:8188"], "llama3", EndpointCache(path, ttl=60))
+    assert len(server.requested) == 6
+    assert results["comfyui"]["http://down:8188"] == {"ok": True, "latency": 0.0, "error": None}
+
+
+def test_llama_results_are_cached_per_model(clock, server):
+    cache = EndpointCache(ttl=60)
+    probe_endpoints([LLAMA], [], "llama3", cache)
+    assert not probe_endpoints([LLAMA], [], "mistral", cache)["llama"][LLAMA]["ok"]
+    assert len(server.requested) == 2
+
+
+def test_unreadable_cache_file_is_ignored(tmp_path):
+    path = tmp_path / "endpoints.json"
+    path.write_text("{truncated")
+    assert EndpointCache(str(path)).entries == {}
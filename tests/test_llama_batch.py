@@ -0,0 +1,43 @@
+import llama_batch
+from llama_batch import JSONArrayStreamParser, generate_prompts_batch
+
+
+def feed_all(chunks):
+    parser = JSONArrayStreamParser()
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return items, parser
+
+
+def test_elements_are_returned_as_soon_as_they_close():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('["first prom') == []
+    assert parser.feed('pt", "sec') == ["first prompt"]
+    assert parser.feed('ond prompt"]') == ["second prompt"]
+    assert parser.done
+
+
+def test_one_character_at_a_time():
+    text = '```json\n[{"prompt": "a \\"quoted\\" [fire]"}, {"id": 2, "text": "b, {braces}"}]\n```'
+    items, parser = feed_all(text)
+    assert items == ['a "quoted" [fire]', "b, {braces}"]
+    assert parser.done
+
+
+def test_text_after_the_array_is_ignored():
+    items, _ = feed_all(['Sure! ["a"] and ["b"]'])
+    assert items == ["a"]
+
+
+def test_unusable_elements_keep_their_position():
+    items, _ = feed_all(['["ok", {"prompt": }, "", {"n": 1}, "  also ok "]'])
+    assert items == ["ok", None, None, None, "also ok"]
+
+
+def test_batch_pairs_prompts_with_their_own_scenario(monkeypatch):
+    monkeypatch.setattr(llama_batch, "stream_llama",
+                        lambda *args, **kwargs: iter(['["fire A", ', '"", "fire C"]']))
+    scenarios = [{"n": 1}, {"n": 2}, {"n": 3}, {"n": 4}]
+    assert list(generate_prompts_batch("url", "system", scenarios, "model", 0.7)) == [
+        ("fire A", {"n": 1}), (None, {"n": 2}), ("fire C", {"n": 3}), (None, {"n": 4})]
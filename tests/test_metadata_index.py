@@ -0,0 +1,31 @@
+from metadata_index import MetadataIndex
+
+
+def record(n, **fields):
+    return {"image_path": f"/out/{n}.png", "prompt_id": f"p{n}", "timestamp": f"2026-01-{n + 1:02d}T00:00:00",
+            "model": "base", "metadata": {"environment": "forest" if n % 2 else "grassland"}, **fields}
+
+
+def test_query_filters_and_orders_by_timestamp(tmp_path):
+    index = MetadataIndex(str(tmp_path / "index.sqlite"))
+    for n in (3, 0, 2, 1):
+        index.add(record(n))
+    index.add(record(4, duplicate_of="/out/0.png"))
+
+    assert [r["prompt_id"] for r in index.query({"environment": "grassland"})] == ["p0", "p2", "p4"]
+    assert [r["prompt_id"] for r in index.query(duplicates=False, since="2026-01-02")] == ["p1", "p2", "p3"]
+    assert [r["prompt_id"] for r in index.query(limit=2)] == ["p0", "p1"]
+    assert index.counts("environment") == [("grassland", 3), ("forest", 2)]
+
+
+def test_query_streams_while_the_index_is_written(tmp_path):
+    index = MetadataIndex(str(tmp_path / "index.sqlite"))
+    for n in range(5):
+        index.add(record(n))
+
+    rows = index.query()
+    assert next(rows)["prompt_id"] == "p0"
+    # Live indexing is not blocked by a reader that is part-way through
+    index.add(record(9))
+    assert [r["prompt_id"] for r in rows] == ["p1", "p2", "p3", "p4"]
+    assert index.stats() == {"images": 6, "prompts": 6}
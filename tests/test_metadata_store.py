@@ -0,0 +1,77 @@
+import json
+import time
+import metadata_store
+from metadata_store import MetadataStore, compact, export_json, iter_records, repair_tail
+
+
+def write_lines(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_repair_tail_drops_a_truncated_last_line(tmp_path):
+    path = write_lines(tmp_path / "log.jsonl", '{"a": 1}\n{"b": 2}\n{"c": ')
+    repair_tail(path)
+    assert open(path).read() == '{"a": 1}\n{"b": 2}\n'
+
+
+def test_repair_tail_keeps_complete_logs(tmp_path):
+    path = write_lines(tmp_path / "log.jsonl", '{"a": 1}\n')
+    repair_tail(path)
+    assert open(path).read() == '{"a": 1}\n'
+    # A single partial record leaves an empty log
+    path = write_lines(tmp_path / "partial.jsonl", '{"a": ')
+    repair_tail(path)
+    assert open(path).read() == ""
+    repair_tail(str(tmp_path / "missing.jsonl"))
+
+
+def test_store_repairs_before_appending(tmp_path):
+    path = write_lines(tmp_path / "log.jsonl", '{"a": 1}\n{"b"')
+    store = MetadataStore(path)
+    store.append({"c": "é"})
+    store.close()
+    assert list(iter_records(path)) == [{"a": 1}, {"c": "é"}]
+
+
+def test_export_json_writes_the_legacy_array(tmp_path):
+    path = write_lines(tmp_path / "log.jsonl", '{"a": 1}\nnot json\n\n{"b": [1, 2]}\n')
+    json_path = str(tmp_path / "metadata.json")
+    assert export_json(path, json_path) == 2
+    assert json.load(open(json_path)) == [{"a": 1}, {"b": [1, 2]}]
+    assert export_json(str(tmp_path / "empty.jsonl"), json_path) == 0
+    assert json.load(open(json_path)) == []
+    assert not (tmp_path / "metadata.json.tmp").exists()
+
+
+def test_compact_drops_corrupt_and_blank_lines(tmp_path):
+    path = write_lines(tmp_path / "log.jsonl", '{"a": 1}\n{broken\n\n{"b": 2}\n')
+    assert compact(path) == 2
+    assert open(path).read() == '{"a": 1}\n{"b": 2}\n'
+
+
+def test_quiet_tail_is_synced_after_the_interval(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(metadata_store.os, "fsync", synced.append)
+    store = MetadataStore(str(tmp_path / "log.jsonl"), fsync_every=100, fsync_interval=0.05)
+    store.append({"a": 1})
+    store.append({"b": 2})
+    assert synced == []
+    deadline = time.time() + 5
+    while not synced and time.time() < deadline:
+        time.sleep(0.01)
+    # One sync for both records, with no further append needed
+    assert len(synced) == 1 and store._unsynced == 0
+    store.close()
+    assert len(synced) == 1
+
+
+def test_batches_are_synced_by_count_and_on_close(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(metadata_store.os, "fsync", synced.append)
+    store = MetadataStore(str(tmp_path / "log.jsonl"), fsync_every=2, fsync_interval=60)
+    for n in range(3):
+        store.append({"n": n})
+    assert len(synced) == 1
+    store.close()
+    assert len(synced) == 2 and store._timer is None
@@ -0,0 +1,69 @@
+import queue
+import threading
+import pytest
+from model_scheduler import ModelAffinityQueue, ModelMix, parse_model_weights
+
+
+def job(model, n):
+    return {"model": model, "n": n}
+
+
+def test_parse_model_weights():
+    assert parse_model_weights("base.safetensors") == [("base.safetensors", 1.0)]
+    assert parse_model_weights("a:3, b:1,c:0,d") == [("a", 3.0), ("b", 1.0), ("d", 1.0)]
+    with pytest.raises(ValueError):
+        parse_model_weights(" , ")
+
+
+def test_model_mix_follows_the_weights_in_every_window():
+    mix = ModelMix([("a", 3), ("b", 1)])
+    picks = [mix.next() for _ in range(8)]
+    assert picks[:4].count("a") == 3 and picks[4:].count("a") == 3
+
+
+def test_get_serves_the_preferred_model_first():
+    loaded = ["b"]
+    jobs = ModelAffinityQueue(preferred_model=lambda: loaded[0])
+    for n, model in enumerate("abab"):
+        jobs.put(job(model, n))
+    assert [jobs.get()["n"] for _ in range(2)] == [1, 3]
+    assert [jobs.get()["n"] for _ in range(2)] == [0, 2]
+
+
+def test_get_switches_to_the_model_with_most_buffered_jobs():
+    jobs = ModelAffinityQueue(preferred_model=lambda: "c")
+    for n, model in enumerate("abb"):
+        jobs.put(job(model, n))
+    assert jobs.get()["model"] == "b"
+
+
+def test_a_job_waiting_too_long_is_served_first():
+    jobs = ModelAffinityQueue(preferred_model=lambda: "b", max_wait=-1)
+    jobs.put(job("a", 0))
+    jobs.put(job("b", 1))
+    assert jobs.get()["n"] == 0
+
+
+def test_get_nowait_only_packs_the_same_model():
+    jobs = ModelAffinityQueue(preferred_model=lambda: "a")
+    for n, model in enumerate("aab"):
+        jobs.put(job(model, n))
+    assert jobs.get()["n"] == 0
+    assert jobs.get_nowait()["n"] == 1
+    with pytest.raises(queue.Empty):
+        jobs.get_nowait()
+    assert jobs.qsize() == 1
+
+
+def test_end_markers_come_after_all_jobs():
+    jobs = ModelAffinityQueue()
+    jobs.put(None)
+    jobs.put(job("a", 0))
+    assert jobs.get() == job("a", 0)
+    assert jobs.get() is None
+
+
+def test_get_blocks_until_a_job_arrives():
+    jobs = ModelAffinityQueue()
+    threading.Timer(0.05, jobs.put, [job("a", 0)]).start()
+    assert jobs.get()["n"] == 0
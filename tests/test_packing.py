@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+
+def node_branch(workflow, save):
+    """Follow a SaveImage node back to its decode, sampler and positive prompt nodes."""
+    decode = workflow[save]["inputs"]["images"][0]
+    sampler = workflow[decode]["inputs"]["samples"][0]
+    positive = workflow[sampler]["inputs"]["positive"][0]
+    return decode, sampler, positive
+
+
+class FakePool:
+    """Runs every workflow on one fake node."""
+
+    def __init__(self):
+        self.node = SimpleNamespace(base_url="http://127.0.0.1:9", ws_url="ws://127.0.0.1:9/ws")
+
+    def run(self, fn, model=None, prefer=None):
+        return self.node, fn(self.node)
+
+
+def stub_comfyui(monkeypatch, main, submitted):
+    """Answer each save node with an image named after the prompt its branch encodes."""
+    monkeypatch.setattr(main, "get_ws_client", lambda base_url, ws_url: SimpleNamespace(client_id="c"))
+
+    def submit_workflow(workflow, base_url, client_id):
+        submitted.append(workflow)
+        return "pid"
+
+    def wait_for_workflow(prompt_id, timeout, base_url, ws_url, output_nodes=None, trace=None):
+        workflow = submitted[-1]
+        outputs = {}
+        for save in output_nodes:
+            _, _, positive = node_branch(workflow, save)
+            outputs[save] = {"images": [{"filename": workflow[positive]["inputs"]["text"]}]}
+        return outputs
+
+    monkeypatch.setattr(main, "submit_workflow", submit_workflow)
+    monkeypatch.setattr(main, "wait_for_workflow", wait_for_workflow)
+
+
+def test_packed_workflow_shares_loader_and_latent(main_module):
+    prompts = ["fire A", "fire B", "fire C"]
+    workflow, save_nodes = main_module.create_packed_workflow(prompts, batch_size=2, model_name="m.safetensors")
+    assert workflow["4"]["inputs"]["ckpt_name"] == "m.safetensors"
+    assert workflow["5"]["inputs"]["batch_size"] == 2
+    assert len(save_nodes) == 3 and all(len(ids) == 1 for ids in save_nodes)
+    for prompt, (save,) in zip(prompts, save_nodes):
+        assert workflow[save]["class_type"] == "SaveImage"
+        decode, sampler, positive = node_branch(workflow, save)
+        assert workflow[positive]["inputs"] == {"text": prompt, "clip": ["4", 1]}
+        assert workflow[sampler]["inputs"]["negative"] == ["7", 0]
+        assert workflow[sampler]["inputs"]["latent_image"] == ["5", 0]
+        assert workflow[decode]["inputs"]["vae"] == ["4", 2]
+    # The single-prompt branch is not left in the packed graph
+    assert not {"3", "6", "8", "9"} & workflow.keys()
+    assert len(workflow) == 3 + 4 * len(prompts)
+
+
+def test_execute_pack_maps_outputs_back_to_each_prompt(monkeypatch, main_module):
+    submitted = []
+    stub_comfyui(monkeypatch, main_module, submitted)
+    _, execute_pack, _ = main_module.make_job_stages(1, "m.safetensors", FakePool())
+    # A short pack: fewer jobs than the configured pack size
+    jobs = [{"index": 7 + k, "prompt": f"fire {k}", "metadata": {"n": k}} for k in range(2)]
+    assert execute_pack(jobs) == [True, True]
+    assert len(submitted) == 1
+    for k, job in enumerate(jobs):
+        assert job["prompt_id"] == "pid"
+        assert job["image_stem"] == f"pid_{k}"
+        assert list(job["outputs"]) == job["output_nodes"]
+        assert job["outputs"][job["output_nodes"][0]]["images"][0]["filename"] == f"fire {k}"
+    assert jobs[0]["output_nodes"] != jobs[1]["output_nodes"]
+
+
+def test_execute_pack_of_one_uses_the_plain_workflow(monkeypatch, main_module):
+    submitted = []
+    stub_comfyui(monkeypatch, main_module, submitted)
+    _, execute_pack, _ = main_module.make_job_stages(1, "m.safetensors", FakePool())
+    job = {"index": 0, "prompt": "fire", "metadata": {}}
+    assert execute_pack([job]) == [True]
+    assert job["output_nodes"] == ["9"] and job["image_stem"] == "pid"
+    assert job["outputs"] == {"9": {"images": [{"filename": "fire"}]}}
+
+
+def test_failed_pack_fails_every_job(monkeypatch, main_module):
+    submitted = []
+    stub_comfyui(monkeypatch, main_module, submitted)
+    monkeypatch.setattr(main_module, "wait_for_workflow", lambda *args, **kwargs: None)
+    monkeypatch.setattr(main_module, "cancel_prompt", lambda prompt_id, base_url: None)
+    _, execute_pack, _ = main_module.make_job_stages(1, "m.safetensors", FakePool())
+    jobs = [{"index": k, "prompt": f"fire {k}", "metadata": {}} for k in range(3)]
+    assert execute_pack(jobs) == [False, False, False]
+    assert all(job["outputs"] is None for job in jobs)
@@ -0,0 +1,95 @@
+import os
+import threading
+import pytest
+from PIL import Image
+from postprocess import PostProcessor, parse_sizes, process_image
+
+
+def save_png(path, size=(96, 64)):
+    Image.new("RGB", size, "orange").save(path)
+    return str(path)
+
+
+def test_parse_sizes():
+    assert parse_sizes("512, 768x512,") == [(512, 512), (768, 512)]
+    assert parse_sizes("") == [] and parse_sizes(None) == []
+
+
+def test_process_image_writes_every_variant(tmp_path):
+    source = save_png(tmp_path / "FS_a.png")
+    out = tmp_path / "derived"
+    result = process_image(source, str(out), ["webp", "jpeg"], [(32, 32)], thumbnail=16, delete_source=True)
+    assert result["derived"] == {
+        "webp_32x32": str(out / "webp_32x32" / "FS_a.webp"),
+        "jpeg_32x32": str(out / "jpeg_32x32" / "FS_a.jpg"),
+        "thumbnail": str(out / "thumbnails" / "FS_a.jpg"),
+    }
+    with Image.open(result["derived"]["webp_32x32"]) as image:
+        assert image.size == (32, 32) and image.format == "WEBP"
+    # Thumbnails keep the aspect ratio
+    with Image.open(result["derived"]["thumbnail"]) as image:
+        assert image.size == (16, 11)
+    assert result["source_deleted"] and not os.path.exists(source)
+
+
+def test_invalid_options_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="tiff"):
+        PostProcessor(str(tmp_path), ["tiff"])
+    with pytest.raises(ValueError):
+        PostProcessor(str(tmp_path), [], thumbnail=0, delete_source=True)
+
+
+@pytest.fixture
+def processor(tmp_path):
+    processor = PostProcessor(str(tmp_path / "derived"), ["webp"], thumbnail=0, max_workers=2)
+    yield processor
+    processor.close()
+
+
+def test_workers_process_a_job_and_call_back_once(tmp_path, processor):
+    paths = [save_png(tmp_path / f"FS_{n}.png") for n in range(3)]
+    calls = []
+    done = threading.Event()
+    processor.submit(paths, lambda results: (calls.append(results), done.set()))
+    assert done.wait(30)
+    (results,) = calls
+    assert sorted(results) == sorted(paths)
+    assert all(os.path.exists(result["derived"]["webp"]) for result in results.values())
+    assert processor.stats() == {"processed": 3, "failed": 0}
+
+
+def test_failures_reach_the_callback_as_none(tmp_path, processor):
+    good = save_png(tmp_path / "FS_good.png")
+    broken = tmp_path / "FS_broken.png"
+    broken.write_bytes(b"not a png")
+    results = {}
+    done = threading.Event()
+    processor.submit([good, str(broken), str(tmp_path / "FS_missing.png")],
+                     lambda r: (results.update(r), done.set()))
+    assert done.wait(30)
+    assert results[str(broken)] is None and results[str(tmp_path / "FS_missing.png")] is None
+    assert results[good]["derived"]
+    assert processor.stats() == {"processed": 1, "failed": 2}
+
+
+def test_empty_job_calls_back_at_once(processor):
+    calls = []
+    processor.submit([], calls.append)
+    assert calls == [{}]
+
+
+def test_close_drains_pending_jobs(tmp_path):
+    processor = PostProcessor(str(tmp_path / "derived"), ["png"], sizes=[(256, 256)], max_workers=1)
+    finished = []
+
+    def callback(results):
+        finished.append(results)
+        if len(finished) == 2:
+            raise RuntimeError("a failing callback must not block close")
+
+    for n in range(4):
+        processor.submit([save_png(tmp_path / f"FS_{n}.png", size=(512, 512))], callback)
+    processor.close()
+    # Every job's callback ran before close returned, the failing one included
+    assert len(finished) == 4
+    assert processor._pending == 0 and processor.stats()["processed"] == 4
@@ -0,0 +1,123 @@
+import time
+from types import SimpleNamespace
+import pytest
+from prompt_cache import PromptCache, cache_key
+
+SCENARIO = {"topic": "wildfire"}
+KEY = cache_key("llama", "template", SCENARIO, 0.7)
+
+
+def open_cache(tmp_path, policy, **kwargs):
+    return PromptCache(str(tmp_path / "cache.sqlite"), policy=policy, **kwargs)
+
+
+def generator(*prompts):
+    """A generate() callable that returns the given prompts in turn and counts its calls."""
+    remaining = list(prompts)
+
+    def generate():
+        generate.calls += 1
+        return remaining.pop(0)
+    generate.calls = 0
+    return generate
+
+
+def test_cache_key_depends_on_every_input():
+    keys = {
+        KEY,
+        cache_key("llama2", "template", SCENARIO, 0.7),
+        cache_key("llama", "other template", SCENARIO, 0.7),
+        cache_key("llama", "template", {"topic": "flood"}, 0.7),
+        cache_key("llama", "template", SCENARIO, 0.8),
+    }
+    assert len(keys) == 5
+    # Scenario field order does not matter
+    assert cache_key("m", "t", {"a": 1, "b": 2}, 0.7) == cache_key("m", "t", {"b": 2, "a": 1}, 0.7)
+
+
+def test_unknown_policy_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        open_cache(tmp_path, "always")
+
+
+def test_off_never_stores(tmp_path):
+    cache = open_cache(tmp_path, "off")
+    generate = generator("a", "b")
+    assert cache.get_or_generate(KEY, SCENARIO, generate) == "a"
+    assert cache.get_or_generate(KEY, SCENARIO, generate) == "b"
+    assert cache.stats() == {"entries": 0, "hits": 0, "misses": 0}
+
+
+def test_reuse_generates_only_on_a_miss(tmp_path):
+    cache = open_cache(tmp_path, "reuse")
+    generate = generator("a")
+    assert [cache.get_or_generate(KEY, SCENARIO, generate) for _ in range(3)] == ["a", "a", "a"]
+    assert generate.calls == 1
+    assert cache.stats() == {"entries": 1, "hits": 2, "misses": 1}
+
+
+def test_fill_generates_until_max_variants(tmp_path):
+    cache = open_cache(tmp_path, "fill", max_variants=2)
+    generate = generator("a", "b")
+    prompts = [cache.get_or_generate(KEY, SCENARIO, generate) for _ in range(6)]
+    assert prompts[:2] == ["a", "b"] and generate.calls == 2
+    # Reuse spreads over the least used variants
+    assert sorted(prompts[2:]) == ["a", "a", "b", "b"]
+
+
+def test_fresh_always_generates_and_keeps_the_newest(tmp_path):
+    cache = open_cache(tmp_path, "fresh", max_variants=2)
+    generate = generator("a", "b", "c")
+    assert [cache.get_or_generate(KEY, SCENARIO, generate) for _ in range(3)] == ["a", "b", "c"]
+    assert sorted(prompt for _, prompt, _ in cache._variants(KEY)) == ["b", "c"]
+
+
+def test_failed_generation_falls_back_to_a_cached_prompt(tmp_path):
+    cache = open_cache(tmp_path, "fresh")
+    cache.put(KEY, SCENARIO, "cached")
+    assert cache.get_or_generate(KEY, SCENARIO, generator(None)) == "cached"
+    assert cache.get_or_generate(cache_key("m", "t", SCENARIO, 0.7), SCENARIO, generator(None)) is None
+
+
+def test_old_entries_are_evicted_on_open(tmp_path, monkeypatch):
+    cache = open_cache(tmp_path, "reuse", max_age_days=1)
+    cache.put(KEY, SCENARIO, "old")
+    cache.close()
+    monkeypatch.setattr(time, "time", lambda now=time.time(): now + 2 * 86400)
+    cache = open_cache(tmp_path, "reuse", max_age_days=1)
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = open_cache(tmp_path, "reuse", max_entries=2)
+    keys = [cache_key("m", "t", {"n": n}, 0.7) for n in range(3)]
+    for n, key in enumerate(keys):
+        cache.put(key, {"n": n}, f"prompt {n}")
+    # Using the oldest entry makes the second one the least recently used
+    assert cache.lookup(keys[0]) == "prompt 0"
+    cache.evict()
+    assert cache.lookup(keys[0]) == "prompt 0"
+    assert cache.lookup(keys[1]) is None
+    assert cache.lookup(keys[2]) == "prompt 2"
+
+
+def test_batched_prompts_are_cached_under_the_batch_template(tmp_path, monkeypatch, main_module):
+    main = main_module
+    cache = open_cache(tmp_path, "reuse")
+    monkeypatch.setattr(main, "prompt_cache", cache)
+    monkeypatch.setattr(main, "get_llama_client", lambda: SimpleNamespace(endpoints=[], breakers={}))
+    batches = []
+
+    def generate_prompts_batch(url, system_message, scenarios, model, temperature, deadline=None):
+        batches.append(scenarios)
+        return [(f"batched {n}", scenario) for n, scenario in enumerate(scenarios)]
+
+    monkeypatch.setattr(main, "generate_prompts_batch", generate_prompts_batch)
+    # A prompt generated from the single-prompt template is not reused for the batch template
+    single_key = cache_key(main.LLAMA_MODEL, main.CUSTOM_SYSTEM_MESSAGE + main.CUSTOM_USER_TEMPLATE,
+                           SCENARIO, main.LLAMA_TEMPERATURE)
+    cache.put(single_key, SCENARIO, "single")
+    assert list(main.generate_prompts_with_llama("custom", "wildfire", 1)) == [("batched 0", SCENARIO)]
+    # The next run finds the batched prompt without another request
+    assert list(main.generate_prompts_with_llama("custom", "wildfire", 1)) == [("batched 0", SCENARIO)]
+    assert len(batches) == 1
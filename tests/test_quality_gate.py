@@ -0,0 +1,54 @@
+import pytest
+from PIL import Image
+import quality_gate
+from quality_gate import QualityGate, parse_filters
+
+
+def save_image(path, color):
+    Image.new("RGB", (64, 64), color).save(path)
+    return str(path)
+
+
+def test_parse_filters():
+    assert parse_filters("fire:0.05, sharpness:100,") == {"fire": 0.05, "sharpness": 100.0}
+    # Dotted function paths may not contain ":", but the threshold is split off the right
+    assert parse_filters("my.filters.score:0.5") == {"my.filters.score": 0.5}
+    assert parse_filters("") == {}
+
+
+@pytest.mark.parametrize("spec", ["fire", ":0.5", "fire:", "fire:high"])
+def test_parse_filters_rejects_malformed_pairs(spec):
+    with pytest.raises(ValueError):
+        parse_filters(spec)
+
+
+def test_unknown_filter_is_rejected():
+    with pytest.raises(ValueError, match="Unknown quality filter"):
+        QualityGate({"aesthetics": 0.5})
+
+
+def test_check_passes_at_the_threshold(tmp_path, monkeypatch):
+    monkeypatch.setitem(quality_gate.FILTERS, "half", lambda image: 0.5)
+    path = save_image(tmp_path / "a.png", "red")
+    assert QualityGate({"half": 0.5}).check(path) == (True, {"half": 0.5})
+    gate = QualityGate({"half": 0.5001})
+    assert gate.check(path) == (False, {"half": 0.5})
+    assert gate.stats() == {"checked": 1, "rejected": 1, "failed_half": 1}
+
+
+def test_every_threshold_has_to_pass(tmp_path):
+    black = save_image(tmp_path / "black.png", "black")
+    white = save_image(tmp_path / "white.png", "white")
+    gate = QualityGate({"brightness": 100, "sharpness": 0})
+    assert gate.check(white)[0]
+    passed, scores = gate.check(black)
+    assert not passed and scores["brightness"] == 0
+    assert gate.stats() == {"checked": 2, "passed": 1, "rejected": 1, "failed_brightness": 1}
+
+
+def test_unreadable_image_fails(tmp_path):
+    path = tmp_path / "broken.png"
+    path.write_bytes(b"not a png")
+    gate = QualityGate({"brightness": 0})
+    assert gate.check(str(path)) == (False, {})
+    assert gate.stats() == {"unreadable": 1, "rejected": 1}
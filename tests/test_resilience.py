@@ -0,0 +1,121 @@
+import time
+import threading
+import pytest
+from resilience import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, DeadlineExceeded,
+                        HedgedClient, LatencyTracker, backoff_delay)
+
+
+def expire(breaker):
+    breaker.opened_at -= breaker.reset_timeout
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("node", failure_threshold=2, reset_timeout=30)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == CLOSED
+    breaker.failure()
+    assert breaker.state == OPEN and breaker.trips == 1
+    assert not breaker.available() and not breaker.allow()
+
+
+def test_half_open_breaker_admits_one_trial():
+    breaker = CircuitBreaker("node", failure_threshold=1, reset_timeout=30)
+    breaker.failure()
+    expire(breaker)
+    assert breaker.available()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow() and not breaker.available()
+    breaker.success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_failed_trial_opens_the_breaker_again():
+    breaker = CircuitBreaker("node", failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        breaker.failure()
+    expire(breaker)
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN and breaker.trips == 2
+    assert not breaker.allow()
+
+
+def test_latency_quantile_needs_enough_samples():
+    latency = LatencyTracker(min_samples=3)
+    latency.add(1.0)
+    assert latency.quantile(0.5, default=-1) == -1
+    for value in (3.0, 2.0, 4.0):
+        latency.add(value)
+    assert latency.quantile(0.5) == 3.0
+    assert latency.quantile(0.99) == 4.0
+
+
+def test_backoff_delay_is_capped():
+    assert all(0 <= backoff_delay(attempt, base=1.0, maximum=5.0) <= min(5.0, 2 ** attempt) for attempt in range(8))
+
+
+def test_failed_request_fails_over_to_the_next_endpoint():
+    def call(url, cancel=None, deadline=None):
+        if url == "a":
+            raise ConnectionError("down")
+        return url
+
+    client = HedgedClient(["a", "b"], call, timeout=5)
+    assert client.call() == "b"
+    assert client.stats()["failovers"] == 1
+    assert client.breakers["a"].failures == 1
+
+
+def test_slow_request_is_hedged():
+    def call(url, cancel=None, deadline=None):
+        if url == "a":
+            cancel.wait(5)
+            return "slow"
+        return "fast"
+
+    client = HedgedClient(["a", "b"], call, timeout=5, min_hedge_delay=0.05)
+    for _ in range(10):
+        client.latency.add(0.01)
+    started = time.time()
+    assert client.call() == "fast"
+    assert time.time() - started < 1
+    assert client.stats()["hedge_wins"] == 1
+    # The loser was cancelled, which is not held against its endpoint
+    assert client.breakers["a"].failures == 0
+
+
+def test_call_gives_up_at_the_deadline():
+    client = HedgedClient(["a"], lambda url, cancel=None, deadline=None: cancel.wait(5), timeout=0.1)
+    with pytest.raises(DeadlineExceeded):
+        client.call()
+
+
+def test_open_breakers_reject_calls():
+    def call(url, cancel=None, deadline=None):
+        raise ConnectionError("down")
+
+    client = HedgedClient(["a"], call, timeout=5, attempts=1, failure_threshold=1)
+    with pytest.raises(ConnectionError):
+        client.call()
+    with pytest.raises(CircuitOpenError):
+        client.call()
+
+
+def test_counts_are_exact_under_concurrent_calls():
+    def call(url, cancel=None, deadline=None):
+        if url == "a":
+            raise ConnectionError("down")
+        return url
+
+    # A high threshold keeps "a" in rotation, so every call also fails over
+    client = HedgedClient(["a", "b"], call, timeout=5, failure_threshold=10 ** 6)
+    callers = [threading.Thread(target=lambda: [client.call() for _ in range(50)]) for _ in range(8)]
+    for thread in callers:
+        thread.start()
+    for thread in callers:
+        thread.join()
+    stats = client.stats()
+    assert stats["calls"] == 400 and stats["failovers"] == 400
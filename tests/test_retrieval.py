@@ -0,0 +1,180 @@
+import os
+import errno
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+import requests
+import retrieval
+from retrieval import LocalOutputs, download_image, download_images, fetch_image, output_images, transfer_stats
+
+
+def image(name):
+    return {"filename": name, "subfolder": "", "type": "output"}
+
+
+# Executed events arrive in execution order, which need not match the save nodes' order
+OUTPUTS = {
+    "205": {"images": [image("b.png")]},
+    "200": {"images": [image("a0.png"), image("a1.png")]},
+    "9": {"images": [image("preview.png")]},
+}
+
+
+def test_output_images_follows_the_given_node_order():
+    assert [info["filename"] for _, info in output_images(OUTPUTS, ["200", "205"])] == ["a0.png", "a1.png", "b.png"]
+    assert output_images(OUTPUTS, ["404"]) == []
+
+
+def test_output_images_defaults_to_arrival_order():
+    assert [node_id for node_id, _ in output_images(OUTPUTS)] == ["205", "200", "200", "9"]
+
+
+def test_image_destinations_index_images_within_their_node(main_module):
+    destinations = main_module.image_destinations(OUTPUTS, ["200", "205"], stem="p")
+    assert [(node_id, index, os.path.basename(path)) for node_id, index, _, path in destinations] == [
+        ("200", 0, "FS_p_0.png"), ("200", 1, "FS_p_1.png"), ("205", 0, "FS_p_2.png")]
+
+
+class ViewHandler(BaseHTTPRequestHandler):
+    FILES = {"a.png": b"A" * 300_000, "b.png": b"B" * 10}
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        body = self.FILES.get(query.get("filename", [""])[0])
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def view_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ViewHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_image_streams_to_the_destination(tmp_path, view_server):
+    dest = str(tmp_path / "a.png")
+    assert download_image(view_server, image("a.png"), dest) == dest
+    assert open(dest, "rb").read() == ViewHandler.FILES["a.png"]
+    assert os.listdir(tmp_path) == ["a.png"]
+
+
+def test_failed_download_leaves_no_file(tmp_path, view_server):
+    with pytest.raises(requests.HTTPError):
+        download_image(view_server, image("missing.png"), str(tmp_path / "missing.png"))
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_images_keeps_input_order_and_skips_failures(tmp_path, view_server):
+    names = ["a.png", "missing.png", "b.png"]
+    paths = [str(tmp_path / f"{n}.png") for n in range(3)]
+    assert download_images(view_server, [image(name) for name in names], paths) == [paths[0], paths[2]]
+    assert open(paths[2], "rb").read() == ViewHandler.FILES["b.png"]
+
+
+def exdev(*args):
+    raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+
+@pytest.fixture
+def comfyui_dirs(tmp_path):
+    """ComfyUI output and temp directories with one image each, and an empty dataset directory."""
+    (tmp_path / "output" / "sub").mkdir(parents=True)
+    (tmp_path / "output" / "sub" / "a.png").write_bytes(b"A")
+    (tmp_path / "temp").mkdir()
+    (tmp_path / "temp" / "p.png").write_bytes(b"P")
+    (tmp_path / "secret.png").write_bytes(b"S")
+    (tmp_path / "dataset").mkdir()
+    return tmp_path
+
+
+def test_path_for_finds_outputs_and_previews(comfyui_dirs):
+    local = LocalOutputs(str(comfyui_dirs / "output"))
+    assert local.path_for({"filename": "a.png", "subfolder": "sub"}) == str(comfyui_dirs / "output" / "sub" / "a.png")
+    assert local.path_for({"filename": "p.png", "type": "temp"}) == str(comfyui_dirs / "temp" / "p.png")
+    assert local.path_for({"filename": "missing.png", "subfolder": "sub"}) is None
+    assert local.path_for({"filename": "a.png", "subfolder": "sub", "type": "input"}) is None
+
+
+@pytest.mark.parametrize("subfolder, filename", [
+    ("..", "secret.png"),
+    ("../..", "etc/passwd"),
+    ("sub/../..", "secret.png"),
+    ("", "/etc/passwd"),
+    ("/etc", "passwd"),
+])
+def test_path_for_rejects_paths_outside_the_output_dirs(comfyui_dirs, subfolder, filename):
+    local = LocalOutputs(str(comfyui_dirs / "output"))
+    assert local.path_for({"filename": filename, "subfolder": subfolder}) is None
+
+
+def test_path_for_does_not_follow_symlinks_out(comfyui_dirs):
+    os.symlink(comfyui_dirs / "secret.png", comfyui_dirs / "output" / "link.png")
+    assert LocalOutputs(str(comfyui_dirs / "output")).path_for({"filename": "link.png"}) is None
+
+
+def test_hardlink_shares_the_file(comfyui_dirs):
+    src = str(comfyui_dirs / "output" / "sub" / "a.png")
+    dest = str(comfyui_dirs / "dataset" / "a.png")
+    assert LocalOutputs(str(comfyui_dirs / "output")).transfer(src, dest) == "hardlink"
+    assert os.path.samefile(src, dest)
+
+
+def test_hardlink_across_filesystems_falls_back_to_copy(comfyui_dirs, monkeypatch):
+    monkeypatch.setattr(retrieval.os, "link", exdev)
+    monkeypatch.setattr(retrieval, "_reflink", exdev)
+    src = str(comfyui_dirs / "output" / "sub" / "a.png")
+    dest = str(comfyui_dirs / "dataset" / "a.png")
+    assert LocalOutputs(str(comfyui_dirs / "output")).transfer(src, dest) == "copy"
+    assert open(dest, "rb").read() == b"A" and not os.path.samefile(src, dest)
+    # No temporary files are left behind by the failed attempts
+    assert os.listdir(comfyui_dirs / "dataset") == ["a.png"]
+
+
+def test_move_across_filesystems_copies_and_removes_the_source(comfyui_dirs, monkeypatch):
+    src = str(comfyui_dirs / "output" / "sub" / "a.png")
+    dest = str(comfyui_dirs / "dataset" / "a.png")
+    replace = os.replace
+    monkeypatch.setattr(retrieval.os, "replace", lambda a, b: exdev() if a == src else replace(a, b))
+    monkeypatch.setattr(retrieval, "_reflink", exdev)
+    assert LocalOutputs(str(comfyui_dirs / "output"), method="move").transfer(src, dest) == "copy"
+    assert open(dest, "rb").read() == b"A" and not os.path.exists(src)
+
+
+def test_failed_copy_raises(comfyui_dirs, monkeypatch):
+    monkeypatch.setattr(retrieval.shutil, "copyfile", exdev)
+    src = str(comfyui_dirs / "output" / "sub" / "a.png")
+    with pytest.raises(OSError):
+        LocalOutputs(str(comfyui_dirs / "output"), method="copy").transfer(src, str(comfyui_dirs / "dataset" / "a.png"))
+    assert os.listdir(comfyui_dirs / "dataset") == []
+
+
+def test_fetch_image_downloads_what_is_not_on_disk(comfyui_dirs, view_server):
+    local = LocalOutputs(str(comfyui_dirs / "output"))
+    dest = str(comfyui_dirs / "dataset" / "b.png")
+    before = transfer_stats().get("http", 0)
+    # b.png only exists on the server
+    assert fetch_image(view_server, image("b.png"), dest, local) == dest
+    assert open(dest, "rb").read() == ViewHandler.FILES["b.png"]
+    assert transfer_stats()["http"] == before + 1
+
+
+def test_fetch_image_downloads_when_every_local_way_fails(comfyui_dirs, view_server, monkeypatch):
+    (comfyui_dirs / "output" / "b.png").write_bytes(b"local")
+    monkeypatch.setattr(retrieval.os, "link", exdev)
+    monkeypatch.setattr(retrieval, "_reflink", exdev)
+    monkeypatch.setattr(retrieval.shutil, "copyfile", exdev)
+    dest = str(comfyui_dirs / "dataset" / "b.png")
+    assert fetch_image(view_server, image("b.png"), dest, LocalOutputs(str(comfyui_dirs / "output"))) == dest
+    assert open(dest, "rb").read() == ViewHandler.FILES["b.png"]
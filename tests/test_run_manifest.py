@@ -0,0 +1,128 @@
+import os
+from types import SimpleNamespace
+from metadata_store import MetadataStore, iter_records
+from run_manifest import GENERATED, REQUEUED, RETRIEVED, SUBMITTED, WRITTEN, RunManifest
+
+
+def interrupted_run(path):
+    """A 10-prompt run that crashed with 4 jobs written, 2 submitted and 1 only generated."""
+    manifest = RunManifest(path, params={"num_prompts": 10})
+    for key in range(4):
+        manifest.record(key, GENERATED, prompt=f"prompt {key}", metadata={})
+        manifest.record(key, WRITTEN, image_paths=[])
+    for key in (4, 5):
+        manifest.record(key, GENERATED, prompt=f"prompt {key}", metadata={})
+        manifest.record(key, SUBMITTED, prompt_id=f"id-{key}", node="http://127.0.0.1:9")
+    manifest.record(6, GENERATED, prompt="prompt 6", metadata={"n": 6})
+    manifest.close()
+    return RunManifest(path)
+
+
+def test_replay_restores_params_and_latest_state(tmp_path):
+    manifest = interrupted_run(str(tmp_path / "run.jsonl"))
+    assert manifest.params == {"num_prompts": 10}
+    assert manifest.counts() == {WRITTEN: 4, SUBMITTED: 2, GENERATED: 1}
+    assert [key for key, _ in manifest.in_state(SUBMITTED)] == [4, 5]
+    # Fields of earlier states are kept
+    assert manifest.jobs[4]["prompt"] == "prompt 4" and manifest.jobs[4]["prompt_id"] == "id-4"
+    assert manifest.next_index() == 7
+    assert manifest.active_count() == 7
+
+
+def test_requeued_jobs_are_not_active(tmp_path):
+    manifest = interrupted_run(str(tmp_path / "run.jsonl"))
+    manifest.record(6, REQUEUED)
+    assert manifest.active_count() == 6
+    manifest.close()
+    assert RunManifest(str(tmp_path / "run.jsonl")).jobs[6]["state"] == REQUEUED
+
+
+def test_track_records_generated_prompts(tmp_path):
+    manifest = RunManifest(str(tmp_path / "run.jsonl"))
+    prompts = [("a", {"n": 0}), (None, {}), ("c", {"n": 2})]
+    assert list(manifest.track(iter(prompts), start_index=5)) == prompts
+    assert [key for key, _ in manifest.in_state(GENERATED)] == [5, 7]
+    assert manifest.jobs[7] == {"prompt": "c", "metadata": {"n": 2}, "state": GENERATED}
+
+
+def test_path_for(tmp_path):
+    assert RunManifest.path_for(str(tmp_path), "20250101_120000") == str(tmp_path / "20250101_120000.jsonl")
+    assert RunManifest.path_for(str(tmp_path), "other/run.jsonl") == "other/run.jsonl"
+
+
+class FakePool:
+    def __len__(self):
+        return 1
+
+
+def test_resume_generates_only_the_missing_prompts(tmp_path, monkeypatch, main_module):
+    main = main_module
+    manifest = interrupted_run(str(tmp_path / "run.jsonl"))
+    submitted = []
+
+    def execute(job):
+        submitted.append(job["prompt"])
+        return True
+
+    def collect(job):
+        manifest.record(job["index"], WRITTEN, image_paths=[])
+        return True
+
+    monkeypatch.setattr(main, "build_worker_pool", lambda nodes: FakePool())
+    monkeypatch.setattr(main, "make_job_stages", lambda *args, **kwargs: (execute, None, collect))
+    # ComfyUI lost the two submitted prompts
+    monkeypatch.setattr(main, "prompt_status", lambda prompt_id, base_url: "unknown")
+    monkeypatch.setattr(main, "_prompt_stream",
+                        lambda mode, topic, num_prompts, llm_batch_size=1:
+                        ((f"new {n}", {}) for n in range(num_prompts)))
+
+    stats = main.generate_batch(mode="custom", topic="test", num_prompts=10, manifest=manifest)
+
+    assert submitted == ["prompt 4", "prompt 5", "prompt 6", "new 0", "new 1", "new 2"]
+    assert stats["generated"] == 6 and stats["completed"] == 6
+    assert manifest.active_count() == 10
+    assert manifest.counts() == {WRITTEN: 10, REQUEUED: 3}
+
+
+def test_resume_does_not_collect_recorded_images_again(tmp_path, monkeypatch, main_module):
+    main = main_module
+    log_path = str(tmp_path / "metadata.jsonl")
+    monkeypatch.setattr(main, "METADATA_LOG_FILE", log_path)
+    monkeypatch.setattr(main, "metadata_store", MetadataStore(log_path))
+    image = lambda stem, n: os.path.join(main.OUTPUT_DIR, f"FS_{stem}_{n}.png")
+
+    manifest = RunManifest(str(tmp_path / "run.jsonl"))
+    for key in range(3):
+        manifest.record(key, GENERATED, prompt=f"prompt {key}", metadata={})
+        manifest.record(key, SUBMITTED, prompt_id=f"id-{key}", node="http://127.0.0.1:9", output_nodes=["9"],
+                        image_stem=f"resume-{key}")
+        manifest.record(key, RETRIEVED, image_paths=[image(f"resume-{key}", n) for n in range(2)])
+    # Job 0 was fully written and job 1 half written before the crash; their PNGs went into shards
+    for key, n in [(0, 0), (0, 1), (1, 0)]:
+        main.metadata_store.append({"image_path": image(f"resume-{key}", n), "prompt_id": f"id-{key}"})
+    # Job 2's images are still on disk
+    for n in range(2):
+        open(image("resume-2", n), "wb").close()
+
+    history = {"id-1": {"outputs": {"9": {"images": [{"filename": "a.png"}, {"filename": "b.png"}]}}}}
+    session = SimpleNamespace(get=lambda url, timeout: SimpleNamespace(raise_for_status=lambda: None,
+                                                                       json=lambda: history))
+    downloaded = []
+
+    def download_images(base_url, images, paths, max_workers=4, local=None):
+        downloaded.extend(paths)
+        for path in paths:
+            open(path, "wb").close()
+        return paths
+
+    monkeypatch.setattr(main, "get_session", lambda: session)
+    monkeypatch.setattr(main, "download_images", download_images)
+    monkeypatch.setattr(main, "prompt_status", lambda prompt_id, base_url: "completed")
+    _, _, collect = main.make_job_stages(1, "m.safetensors", None, manifest)
+
+    assert main.recover_jobs(manifest, collect) == []
+    # Only job 1's missing image is downloaded again
+    assert downloaded == [image("resume-1", 1)]
+    assert manifest.counts() == {WRITTEN: 3}
+    paths = [entry["image_path"] for entry in iter_records(log_path)]
+    assert sorted(paths) == sorted(image(f"resume-{key}", n) for key in range(3) for n in range(2))
@@ -0,0 +1,121 @@
+import json
+from collections import Counter
+import itertools
+import pytest
+from scenario_sampler import STRATEGIES, CoverageIndex, ScenarioSampler
+
+VALUES = {
+    "place": ["forest", "hills", "town"],
+    "time": ["day", "night"],
+    "stage": ["smoke", "flames", "embers"],
+}
+
+
+def cells(scenarios):
+    return Counter(tuple(s[name] for name in VALUES) for s in scenarios)
+
+
+def record(prompt_id, **scenario):
+    return json.dumps({"prompt_id": prompt_id, "metadata": scenario}) + "\n"
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_same_seed_draws_the_same_scenarios(strategy):
+    draw = lambda seed: ScenarioSampler(VALUES, strategy, seed=seed).sample(20)
+    assert draw(7) == draw(7)
+    assert draw(7) != draw(8)
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        ScenarioSampler(VALUES, "grid")
+
+
+def test_stratified_covers_every_cell_evenly():
+    scenarios = ScenarioSampler(VALUES, "stratified", seed=1).sample(2 * 18)
+    assert set(cells(scenarios).values()) == {2} and len(cells(scenarios)) == 18
+
+
+def test_stratified_follows_weights():
+    weights = {"time": {"night": 3.0}, "stage": {"embers": 0}}
+    scenarios = ScenarioSampler(VALUES, "stratified", weights=weights, seed=1).sample(48)
+    times = Counter(s["time"] for s in scenarios)
+    assert times == {"night": 36, "day": 12}
+    assert not any(s["stage"] == "embers" for s in scenarios)
+
+
+def test_stratified_fills_gaps_in_the_existing_dataset():
+    index = CoverageIndex(VALUES)
+    covered = list(itertools.product(*VALUES.values()))[:15]
+    for cell in covered:
+        index.add(dict(zip(VALUES, cell)))
+    scenarios = ScenarioSampler(VALUES, "stratified", index=index, seed=1).sample(3)
+    assert not set(cells(scenarios)) & set(covered)
+
+
+def test_lhs_spreads_each_dimension_evenly():
+    sampler = ScenarioSampler(VALUES, "lhs", seed=3)
+    sampler.plan(6)
+    scenarios = [sampler.next() for _ in range(6)]
+    for name, values in VALUES.items():
+        assert Counter(s[name] for s in scenarios) == {value: 6 // len(values) for value in values}
+
+
+def test_pairwise_covers_every_pair_of_values_within_one_block():
+    scenarios = ScenarioSampler(VALUES, "pairwise", seed=5).sample(12)
+    names = list(VALUES)
+    for a, b in itertools.combinations(names, 2):
+        seen = {(s[a], s[b]) for s in scenarios}
+        assert seen == set(itertools.product(VALUES[a], VALUES[b]))
+
+
+def test_random_never_draws_zero_weight_values():
+    scenarios = ScenarioSampler(VALUES, "random", weights={"place": {"town": 0}}, seed=2).sample(100)
+    assert {s["place"] for s in scenarios} == {"forest", "hills"}
+
+
+def test_coverage_index_resumes_from_its_offset(tmp_path):
+    log = tmp_path / "metadata.jsonl"
+    index_path = str(tmp_path / "coverage.json")
+    # Two images of the same prompt count once
+    log.write_text(record("a", place="forest", time="day", stage="smoke") * 2 +
+                   record("b", place="town", time="night", stage="flames"))
+    index = CoverageIndex.load(list(VALUES), index_path)
+    assert index.update_from_log(str(log)) == 2
+    index.save()
+
+    with open(log, "a") as f:
+        f.write(record("c", place="forest", time="day", stage="smoke"))
+        f.write('{"prompt_id": "d", "metad')
+    index = CoverageIndex.load(list(VALUES), index_path)
+    assert index.log_offset > 0
+    assert index.update_from_log(str(log)) == 1
+    assert index.cells == {("forest", "day", "smoke"): 2, ("town", "night", "flames"): 1}
+    # The incomplete record is read once it is finished
+    with open(log, "a") as f:
+        f.write('ata": {"place": "hills", "time": "day", "stage": "embers"}}\n')
+    assert index.update_from_log(str(log)) == 1
+    assert index.log_offset == log.stat().st_size
+    assert index.summary(VALUES) == {"cells": 18, "covered": 3, "prompts": 4}
+
+
+def test_coverage_index_rebuilds_after_the_log_shrinks(tmp_path):
+    log = tmp_path / "metadata.jsonl"
+    log.write_text(record("a", place="forest", time="day", stage="smoke") +
+                   record("b", place="town", time="night", stage="flames"))
+    index = CoverageIndex(list(VALUES))
+    index.update_from_log(str(log))
+    log.write_text(record("b", place="town", time="night", stage="flames"))
+    assert index.update_from_log(str(log)) == 1
+    assert index.cells == {("town", "night", "flames"): 1}
+
+
+def test_coverage_index_of_other_dimensions_is_ignored(tmp_path):
+    path = str(tmp_path / "coverage.json")
+    index = CoverageIndex(["place", "time"], path)
+    index.add({"place": "forest", "time": "day"})
+    index.log_offset = 100
+    index.save()
+    assert CoverageIndex.load(["place", "time"], path).log_offset == 100
+    reloaded = CoverageIndex.load(list(VALUES), path)
+    assert reloaded.cells == {} and reloaded.log_offset == 0
@@ -0,0 +1,79 @@
+import os
+import json
+import tarfile
+from shards import ShardWriter, load_index, read_member
+
+
+def sample(n):
+    return {"png": bytes([n]) * (700 + n)}, {"n": n}
+
+
+def shard_files(directory):
+    return sorted(os.listdir(directory))
+
+
+def test_finalized_shard_index_points_at_each_member(tmp_path):
+    writer = ShardWriter(str(tmp_path), max_samples=2)
+    for n in range(3):
+        files, metadata = sample(n)
+        assert writer.write(f"k{n}", files, metadata)["file"] == f"shard-00000{n // 2}.tar"
+    writer.close()
+
+    assert shard_files(tmp_path) == ["shard-000000.idx.jsonl", "shard-000000.tar",
+                                     "shard-000001.idx.jsonl", "shard-000001.tar"]
+    entries = load_index(str(tmp_path / "shard-000000.tar"))
+    assert [entry["key"] for entry in entries] == ["k0", "k1"]
+    offset, size = entries[1]["members"]["png"]
+    assert read_member(str(tmp_path / "shard-000000.tar"), offset, size) == sample(1)[0]["png"]
+    offset, size = entries[1]["members"]["json"]
+    assert json.loads(read_member(str(tmp_path / "shard-000000.tar"), offset, size)) == {"n": 1}
+
+
+def test_crashed_shard_keeps_its_complete_samples(tmp_path):
+    writer = ShardWriter(str(tmp_path))
+    for n in range(3):
+        writer.write(f"k{n}", *sample(n))
+    part = str(tmp_path / "shard-000000.tar.part")
+    # Crash part-way through the last sample's metadata, before the shard was finalized
+    writer._file.flush()
+    json_offset, _ = writer._entries[-1]["members"]["json"]
+    os.truncate(part, json_offset + 2)
+    writer._file.close()
+
+    recovered = ShardWriter(str(tmp_path))
+    assert shard_files(tmp_path) == ["shard-000000.idx.jsonl", "shard-000000.tar"]
+    assert [entry["key"] for entry in load_index(str(tmp_path / "shard-000000.tar"))] == ["k0", "k1"]
+    assert recovered.stats()["known_samples"] == 2
+
+    # The lost sample is written again into a new shard; recovered ones are skipped
+    assert recovered.write("k1", *sample(1)) == {"file": "shard-000000.tar", "key": "k1"}
+    assert recovered.write("k2", *sample(2)) == {"file": "shard-000001.tar", "key": "k2"}
+    recovered.close()
+    assert [entry["key"] for entry in load_index(str(tmp_path / "shard-000001.tar"))] == ["k2"]
+
+
+def test_crashed_shard_without_complete_samples_is_removed(tmp_path):
+    part = tmp_path / "shard-000000.tar.part"
+    part.write_bytes(b"\0" * 100)
+    ShardWriter(str(tmp_path))
+    assert shard_files(tmp_path) == []
+
+
+def test_shards_stay_within_the_size_cap(tmp_path):
+    cap = 8 * 1024
+    writer = ShardWriter(str(tmp_path), max_bytes=cap)
+    for n in range(10):
+        writer.write(f"k{n}", {"png": b"x" * 10}, {"n": n})
+    writer.close()
+
+    shards = [str(tmp_path / name) for name in shard_files(tmp_path) if name.endswith(".tar")]
+    assert len(shards) > 1
+    for shard in shards:
+        assert os.path.getsize(shard) <= cap
+        with tarfile.open(shard) as tar:
+            members = tar.getmembers()
+        # No PAX headers: each member is one header block plus its data
+        assert all(member.pax_headers == {} for member in members)
+        indexed = {f"{entry['key']}.{extension}": tuple(location)
+                   for entry in load_index(shard) for extension, location in entry["members"].items()}
+        assert indexed == {member.name: (member.offset_data, member.size) for member in members}
@@ -0,0 +1,96 @@
+import json
+import pytest
+import timing
+from metadata_store import iter_records
+from timing import RunTimings
+
+
+def timings_with(stage, values):
+    timings = RunTimings()
+    for job, seconds in enumerate(values):
+        timings.add(job, stage, seconds)
+    return timings
+
+
+def test_summary_percentiles_are_nearest_rank():
+    summary = timings_with("sampling", [float(n) for n in range(100, 0, -1)]).summary()
+    assert summary["stages"]["sampling"] == {"count": 100, "total": 5050.0, "mean": 50.5,
+                                             "p50": 50.0, "p90": 90.0, "p99": 99.0}
+    single = timings_with("llm", [2.5]).summary()["stages"]["llm"]
+    assert single["p50"] == single["p99"] == 2.5
+
+
+def test_missing_and_negative_durations_are_skipped():
+    timings = timings_with("download", [None, -1.0, 0.0, 1.0])
+    assert timings.summary()["stages"]["download"]["count"] == 2
+
+
+def test_span_records_even_when_the_body_raises():
+    timings = RunTimings()
+    with pytest.raises(RuntimeError):
+        with timings.span(0, "submit"):
+            raise RuntimeError("refused")
+    assert timings.summary()["stages"]["submit"]["count"] == 1
+
+
+def test_execution_trace_is_named_by_node_type():
+    timings = RunTimings()
+    workflow = {"3": {"class_type": "KSampler"}, "8": {"class_type": "VAEDecode"},
+                "4": {"class_type": "CheckpointLoaderSimple"}, "99": {"class_type": "MyNode"}}
+    timings.add_execution(0, workflow, {"nodes": {"3": (1.0, 4.0), "8": (5.0, 0.5), "99": (5.5, 0.1)},
+                                        "cached": ["4"]})
+    summary = timings.summary()
+    assert set(summary["stages"]) == {"sampling", "vae_decode", "MyNode"}
+    assert summary["cached_nodes"] == {"model_load": 1}
+
+
+def test_prometheus_text():
+    timings = timings_with("sampling", [1.0, 2.0, 3.0, 4.0])
+    timings.cached_nodes["model_load"] = 2
+    summary = timings.summary()
+    summary["wall_seconds"] = 12.5
+    summary["stats"] = {"completed": 4, "failed": 0, "resumed": True, "note": "x"}
+    lines = timings.prometheus(summary).splitlines()
+    assert "aig_run_wall_seconds 12.5" in lines
+    assert "# TYPE aig_stage_seconds summary" in lines
+    assert [line for line in lines if line.startswith("aig_stage_seconds")] == [
+        'aig_stage_seconds{stage="sampling",quantile="0.5"} 2.0',
+        'aig_stage_seconds{stage="sampling",quantile="0.9"} 4.0',
+        'aig_stage_seconds{stage="sampling",quantile="0.99"} 4.0',
+        'aig_stage_seconds_sum{stage="sampling"} 10.0',
+        'aig_stage_seconds_count{stage="sampling"} 4',
+    ]
+    assert 'aig_cached_nodes_total{stage="model_load"} 2' in lines
+    # Only numeric counters are exported
+    assert [line for line in lines if line.startswith("aig_run_jobs")] == [
+        'aig_run_jobs{counter="completed"} 4', 'aig_run_jobs{counter="failed"} 0']
+
+
+def test_spans_are_logged_as_they_are_recorded(tmp_path):
+    path = str(tmp_path / "spans.jsonl")
+    timings = RunTimings(path)
+    timings.add(3, "llm", 1.5, start=100.0)
+    timings.close()
+    assert list(iter_records(path)) == [{"job": 3, "stage": "llm", "start": 100.0, "seconds": 1.5}]
+
+
+def test_write_produces_both_files(tmp_path):
+    timings = timings_with("sampling", [1.0])
+    json_path, prom_path = str(tmp_path / "timings.json"), str(tmp_path / "timings.prom")
+    summary = timings.write(json_path, prom_path, extra={"stats": {"completed": 1}})
+    assert json.load(open(json_path)) == summary
+    assert 'aig_run_jobs{counter="completed"} 1' in open(prom_path).read()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["timings.json", "timings.prom"]
+
+
+def test_interrupted_write_keeps_the_previous_summary(tmp_path, monkeypatch):
+    json_path = tmp_path / "timings.json"
+    json_path.write_text('{"previous": true}')
+
+    def crash(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(timing.os, "replace", crash)
+    with pytest.raises(OSError):
+        timings_with("sampling", [1.0]).write(str(json_path))
+    assert json.loads(json_path.read_text()) == {"previous": True}
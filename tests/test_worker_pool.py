@@ -0,0 +1,42 @@
+from worker_pool import WorkerPool
+
+
+def make_pool(**kwargs):
+    # An infinite refresh interval keeps acquire from polling /queue
+    return WorkerPool.from_urls(["http://a", "http://b"], refresh_interval=float("inf"), **kwargs)
+
+
+def test_acquire_picks_the_least_loaded_node():
+    pool = make_pool()
+    a, b = pool.nodes
+    a.queue_depth = 3
+    assert pool.acquire() is b
+
+
+def test_acquire_prefers_the_given_node_even_when_busier():
+    pool = make_pool()
+    a, b = pool.nodes
+    a.queue_depth = 3
+    assert pool.acquire(prefer=a) is a
+    assert a.inflight == 1
+
+
+def test_acquire_skips_a_preferred_node_whose_circuit_is_open():
+    pool = make_pool(max_failures=1)
+    a, b = pool.nodes
+    pool.release(pool.acquire(prefer=a), failed=True)
+    assert pool.acquire(prefer=a) is b
+
+
+def test_run_falls_back_when_the_preferred_node_fails():
+    pool = make_pool()
+    a, b = pool.nodes
+    b.queue_depth = 3
+    calls = []
+
+    def job(node):
+        calls.append(node)
+        return node is a and "done"
+
+    assert pool.run(job, prefer=b) == (a, "done")
+    assert calls == [b, a]
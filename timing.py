@@ -0,0 +1,186 @@
+import os
+import json
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from metadata_store import MetadataStore
+
+logger = logging.getLogger(__name__)
+
+# Stage names for ComfyUI node types reported over the WebSocket
+NODE_STAGES = {
+    "CheckpointLoaderSimple": "model_load",
+    "CLIPTextEncode": "text_encode",
+    "EmptyLatentImage": "latent_init",
+    "KSampler": "sampling",
+    "KSamplerAdvanced": "sampling",
+    "VAEDecode": "vae_decode",
+    "SaveImage": "save_image",
+    "PreviewImage": "save_image",
+    "LatentUpscale": "latent_upscale",
+    "LatentFromBatch": "latent_init",
+}
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def percentile(ordered, q):
+    """Nearest-rank quantile (0-1) of an already sorted list."""
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def _write_atomic(path, text):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class RunTimings:
+    """
+    Per-job stage spans for one run, summarised at the end
+
+    Every span is (job, stage, start, seconds). Job-level stages are the
+    Llama call, the wait for an executor, /prompt submission, the ComfyUI
+    queue, execution, download and metadata writing; node-level stages come
+    from the WebSocket `executing`/`executed`/`execution_cached` events and
+    are named after the node type (sampling, vae_decode, ...). A workflow
+    carrying several packed prompts records its ComfyUI spans once, under the
+    first prompt's job.
+
+    Spans are appended to `spans_path` (JSONL) as they are recorded when a
+    path is given; durations are also kept in memory for the summary.
+    """
+
+    def __init__(self, spans_path=None):
+        self.started = time.time()
+        self.finished = None
+        self.stages = {}
+        self.cached_nodes = {}
+        self._lock = threading.Lock()
+        self._store = MetadataStore(spans_path) if spans_path else None
+
+    def add(self, job, stage, seconds, start=None):
+        """
+        Record one span
+
+        Args:
+            job (int): Job index within the run
+            stage (str): Stage name
+            seconds (float): Duration
+            start (float): Wall-clock start time (default: now minus the duration)
+        """
+        if seconds is None or seconds < 0:
+            return
+        start = start if start is not None else time.time() - seconds
+        with self._lock:
+            self.stages.setdefault(stage, []).append(seconds)
+        if self._store is not None:
+            self._store.append({"job": job, "stage": stage, "start": round(start, 6), "seconds": round(seconds, 6)})
+
+    @contextmanager
+    def span(self, job, stage):
+        """Time the body of a with-block as one span, whether or not it raises."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(job, stage, time.time() - start, start)
+
+    def add_execution(self, job, workflow, execution):
+        """
+        Record node-level spans from a WebSocket execution trace
+
+        Args:
+            job (int): Job index the workflow belongs to
+            workflow (dict): The submitted workflow, for node types
+            execution (dict): Trace filled in by ComfyUIWebSocket.wait
+                ({"nodes": {node_id: (start, seconds)}, "cached": [...]})
+        """
+        for node_id, (start, seconds) in execution.get("nodes", {}).items():
+            class_type = workflow.get(node_id, {}).get("class_type", "unknown")
+            self.add(job, NODE_STAGES.get(class_type, class_type), seconds, start)
+        with self._lock:
+            for node_id in execution.get("cached", []):
+                class_type = workflow.get(node_id, {}).get("class_type", "unknown")
+                stage = NODE_STAGES.get(class_type, class_type)
+                self.cached_nodes[stage] = self.cached_nodes.get(stage, 0) + 1
+
+    def summary(self):
+        """
+        Totals and percentiles per stage
+
+        Returns:
+            dict: {"wall_seconds", "stages": {stage: {count, total, mean, p50, p90, p99}}, "cached_nodes"}
+        """
+        end = self.finished or time.time()
+        with self._lock:
+            stages = {}
+            for stage, values in self.stages.items():
+                ordered = sorted(values)
+                stats = {"count": len(ordered), "total": round(sum(ordered), 4),
+                         "mean": round(sum(ordered) / len(ordered), 4)}
+                for q in QUANTILES:
+                    stats[f"p{round(q * 100)}"] = round(percentile(ordered, q), 4)
+                stages[stage] = stats
+            return {"wall_seconds": round(end - self.started, 4), "stages": stages,
+                    "cached_nodes": dict(self.cached_nodes)}
+
+    def prometheus(self, summary=None, prefix="aig"):
+        """Render the summary in Prometheus text exposition format."""
+        summary = summary or self.summary()
+        lines = [
+            f"# HELP {prefix}_run_wall_seconds Wall-clock duration of the run",
+            f"# TYPE {prefix}_run_wall_seconds gauge",
+            f"{prefix}_run_wall_seconds {summary['wall_seconds']}",
+            f"# HELP {prefix}_stage_seconds Time spent in each pipeline stage per job",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for stage, stats in sorted(summary["stages"].items()):
+            for q in QUANTILES:
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} {stats[f"p{round(q * 100)}"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {stats["total"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines += [
+            f"# HELP {prefix}_cached_nodes_total Nodes ComfyUI served from its cache",
+            f"# TYPE {prefix}_cached_nodes_total counter",
+        ]
+        for stage, count in sorted(summary["cached_nodes"].items()):
+            lines.append(f'{prefix}_cached_nodes_total{{stage="{stage}"}} {count}')
+        counters = {key: value for key, value in (summary.get("stats") or {}).items()
+                    if isinstance(value, (int, float)) and not isinstance(value, bool)}
+        if counters:
+            lines += [f"# HELP {prefix}_run_jobs Job counters of the run (generated, completed, failures)",
+                      f"# TYPE {prefix}_run_jobs gauge"]
+            for key, value in sorted(counters.items()):
+                lines.append(f'{prefix}_run_jobs{{counter="{key}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path, prom_path=None, extra=None):
+        """
+        Finish the run and write its summary as JSON and, optionally, Prometheus text
+
+        Args:
+            json_path (str): Destination of the JSON summary
+            prom_path (str): Destination of the Prometheus text file (e.g. for node_exporter's textfile collector)
+            extra (dict): Additional fields for the JSON summary, such as the run's counters
+
+        Returns:
+            dict: The summary that was written
+        """
+        self.finished = self.finished or time.time()
+        summary = self.summary()
+        if extra:
+            summary.update(extra)
+        # Both files are replaced atomically, so a reader or textfile collector never sees a partial one
+        _write_atomic(json_path, json.dumps(summary, indent=2))
+        if prom_path:
+            _write_atomic(prom_path, self.prometheus(summary))
+        logger.info(f"Timing summary written to {json_path}")
+        return summary
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
@@ -0,0 +1,261 @@
+import logging
+import threading
+import time
+import requests
+from resilience import OPEN, CircuitBreaker, backoff_delay
+
+logger = logging.getLogger(__name__)
+
+# Assumed job latency (seconds) for nodes that have not finished a job yet
+DEFAULT_LATENCY = 30.0
+
+# Assumed cost (seconds) of loading a different checkpoint on a node
+DEFAULT_SWAP_PENALTY = 30.0
+
+
+def ws_url_for(base_url):
+    """Derive the ComfyUI WebSocket URL from its HTTP base URL."""
+    if base_url.startswith("https://"):
+        return "wss://" + base_url[len("https://"):].rstrip("/") + "/ws"
+    return "ws://" + base_url.split("://", 1)[-1].rstrip("/") + "/ws"
+
+
+class ComfyUINode:
+    """
+    A single ComfyUI server and the load/health figures used to schedule on it
+    """
+
+    def __init__(self, base_url, ws_url=None):
+        self.base_url = base_url.rstrip("/")
+        self.ws_url = ws_url or ws_url_for(self.base_url)
+        self.inflight = 0
+        self.queue_depth = 0
+        self.latency = None
+        self.completed = 0
+        # Replaced by WorkerPool with one using the pool's failure limits
+        self.breaker = CircuitBreaker(self.base_url)
+        self.last_refresh = 0.0
+        # Checkpoint of the last job sent here, i.e. the one ComfyUI will have loaded
+        self.current_model = None
+        self.swaps = 0
+
+    @property
+    def api_url(self):
+        return f"{self.base_url}/prompt"
+
+    @property
+    def view_url(self):
+        return f"{self.base_url}/view"
+
+    def is_available(self, now=None):
+        return self.breaker.available(now)
+
+    def recovers_at(self):
+        """When an open breaker lets the next trial job through."""
+        return self.breaker.opened_at + self.breaker.reset_timeout if self.breaker.state == OPEN else 0.0
+
+    def estimated_wait(self):
+        """Seconds a new job would wait here: queued jobs times the recent job latency."""
+        pending = max(self.queue_depth, self.inflight)
+        return (pending + 1) * (self.latency or DEFAULT_LATENCY)
+
+    def needs_swap(self, model):
+        """Whether running `model` here means loading a different checkpoint first."""
+        return model is not None and self.current_model is not None and self.current_model != model
+
+    def __repr__(self):
+        return f"ComfyUINode({self.base_url!r})"
+
+
+class WorkerPool:
+    """
+    Dispatch workflows across several ComfyUI nodes, least-loaded first
+
+    Load is the node's `/queue` depth (refreshed at most every
+    `refresh_interval` seconds) combined with the jobs we have in flight there
+    and an exponentially weighted average of its recent job latency. Each
+    node has a circuit breaker: after `max_failures` failures in a row it is
+    taken out of rotation for `cooldown` seconds, then gets a single trial
+    job that decides whether it comes back. A failed job moves to another
+    node; once every node has been tried it is retried after a jittered
+    exponential backoff, for `attempts` submissions in total.
+
+    Jobs that name a checkpoint prefer nodes that already have it loaded: a
+    node on another checkpoint is charged `swap_penalty` extra seconds, and
+    every change of checkpoint on a node is counted as a swap.
+    """
+
+    def __init__(self, nodes, refresh_interval=2.0, max_failures=3, cooldown=60.0, latency_alpha=0.3,
+                 swap_penalty=DEFAULT_SWAP_PENALTY, attempts=1, backoff=1.0):
+        if not nodes:
+            raise ValueError("WorkerPool needs at least one ComfyUI node")
+        self.nodes = list(nodes)
+        self.refresh_interval = refresh_interval
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.attempts = attempts
+        self.backoff = backoff
+        for node in self.nodes:
+            node.breaker = CircuitBreaker(node.base_url, max_failures, cooldown)
+        self.latency_alpha = latency_alpha
+        self.swap_penalty = swap_penalty
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_urls(cls, base_urls, **kwargs):
+        """Build a pool from a list of ComfyUI base URLs."""
+        return cls([ComfyUINode(url) for url in base_urls], **kwargs)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def refresh(self, node, force=False):
+        """Update a node's queue depth from its /queue endpoint."""
+        now = time.time()
+        if not force and now - node.last_refresh < self.refresh_interval:
+            return
+        node.last_refresh = now
+        try:
+            response = requests.get(f"{node.base_url}/queue", timeout=2)
+            response.raise_for_status()
+            data = response.json()
+            node.queue_depth = len(data.get("queue_running", [])) + len(data.get("queue_pending", []))
+        except Exception as e:
+            logger.warning(f"Could not read queue from {node.base_url}: {e}")
+            node.breaker.failure()
+
+    def acquire(self, exclude=(), model=None, prefer=None):
+        """
+        Reserve the least-loaded available node
+
+        Args:
+            exclude (iterable): Nodes to skip, e.g. ones that already failed this job
+            model (str): Checkpoint the job uses; nodes that would have to swap to it are penalised
+            prefer (ComfyUINode): Take this node whenever it is available, however loaded
+
+        Returns:
+            ComfyUINode: The chosen node, with its in-flight count incremented
+        """
+        for node in self.nodes:
+            if node not in exclude and node.is_available():
+                self.refresh(node)
+
+        with self._lock:
+            now = time.time()
+            candidates = [n for n in self.nodes if n not in exclude and n.is_available(now)]
+            node = None
+            if prefer in candidates:
+                if prefer.breaker.allow():
+                    node = prefer
+                else:
+                    candidates.remove(prefer)
+            while candidates and node is None:
+                node = min(candidates,
+                           key=lambda n: n.estimated_wait() + (self.swap_penalty if n.needs_swap(model) else 0))
+                # A half-open breaker admits one trial job; whoever loses the race picks again
+                if not node.breaker.allow():
+                    candidates.remove(node)
+                    node = None
+            if node is None:
+                # Every breaker is open: use whichever node recovers first
+                remaining = [n for n in self.nodes if n not in exclude] or self.nodes
+                node = min(remaining, key=lambda n: n.recovers_at())
+            node.inflight += 1
+            if node.needs_swap(model):
+                node.swaps += 1
+                logger.info(f"Switching {node.base_url} from {node.current_model} to {model}")
+            if model is not None:
+                node.current_model = model
+            return node
+
+    def peek_model(self):
+        """Checkpoint loaded on the node the next job would most likely go to, without reserving it."""
+        with self._lock:
+            now = time.time()
+            candidates = [n for n in self.nodes if n.is_available(now)] or self.nodes
+            return min(candidates, key=lambda n: n.estimated_wait()).current_model
+
+    def assume_model(self, node, model):
+        """Record a checkpoint loaded outside of acquire (e.g. by a warm-up), unless a job already chose one."""
+        with self._lock:
+            if node.current_model is None:
+                node.current_model = model
+
+    def swap_count(self):
+        """Checkpoint swaps across all nodes so far."""
+        return sum(node.swaps for node in self.nodes)
+
+    def release(self, node, elapsed=None, failed=False):
+        """
+        Return a node reserved with acquire and record the job's outcome
+
+        Args:
+            node (ComfyUINode): The node returned by acquire
+            elapsed (float): Submit-to-completion time of the job, if it succeeded
+            failed (bool): Whether the job failed on this node
+        """
+        with self._lock:
+            node.inflight = max(0, node.inflight - 1)
+            if failed:
+                node.breaker.failure()
+                return
+            node.breaker.success()
+            node.completed += 1
+            if elapsed is not None:
+                if node.latency is None:
+                    node.latency = elapsed
+                else:
+                    node.latency += self.latency_alpha * (elapsed - node.latency)
+
+    def run(self, job_fn, max_attempts=None, model=None, prefer=None):
+        """
+        Run job_fn(node) on the least-loaded node, moving to another node on failure
+
+        Args:
+            job_fn (callable): Called with a ComfyUINode; returns a truthy value on success
+            max_attempts (int): Submissions before giving up (default: `attempts`, but every node at least once)
+            model (str): Checkpoint the job uses, to keep it on a node that has it loaded
+            prefer (ComfyUINode): Run on this node unless it is unavailable or fails the job, e.g. to reuse
+                what its ComfyUI has cached
+
+        Returns:
+            tuple: (node, result) of the successful attempt, or (None, None)
+        """
+        attempts = max_attempts or max(self.attempts, len(self.nodes))
+        tried = []
+        rounds = 0
+        for _ in range(attempts):
+            if len(tried) == len(self.nodes):
+                # Every node failed this job: back off before starting over
+                delay = backoff_delay(rounds, self.backoff)
+                logger.warning(f"Job failed on every node, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                tried = []
+                rounds += 1
+            node = self.acquire(exclude=tried, model=model, prefer=prefer)
+            start = time.time()
+            try:
+                result = job_fn(node)
+            except Exception as e:
+                logger.error(f"Job failed on {node.base_url}: {e}")
+                result = None
+            if result:
+                self.release(node, elapsed=time.time() - start)
+                return node, result
+            self.release(node, failed=True)
+            tried.append(node)
+        return None, None
+
+    def summary(self):
+        """Per-node counters for the end-of-run log."""
+        return {
+            node.base_url: {
+                "completed": node.completed,
+                "latency": round(node.latency, 2) if node.latency else None,
+                "circuit": node.breaker.state,
+                "trips": node.breaker.trips,
+                "model": node.current_model,
+                "swaps": node.swaps,
+            }
+            for node in self.nodes
+        }